@@ -0,0 +1,288 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+
+CHUNK_ROWS = 500
+
+# Run in order for one account, each repeated until it deletes fewer than
+# :limit rows.  Every statement finds its rows through an index, and each
+# chunk is its own short transaction.  The triggers on these tables keep
+# the review counters, the search indexes and the dirty-professor marks in
+# step.  Replies to the user's posts go with the posts, as
+# community_replies.post_id declares (ON DELETE CASCADE); other people's
+# replies to the user's replies stay, shown at the top of their thread.
+STEPS = (
+    ('ratings', 'DELETE FROM ratings WHERE rowid IN '
+                '(SELECT rowid FROM ratings WHERE user_email = :email LIMIT :limit) RETURNING professor_id'),
+    ('reviews', 'DELETE FROM reviews WHERE rowid IN '
+                '(SELECT rowid FROM reviews WHERE user_email = :email LIMIT :limit) RETURNING professor_id'),
+    ('replies to posts', 'DELETE FROM community_replies WHERE id IN '
+                         '(SELECT r.id FROM community_posts p JOIN community_replies r ON r.post_id = p.id '
+                         'WHERE p.username = :username LIMIT :limit) RETURNING NULL'),
+    ('replies', 'DELETE FROM community_replies WHERE id IN '
+                '(SELECT id FROM community_replies WHERE username = :username LIMIT :limit) RETURNING NULL'),
+    ('posts', 'DELETE FROM community_posts WHERE id IN '
+              '(SELECT id FROM community_posts WHERE username = :username LIMIT :limit) RETURNING NULL'),
+)
+IN_PROGRESS = "SELECT 1 FROM account_deletions WHERE email = ? AND status = 'running'"
+
+
+def in_progress(conn, email):
+    """True while an earlier account with this email is still being removed."""
+    return conn.execute(IN_PROGRESS, (email,)).fetchone() is not None
+
+
+class AccountDeleter:
+    """Deletes accounts without holding the database write lock for long.
+
+    submit() removes the login and records the job in `account_deletions`
+    in one short transaction, so the account is gone at once.  A background
+    thread then deletes the user's ratings, reviews and community content in
+    chunks of `chunk_rows` (see STEPS) and finally the community username,
+    which stays reserved until then so nobody else can take it while posts
+    under it are still being removed.  Registering the same email again is
+    refused until the job is done (in_progress()).
+
+    Jobs live in SQLite, each claimed by one deleter (`owner`) that
+    refreshes its `heartbeat` with every chunk and stops if the job has been
+    claimed by another.  A job whose heartbeat is older than `stale_after`
+    seconds (its worker exited or was killed) is taken over by the next
+    deleter to look, which they do on start and every `stale_after` seconds;
+    chunked deletes are safe to repeat.  The professors whose ratings or
+    reviews a chunk removed are recorded with the job in the same
+    transaction, and when it finishes `on_done(email, professor_ids)` gets
+    all of them, whichever deleter removed them.  Chunk transaction times
+    are reported to `metrics` and kept in stats.
+    """
+
+    def __init__(self, pool, chunk_rows=CHUNK_ROWS, on_done=None, metrics=None, stale_after=60):
+        self.pool = pool
+        self.chunk_rows = chunk_rows
+        self.on_done = on_done
+        self.metrics = metrics
+        self.stale_after = stale_after
+        self._owner = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'taken_over': 0,           # abandoned jobs resumed from another deleter
+            'lost': 0,                 # jobs another deleter took over from this one
+            'chunks': 0,
+            'rows': 0,
+            'lock_seconds': 0.0,       # in chunk transactions, waits for the lock included
+            'max_chunk_seconds': 0.0,
+        }
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._owner = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+            self._queue = queue.Queue()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='account-deleter', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """Stop after the current chunk; an unfinished job resumes on the next start."""
+        self._stopping.set()
+        self._queue.put(None)
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout)
+
+    def submit(self, email):
+        """Remove the login for `email` and queue the rest.  Returns the job id."""
+        def begin(conn):
+            user = conn.execute('SELECT username FROM community_users WHERE email = ?', (email,)).fetchone()
+            now = time.time()
+            cursor = conn.execute(
+                'INSERT INTO account_deletions (email, username, status, requested_at, owner, heartbeat) '
+                "VALUES (?, ?, 'running', ?, ?, ?)",
+                (email, user[0] if user else None, now, self._owner, now)
+            )
+            conn.execute('DELETE FROM users WHERE email = ?', (email,))
+            return cursor.lastrowid
+
+        self.start()
+        with self.pool.connection() as conn:
+            deletion_id = self.pool.run_immediate(conn, begin)
+        with self._lock:
+            self.stats['submitted'] += 1
+        self._queue.put(deletion_id)
+        return deletion_id
+
+    def status(self, conn, deletion_id):
+        row = conn.execute(
+            'SELECT status, deleted_rows, requested_at, finished_at, error FROM account_deletions WHERE id = ?',
+            (deletion_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'status': row[0], 'deleted_rows': row[1], 'requested_at': row[2], 'finished_at': row[3],
+                'error': row[4]}
+
+    def _queue_abandoned(self):
+        try:
+            with self.pool.connection() as conn:
+                abandoned = conn.execute(
+                    "SELECT id FROM account_deletions WHERE status = 'running' "
+                    'AND (owner IS NULL OR heartbeat < ?)', (time.time() - self.stale_after,)
+                ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Looking for abandoned account deletions failed: {e}")
+            return
+        for row in abandoned:
+            self._queue.put(row[0])
+
+    def _run(self):
+        self._queue_abandoned()
+        while not self._stopping.is_set():
+            try:
+                deletion_id = self._queue.get(timeout=self.stale_after)
+            except queue.Empty:
+                self._queue_abandoned()
+                continue
+            if deletion_id is None:
+                break
+            try:
+                self.run(deletion_id)
+            except Exception as e:
+                with self._lock:
+                    self.stats['failed'] += 1
+                print(f"Account deletion {deletion_id} failed: {e}")
+                try:
+                    with self.pool.connection() as conn:
+                        conn.execute("UPDATE account_deletions SET status = 'failed', error = ? "
+                                     'WHERE id = ? AND owner = ?', (str(e), deletion_id, self._owner))
+                        conn.commit()
+                except sqlite3.Error as record_error:
+                    # Still 'running': retried once its heartbeat is stale
+                    print(f"Could not mark account deletion {deletion_id} failed: {record_error}")
+
+    def _claim(self, conn, deletion_id):
+        """Make the job this deleter's, unless another live one has it."""
+        now = time.time()
+
+        def claim(conn):
+            row = conn.execute(
+                "SELECT owner FROM account_deletions WHERE id = ? AND status = 'running' "
+                'AND (owner IS NULL OR owner = ? OR heartbeat < ?)',
+                (deletion_id, self._owner, now - self.stale_after)
+            ).fetchone()
+            if row is None:
+                return False, None
+            conn.execute('UPDATE account_deletions SET owner = ?, heartbeat = ? WHERE id = ?',
+                         (self._owner, now, deletion_id))
+            return True, row[0]
+
+        claimed, previous_owner = self.pool.run_immediate(conn, claim)
+        if claimed and previous_owner not in (None, self._owner):
+            with self._lock:
+                self.stats['taken_over'] += 1
+        return claimed
+
+    def _release(self, conn, deletion_id):
+        # Stopped part way: let the next deleter resume it without waiting
+        try:
+            conn.execute('UPDATE account_deletions SET owner = NULL WHERE id = ? AND owner = ?',
+                         (deletion_id, self._owner))
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Releasing account deletion {deletion_id} failed: {e}")
+
+    def _chunk(self, conn, deletion_id, sql, params, records_professors=False):
+        """One chunk of `sql`, or None if another deleter has taken the job.
+        With `records_professors`, the professor ids it returns are added to
+        the job's account_deletion_professors."""
+        def work(conn):
+            if not conn.execute('UPDATE account_deletions SET heartbeat = ? WHERE id = ? AND owner = ?',
+                                (time.time(), deletion_id, self._owner)).rowcount:
+                return None
+            rows = conn.execute(sql, params).fetchall()
+            conn.execute('UPDATE account_deletions SET deleted_rows = deleted_rows + ? WHERE id = ?',
+                         (len(rows), deletion_id))
+            if records_professors:
+                conn.executemany('INSERT OR IGNORE INTO account_deletion_professors VALUES (?, ?)',
+                                 {(deletion_id, row[0]) for row in rows if row[0] is not None})
+            return rows
+
+        start = time.perf_counter()
+        rows = self.pool.run_immediate(conn, work)
+        elapsed = time.perf_counter() - start
+        if rows is None:
+            with self._lock:
+                self.stats['lost'] += 1
+            return None
+        with self._lock:
+            self.stats['chunks'] += 1
+            self.stats['rows'] += len(rows)
+            self.stats['lock_seconds'] += elapsed
+            self.stats['max_chunk_seconds'] = max(self.stats['max_chunk_seconds'], elapsed)
+        if self.metrics is not None:
+            self.metrics.observe_span('account_deletion_chunk', elapsed)
+        return rows
+
+    def run(self, deletion_id):
+        """Carry out one job to the end (or until stop(), or until another
+        deleter takes it over).  Returns True when done here."""
+        with self.pool.connection() as conn:
+            if not self._claim(conn, deletion_id):
+                return False
+            job = conn.execute(
+                "SELECT email, username FROM account_deletions WHERE id = ? AND status = 'running'", (deletion_id,)
+            ).fetchone()
+            if job is None:
+                return False
+            email, username = job[0], job[1]
+            params = {'email': email, 'username': username, 'limit': self.chunk_rows}
+            for name, sql in STEPS:
+                while True:
+                    if self._stopping.is_set():
+                        self._release(conn, deletion_id)
+                        return False
+                    rows = self._chunk(conn, deletion_id, sql, params,
+                                       records_professors=name in ('ratings', 'reviews'))
+                    if rows is None:
+                        return False
+                    if len(rows) < self.chunk_rows:
+                        break
+
+            def finish(conn):
+                if not conn.execute("UPDATE account_deletions SET status = 'done', finished_at = ? "
+                                    'WHERE id = ? AND owner = ?', (time.time(), deletion_id, self._owner)).rowcount:
+                    return None
+                conn.execute('DELETE FROM community_users WHERE email = ?', (email,))
+                conn.execute('DELETE FROM pending_registrations WHERE email = ?', (email,))
+                professors = {row[0] for row in conn.execute(
+                    'SELECT professor_id FROM account_deletion_professors WHERE deletion_id = ?', (deletion_id,))}
+                conn.execute('DELETE FROM account_deletion_professors WHERE deletion_id = ?', (deletion_id,))
+                return professors
+            professors = self.pool.run_immediate(conn, finish)
+            if professors is None:
+                with self._lock:
+                    self.stats['lost'] += 1
+                return False
+
+        with self._lock:
+            self.stats['completed'] += 1
+        if self.on_done is not None:
+            self.on_done(email, professors)
+        return True
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
@@ -0,0 +1,102 @@
+"""Render synthetic attendance screenshots with known percentages.
+
+    python -m benchmarks.attendance_fixtures --out benchmarks/fixtures/attendance --count 40
+
+Writes one PNG/JPEG per image plus labels.csv (file name, expected
+percentage).  The same seed always produces the same corpus.  The small
+corpus checked in for tests/test_ocr.py came from
+
+    python -m benchmarks.attendance_fixtures --out tests/fixtures/attendance --count 12 --formats jpg
+
+(JPEG only: the noise makes each PNG several megabytes).
+"""
+import argparse
+import csv
+import os
+import random
+
+import cv2
+import numpy as np
+
+
+COURSES = ['Data Structures', 'Discrete Mathematics', 'Operating Systems', 'Computer Networks',
+           'Linear Algebra', 'Probability and Statistics', 'Machine Learning', 'Digital Logic']
+FONTS = [cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX, cv2.FONT_HERSHEY_PLAIN]
+
+# (width, height) of typical screenshots
+SIZES = [(1080, 2340), (1170, 2532), (1440, 900), (1920, 1080), (720, 1280)]
+
+
+def render(rng):
+    width, height = rng.choice(SIZES)
+    img = np.full((height, width, 3), rng.randint(235, 255), np.uint8)
+    font = rng.choice(FONTS)
+    scale = width / 900 * rng.uniform(0.8, 1.2)
+    line_height = int(40 * scale)
+    thickness = max(1, int(round(scale * 1.5)))
+    ink = tuple(rng.randint(0, 60) for _ in range(3))
+
+    y = int(height * rng.uniform(0.08, 0.2))
+    cv2.putText(img, 'Student Attendance Report', (int(width * 0.05), y), font, scale * 1.2, ink, thickness + 1)
+    y += line_height * 2
+
+    total_attended = total_held = 0
+    for course in rng.sample(COURSES, rng.randint(3, 6)):
+        held = rng.randint(20, 60)
+        attended = rng.randint(held // 2, held)
+        total_attended += attended
+        total_held += held
+        cv2.putText(img, f'{course}    {attended} of {held}', (int(width * 0.05), y), font, scale, ink, thickness)
+        y += line_height
+
+    percentage = round(total_attended / total_held * 100, 2)
+    y += line_height
+    cv2.putText(img, f'Overall: {total_attended}/{total_held} = {percentage:.2f}',
+                (int(width * 0.05), y), font, scale, ink, thickness)
+
+    noise = np.random.default_rng(rng.randint(0, 2 ** 31)).normal(0, rng.uniform(0, 6), img.shape)
+    img = np.clip(img + noise, 0, 255).astype(np.uint8)
+    return img, percentage
+
+
+def generate(out_dir, count, seed=0, formats=('png', 'jpg')):
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    labels = []
+    for i in range(count):
+        img, percentage = render(rng)
+        if (rng.random() < 0.5 and 'png' in formats) or 'jpg' not in formats:
+            name = f'attendance_{i:03d}.png'
+            cv2.imwrite(os.path.join(out_dir, name), img)
+        else:
+            name = f'attendance_{i:03d}.jpg'
+            cv2.imwrite(os.path.join(out_dir, name), img, [cv2.IMWRITE_JPEG_QUALITY, rng.randint(60, 95)])
+        labels.append((name, f'{percentage:.2f}'))
+
+    with open(os.path.join(out_dir, 'labels.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file', 'percentage'])
+        writer.writerows(labels)
+    return labels
+
+
+def load(out_dir):
+    with open(os.path.join(out_dir, 'labels.csv'), newline='') as f:
+        for row in csv.DictReader(f):
+            with open(os.path.join(out_dir, row['file']), 'rb') as image:
+                yield row['file'], image.read(), float(row['percentage'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--out', default=os.path.join('benchmarks', 'fixtures', 'attendance'))
+    parser.add_argument('--count', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--formats', default='png,jpg', help='comma-separated: png, jpg')
+    args = parser.parse_args()
+    labels = generate(args.out, args.count, args.seed, tuple(args.formats.split(',')))
+    print(f'Wrote {len(labels)} images to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
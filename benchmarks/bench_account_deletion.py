@@ -0,0 +1,204 @@
+"""Deleting a heavy account in one transaction against account_deletion's chunks.
+
+Seeds a scratch database with professors, background ratings, reviews and
+community threads plus one account with many of each, then deletes that
+account two ways on copies of the same file while a writer thread keeps
+adding ratings for other users:
+
+  - the old delete_account(): every DELETE in one transaction;
+  - AccountDeleter.run(), one short transaction per chunk of `--chunk` rows.
+
+For each it reports the total time, how long the write lock was held (the
+whole transaction, or p50 / max over the chunks) and the latency of the
+concurrent writer's inserts, which is what other users see while an account
+is being removed.
+
+    python -m benchmarks.bench_account_deletion --ratings 1000000 --heavy-ratings 100000
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+import db
+import migrations
+import rating_stats
+from account_deletion import AccountDeleter
+from benchmarks.synthetic import professor_rows
+
+HEAVY = 'heavy@example.edu'
+COLUMNS = rating_stats.TEACHING_ITEMS + rating_stats.CONTENT_ITEMS
+
+
+def rating_row(rng, email, professors):
+    scores = {item: rng.randint(1, 5) for item in rating_stats.ITEMS}
+    return (rng.randrange(professors), email, scores[rating_stats.OVERALL_ITEM],
+            round(rating_stats.weighted_rating(scores), 2), *(scores[item] for item in COLUMNS))
+
+
+RATING_INSERT = (f'INSERT INTO ratings (professor_id, user_email, overall_rating, rating, {", ".join(COLUMNS)}) '
+                 f'VALUES ({", ".join("?" * (4 + len(COLUMNS)))})')
+
+
+def seed(path, args):
+    migrations.migrate(path)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    rng = random.Random(args.seed)
+    conn.executemany(
+        'INSERT INTO professors (id, Name, Designation, Photo, Avg_rating, no_ratings, Profile) '
+        'VALUES (?, ?, ?, ?, 0.0, 0, ?)',
+        [(row[0], row[1], row[2], row[3], row[6]) for row in professor_rows(args.professors, args.seed)]
+    )
+    users = [f'user{i}@example.edu' for i in range(args.users)]
+    conn.executemany('INSERT INTO users (email, password) VALUES (?, ?)',
+                     [(email, 'x') for email in users + [HEAVY]])
+    conn.executemany('INSERT INTO community_users (email, username) VALUES (?, ?)',
+                     [(email, email.split('@')[0]) for email in users + [HEAVY]])
+
+    conn.executemany(RATING_INSERT, (rating_row(rng, rng.choice(users), args.professors) for _ in range(args.ratings)))
+    conn.executemany(RATING_INSERT, (rating_row(rng, HEAVY, args.professors) for _ in range(args.heavy_ratings)))
+
+    def reviews(count, email=None):
+        for _ in range(count):
+            yield (email or rng.choice(users), rng.randrange(args.professors),
+                   'clear lectures and fair grading ' * rng.randint(1, 4))
+    sql = 'INSERT INTO reviews (user_email, professor_id, review_text) VALUES (?, ?, ?)'
+    conn.executemany(sql, reviews(args.ratings // 10))
+    conn.executemany(sql, reviews(args.heavy_ratings // 5, HEAVY))
+
+    def posts(count, username=None):
+        for _ in range(count):
+            yield (username or f'user{rng.randrange(args.users)}', 'anyone have the notes for unit 3?')
+    conn.executemany('INSERT INTO community_posts (username, message) VALUES (?, ?)',
+                     posts(args.ratings // 100))
+    conn.executemany('INSERT INTO community_posts (username, message) VALUES (?, ?)',
+                     posts(args.heavy_ratings // 20, 'heavy'))
+    post_ids = [row[0] for row in conn.execute('SELECT id FROM community_posts')]
+    conn.executemany(
+        'INSERT INTO community_replies (post_id, username, message) VALUES (?, ?, ?)',
+        ((rng.choice(post_ids), 'heavy' if rng.random() < 0.1 else f'user{rng.randrange(args.users)}',
+          'check the shared drive') for _ in range(args.ratings // 20))
+    )
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+
+
+def old_delete(path):
+    """delete_account() before account_deletion: one transaction."""
+    conn = sqlite3.connect(path, timeout=60)
+    start = time.perf_counter()
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM ratings WHERE user_email = ?', (HEAVY,))
+    cursor.execute('DELETE FROM reviews WHERE user_email = ?', (HEAVY,))
+    cursor.execute('DELETE FROM community_users WHERE email = ?', (HEAVY,))
+    cursor.execute('DELETE FROM users WHERE email = ?', (HEAVY,))
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed, [elapsed]
+
+
+def chunked_delete(path, chunk_rows):
+    pool = db.ConnectionPool(path, size=2, timeout=60)
+    deleter = AccountDeleter(pool, chunk_rows=chunk_rows)
+    chunks = []
+    run_chunk = deleter._chunk
+
+    def timed_chunk(*args):
+        start = time.perf_counter()
+        rows = run_chunk(*args)
+        chunks.append(time.perf_counter() - start)
+        return rows
+    deleter._chunk = timed_chunk
+
+    start = time.perf_counter()
+    with pool.connection() as conn:
+        def begin(conn):
+            cursor = conn.execute(
+                "INSERT INTO account_deletions (email, username, status, requested_at) VALUES (?, 'heavy', 'running', ?)",
+                (HEAVY, time.time()))
+            conn.execute('DELETE FROM users WHERE email = ?', (HEAVY,))
+            return cursor.lastrowid
+        deletion_id = pool.run_immediate(conn, begin)
+    deleter.run(deletion_id)
+    elapsed = time.perf_counter() - start
+    pool.close()
+    return elapsed, chunks
+
+
+def with_writer(path, delete, args):
+    """Run `delete` while another thread adds ratings; returns its insert latencies too."""
+    latencies = []
+    done = threading.Event()
+
+    def writer():
+        conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        rng = random.Random(args.seed + 1)
+        while not done.is_set():
+            row = rating_row(rng, f'user{rng.randrange(args.users)}@example.edu', args.professors)
+            start = time.perf_counter()
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(RATING_INSERT, row)
+            conn.execute('COMMIT')
+            latencies.append(time.perf_counter() - start)
+            time.sleep(args.writer_pause / 1000)
+        conn.close()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    time.sleep(0.2)
+    try:
+        elapsed, locks = delete()
+    finally:
+        done.set()
+        thread.join()
+    return elapsed, locks, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ratings', type=int, default=1000000)
+    parser.add_argument('--professors', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--heavy-ratings', type=int, default=100000,
+                        help="the deleted account's ratings; it has a fifth as many reviews, a twentieth as many posts")
+    parser.add_argument('--chunk', default='500,2000')
+    parser.add_argument('--writer-pause', type=float, default=5.0, help='ms between concurrent inserts')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seeded = os.path.join(tmp, 'seeded.db')
+        start = time.perf_counter()
+        seed(seeded, args)
+        print(f'{args.ratings} background ratings; deleting an account with {args.heavy_ratings} ratings, '
+              f'{args.heavy_ratings // 5} reviews and {args.heavy_ratings // 20} posts '
+              f'(seeded in {time.perf_counter() - start:.0f}s)')
+        print(f'{"":<22} {"total":>8} {"lock p50":>10} {"lock max":>10} {"txns":>6}   concurrent insert p50 / p99 / max')
+
+        runs = [('one transaction', lambda path: old_delete(path))]
+        runs += [(f'chunks of {size}', lambda path, size=int(size): chunked_delete(path, size))
+                 for size in args.chunk.split(',')]
+        for label, delete in runs:
+            path = os.path.join(tmp, 'database.db')
+            shutil.copyfile(seeded, path)
+            elapsed, locks, latencies = with_writer(path, lambda: delete(path), args)
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f'  {label:<20} {elapsed:7.2f}s {statistics.median(locks) * 1000:8.1f}ms '
+                  f'{max(locks) * 1000:8.1f}ms {len(locks):6}   '
+                  f'{statistics.median(latencies) * 1000:.1f} / {p99 * 1000:.1f} / {latencies[-1] * 1000:.1f}ms')
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+"""Drive the main routes of the app against a seeded scratch database.
+
+Seeds a fresh database with the real schema (see migrations.py) and
+configurable volumes, then runs each scenario with concurrent clients,
+through the Flask test client or, with --server, over HTTP against a
+threaded WSGI server.  Outgoing mail goes to an in-process stub SMTP and
+Tesseract is replaced by a stub script, so nothing leaves the machine.
+
+Throughput and latency percentiles per scenario are printed as JSON (or
+written with --out), and --baseline compares against an earlier run:
+
+    python -m benchmarks.bench_app --out before.json
+    python -m benchmarks.bench_app --baseline before.json --tolerance 0.25
+    python -m benchmarks.bench_app --server --threads 16 --scenarios index,community
+"""
+import argparse
+import http.cookiejar
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+
+import migrations
+import rating_stats
+from benchmarks.synthetic import LAST_NAMES, professor_rows
+from credentials import PasswordHasher
+
+
+PASSWORD = 'benchpass'
+
+TESSERACT_STUB = '''#!/bin/sh
+case "$1" in --version) echo "tesseract 5.3.0"; exit 0;; esac
+echo "Overall: 30/40 = 75.00" > "$2.txt"
+'''
+
+
+def email(index):
+    return f'bench{index}@mahindrauniversity.edu.in'
+
+
+def seed(path, args):
+    migrations.migrate(path)
+    rng = random.Random(args.seed)
+    start = datetime(2024, 1, 1)
+
+    def ts(i):
+        return (start + timedelta(seconds=37 * i)).strftime('%Y-%m-%d %H:%M:%S')
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('BEGIN')
+    conn.executemany(
+        'INSERT INTO professors (id, Name, Designation, Photo, Avg_rating, no_ratings, Profile) '
+        'VALUES (?, ?, ?, ?, 0.0, 0, ?)',
+        [(row[0], row[1], row[2], row[3], row[6]) for row in professor_rows(args.professors, args.seed)]
+    )
+    # One cheap hash shared by every account; a login upgrades it to the
+    # app's configured cost, as it would a legacy row.
+    stored = PasswordHasher(scheme='pbkdf2_sha256', pbkdf2_iterations=1000).hash(PASSWORD)
+    conn.executemany(
+        'INSERT INTO users (email, password, year, semester, academic_year, school, branch) '
+        "VALUES (?, ?, '2', '1', '2024', 'ECSE', 'cs')",
+        [(email(i), stored) for i in range(args.users)]
+    )
+    conn.executemany('INSERT INTO community_users (email, username) VALUES (?, ?)',
+                     [(email(i), f'bench{i}') for i in range(args.users)])
+
+    def rating_rows():
+        for i in range(args.ratings):
+            scores = {item: rng.randint(1, 5) for item in rating_stats.ITEMS}
+            teaching = [scores[item] for item in rating_stats.TEACHING_ITEMS]
+            content = [scores[item] for item in rating_stats.CONTENT_ITEMS]
+            yield (rng.randrange(args.professors), email(rng.randrange(args.users)),
+                   sum(teaching) / len(teaching), sum(content) / len(content), scores[rating_stats.OVERALL_ITEM],
+                   round(rating_stats.weighted_rating(scores), 2), '', ts(i),
+                   *(scores[item] for item in rating_stats.TEACHING_ITEMS + rating_stats.CONTENT_ITEMS))
+    conn.executemany(f'''
+        INSERT INTO ratings (professor_id, user_email, teaching_rating, content_rating, overall_rating, rating,
+                             comment, timestamp, {', '.join(rating_stats.TEACHING_ITEMS + rating_stats.CONTENT_ITEMS)})
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rating_rows())
+
+    conn.executemany(
+        'INSERT INTO reviews (user_email, professor_id, professor_name, review_text, timestamp) '
+        'SELECT ?, id, Name, ?, ? FROM professors WHERE id = ?',
+        ((email(rng.randrange(args.users)), f'benchmark review {i}', ts(i), rng.randrange(args.professors))
+         for i in range(args.reviews))
+    )
+    conn.executemany(
+        'INSERT INTO community_posts (id, username, message, timestamp) VALUES (?, ?, ?, ?)',
+        ((i, f'bench{rng.randrange(args.users)}', f'benchmark post {i}', ts(i)) for i in range(1, args.posts + 1))
+    )
+    if args.posts:
+        conn.executemany(
+            'INSERT INTO community_replies (post_id, parent_reply_id, username, message, timestamp) '
+            'VALUES (?, NULL, ?, ?, ?)',
+            ((rng.randint(1, args.posts), f'bench{rng.randrange(args.users)}', f'benchmark reply {i}', ts(i))
+             for i in range(args.replies))
+        )
+    conn.execute('COMMIT')
+    rating_stats.rebuild(conn)
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+class StubSMTP:
+    """Stands in for smtplib.SMTP in the mailer threads."""
+    sent = 0
+
+    def __init__(self, host, port, timeout=None):
+        pass
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        pass
+
+    def send_message(self, msg):
+        StubSMTP.sent += 1
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class TestClientDriver:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        status = response.status_code
+        response.close()
+        # Pages that would show them are not always visited next, so keep
+        # pending flashes from piling up in the session cookie.
+        with self.client.session_transaction() as session:
+            session.pop('_flashes', None)
+        return status
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPDriver:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(urllib.request.Request(self.base_url + path, data=body, method=method)) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+def scenarios(args, names):
+    """name -> function(rng, user index) returning (method, path, form data)."""
+    def rating_form(rng):
+        return {item: rng.randint(1, 5) for item in rating_stats.ITEMS}
+
+    registered = itertools.count()
+    return {
+        'index': lambda rng, user: ('GET', '/', None),
+        'index_query': lambda rng, user: ('GET', f'/index?query={rng.choice(LAST_NAMES)[:rng.randint(3, 6)]}', None),
+        'professor_by_name': lambda rng, user: (
+            'GET', '/professor/' + urllib.parse.quote(names[rng.randrange(len(names))]), None),
+        'submit_rating': lambda rng, user: (
+            'POST', f'/submit_rating/{rng.randrange(args.professors)}', rating_form(rng)),
+        'submit_review': lambda rng, user: (
+            'POST', f'/submit_review/{rng.randrange(args.professors)}', {'review_text': 'benchmark review'}),
+        'community': lambda rng, user: ('GET', '/community', None),
+        'reply': lambda rng, user: (
+            'POST', '/reply', {'post_id': rng.randint(1, max(1, args.posts)), 'message': 'benchmark reply'}),
+        'profile': lambda rng, user: ('GET', '/profile', None),
+        'register': lambda rng, user: ('POST', '/register', {
+            'email': f'se{next(registered)}newbench@mahindrauniversity.edu.in', 'password': PASSWORD,
+            'year': '1', 'semester': '1', 'academic_year': '2024', 'school': 'ECSE', 'branch': 'cs'}),
+    }
+
+
+DEFAULT_SCENARIOS = ['index', 'index_query', 'professor_by_name', 'submit_rating', 'submit_review',
+                     'community', 'reply', 'profile']
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run_scenario(drivers, make_request, requests_per_thread, warmup):
+    results = [[] for _ in drivers]
+    statuses = {}
+    barrier = threading.Barrier(len(drivers) + 1)
+
+    def worker(index, driver):
+        rng = random.Random(index)
+        for _ in range(warmup):
+            driver.request(*make_request(rng, index))
+        barrier.wait()
+        for _ in range(requests_per_thread):
+            method, path, data = make_request(rng, index)
+            start = time.perf_counter()
+            status = driver.request(method, path, data)
+            results[index].append((time.perf_counter() - start, status))
+
+    threads = [threading.Thread(target=worker, args=(i, driver)) for i, driver in enumerate(drivers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency * 1000 for per_thread in results for latency, _ in per_thread)
+    for per_thread in results:
+        for _, status in per_thread:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(latencies),
+        'errors': sum(count for status, count in statuses.items() if int(status) >= 500),
+        'seconds': round(elapsed, 3),
+        'throughput': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(percentile(latencies, 0.5), 3),
+        'p90_ms': round(percentile(latencies, 0.9), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'max_ms': round(latencies[-1], 3),
+        'statuses': statuses,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Scenarios whose p50 or throughput got worse than `tolerance` allows."""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        if current['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {before['p50_ms']}ms -> {current['p50_ms']}ms")
+        if current['throughput'] < before['throughput'] / (1 + tolerance):
+            regressions.append(f"{name}: throughput {before['throughput']}/s -> {current['throughput']}/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--professors', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--ratings', type=int, default=20000)
+    parser.add_argument('--reviews', type=int, default=5000)
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--replies', type=int, default=10000)
+    parser.add_argument('--scenarios', default=','.join(DEFAULT_SCENARIOS),
+                        help='comma separated; also available: register')
+    parser.add_argument('--requests', type=int, default=400, help='requests per scenario')
+    parser.add_argument('--threads', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed requests per client before each scenario')
+    parser.add_argument('--server', action='store_true', help='serve over HTTP with a threaded WSGI server')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='write the JSON results here instead of stdout')
+    parser.add_argument('--baseline', help='JSON from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown before a regression')
+    args = parser.parse_args()
+    args.users = max(args.users, args.threads)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'database.db')
+        start = time.perf_counter()
+        seed(path, args)
+        seed_seconds = time.perf_counter() - start
+
+        tesseract = os.path.join(tmp, 'tesseract')
+        with open(tesseract, 'w') as f:
+            f.write(TESSERACT_STUB)
+        os.chmod(tesseract, 0o755)
+        os.environ['TESSERACT_CMD'] = tesseract
+        # main opens database.db relative to the working directory on import.
+        os.chdir(tmp)
+        import main as app_module
+        app_module.mailer.smtp_factory = StubSMTP
+        app = app_module.app
+
+        server = None
+        if args.server:
+            from werkzeug.serving import make_server
+            server = make_server('127.0.0.1', 0, app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f'http://127.0.0.1:{server.server_port}'
+            drivers = [HTTPDriver(base_url) for _ in range(args.threads)]
+        else:
+            drivers = [TestClientDriver(app) for _ in range(args.threads)]
+        for i, driver in enumerate(drivers):
+            driver.request('POST', '/login', {'username': email(i), 'password': PASSWORD})
+
+        conn = sqlite3.connect(path)
+        names = [row[0] for row in conn.execute('SELECT Name FROM professors ORDER BY id LIMIT 500')]
+        conn.close()
+        available = scenarios(args, names)
+
+        results = {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'config': {key: value for key, value in vars(args).items() if key not in ('out', 'baseline')},
+            'environment': {
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'cpus': os.cpu_count(),
+                'response_cache': app_module.RESPONSE_CACHE,
+                'driver': 'http' if args.server else 'test_client',
+            },
+            'seed_seconds': round(seed_seconds, 2),
+            'scenarios': {},
+        }
+        per_thread = max(1, args.requests // args.threads)
+        for name in args.scenarios.split(','):
+            results['scenarios'][name] = run_scenario(drivers, available[name], per_thread, args.warmup)
+            print(f"{name:<18} {results['scenarios'][name]['throughput']:8.1f}/s  "
+                  f"p50={results['scenarios'][name]['p50_ms']:.2f}ms  "
+                  f"p99={results['scenarios'][name]['p99_ms']:.2f}ms", file=sys.stderr)
+        app_module.mailer.stop()
+        results['mail_sent'] = StubSMTP.sent
+
+        if server is not None:
+            server.shutdown()
+        os.chdir('/')
+
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for key, value in baseline.get('environment', {}).items():
+            if results['environment'].get(key) != value:
+                print(f"note: baseline ran with {key}={value}, this run {results['environment'].get(key)}",
+                      file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
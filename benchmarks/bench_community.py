@@ -0,0 +1,125 @@
+"""Compare the old load-everything community() with the paged feed.
+
+    python -m benchmarks.bench_community --posts 100000 --replies 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import community_feed
+import migrations
+from pagination import decode_cursor
+
+
+def seed(path, posts, replies, rng):
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO community_users (email, username) VALUES ('bench@example.edu', 'bench')")
+    start = datetime(2024, 1, 1)
+    conn.executemany(
+        'INSERT INTO community_posts (id, username, message, timestamp) VALUES (?, ?, ?, ?)',
+        ((i, 'bench', f'post {i}', (start + timedelta(seconds=60 * i)).strftime('%Y-%m-%d %H:%M:%S'))
+         for i in range(1, posts + 1))
+    )
+
+    def reply_rows():
+        for i in range(1, replies + 1):
+            # Skewed so a few posts have long threads, most have none or a handful.
+            post_id = min(posts, int(rng.paretovariate(1.2)) * rng.randint(1, posts // 10 or 1))
+            parent = rng.randint(max(1, i - 50), i - 1) if i > 1 and rng.random() < 0.3 else None
+            ts = (start + timedelta(seconds=60 * post_id + i)).strftime('%Y-%m-%d %H:%M:%S')
+            yield i, post_id, parent, 'bench', f'reply {i}', ts
+    conn.executemany(
+        'INSERT INTO community_replies (id, post_id, parent_reply_id, username, message, timestamp) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        reply_rows()
+    )
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+def legacy_page(conn):
+    # The body of community() before pagination, kept verbatim.
+    cursor = conn.cursor()
+    posts = cursor.execute('SELECT * FROM community_posts ORDER BY timestamp DESC').fetchall()
+    all_replies = cursor.execute('SELECT * FROM community_replies ORDER BY timestamp ASC').fetchall()
+
+    post_reply_map = {}
+    for reply in all_replies:
+        post_id = reply['post_id']
+        post_reply_map.setdefault(post_id, []).append(reply)
+
+    enriched_posts = []
+    for post in posts:
+        enriched_posts.append({
+            **dict(post),
+            'replies': post_reply_map.get(post['id'], [])
+        })
+    return enriched_posts
+
+
+def paged(conn, before):
+    posts, next_cursor = community_feed.fetch_posts(conn, before)
+    community_feed.attach_replies(conn, posts)
+    return next_cursor
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def summary(times):
+    times = sorted(times)
+    p99 = times[min(len(times) - 1, int(len(times) * 0.99))]
+    return f'p50={statistics.median(times):9.3f}ms  p99={p99:9.3f}ms'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--replies', type=int, default=1000000)
+    parser.add_argument('--pages', type=int, default=50, help='pages walked with the cursor')
+    parser.add_argument('--legacy-runs', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'community.db')
+        migrations.migrate(path)
+        t, _ = timed(seed, path, args.posts, args.replies, random.Random(args.seed))
+        print(f'seeded {args.posts} posts / {args.replies} replies in {t / 1000:.1f}s')
+
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+
+        first_page = [timed(paged, conn, None)[0] for _ in range(20)]
+        walk = []
+        cursor = None
+        for _ in range(args.pages):
+            ms, cursor = timed(paged, conn, decode_cursor(cursor))
+            walk.append(ms)
+            if cursor is None:
+                break
+        thread_id = conn.execute(
+            'SELECT post_id FROM community_replies GROUP BY post_id ORDER BY COUNT(*) DESC LIMIT 1'
+        ).fetchone()[0]
+        thread_ms, (_, thread_len) = timed(community_feed.fetch_thread, conn, thread_id)
+
+        print(f'  page 1      {summary(first_page)}')
+        print(f'  pages 1-{len(walk):<3} {summary(walk)}')
+        print(f'  thread      {thread_ms:9.3f}ms  (largest thread, {thread_len} replies)')
+        if args.legacy_runs:
+            legacy = [timed(legacy_page, conn)[0] for _ in range(args.legacy_runs)]
+            print(f'  legacy      {summary(legacy)}  ({args.legacy_runs} runs)')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""FTS5 search against LIKE scans over a large synthetic review corpus.
+
+Builds a scratch database at the current schema (so the FTS5 triggers are
+live while the reviews are inserted) and reports:
+
+  - insert throughput into reviews with the index triggers, against the
+    same rows into a copy of the table without them;
+  - the time of a full `text_search.py --rebuild` and the index size;
+  - per query, the median time of one ranked, highlighted page through
+    text_search.search(), of the same page with BM25 over every match
+    instead of the newest RANK_WINDOW, and of `review_text LIKE '%term%'`
+    (newest 20 matches), plus a count of all matches each way, for words
+    from very common to rare, two-word, phrase and prefix queries.
+
+LIKE has no ranking and matches substrings, so its counts differ from
+FTS5's word (and stem) matches; the point is what each costs.
+
+    python -m benchmarks.bench_fulltext --reviews 1000000
+"""
+import argparse
+import os
+import random
+import re
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import migrations
+import text_search
+
+
+# Words real reviews use, most frequent first; padded with made-up words so
+# the vocabulary has a long tail like natural text.
+COMMON_WORDS = (
+    'the and is to a of very in he she for his her class teaching good but it are not explains well '
+    'lectures assignments exams helpful notes grading fair strict concepts students course clear '
+    'interactive boring slides attendance quizzes doubts approachable knowledgeable deadlines labs '
+    'project marks tough easy recommend semester tutorials examples practical theory patient'
+).split()
+SYLLABLES = ['ka', 'ri', 'mo', 'na', 'te', 'lu', 'vi', 'so', 'pa', 'de', 'gi', 'ro', 'shu', 'ven', 'tal']
+
+QUERIES = [
+    ('very common', 'the'),
+    ('common', 'grading'),
+    ('rare', None),             # filled in with a tail word
+    ('two words', 'strict grading'),
+    ('phrase', '"explains well"'),
+    ('prefix', 'assign*'),
+]
+
+
+def vocabulary(rng, size):
+    words = list(COMMON_WORDS)
+    seen = set(words)
+    while len(words) < size:
+        word = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    # Zipf: the word ranked k is used in proportion to 1/k
+    cum_weights = []
+    total = 0.0
+    for rank in range(1, len(words) + 1):
+        total += 1 / rank
+        cum_weights.append(total)
+    return words, cum_weights
+
+
+def review_rows(count, rng, words, cum_weights, words_per_review):
+    start = datetime(2024, 1, 1)
+    for i in range(1, count + 1):
+        text = ' '.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(5, 2 * words_per_review)))
+        yield (i, f'user{i % 5000}@example.edu', i % 2000, text,
+               (start + timedelta(seconds=30 * i)).strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def insert(conn, table, rows, batch=50000):
+    sql = f'INSERT INTO {table} (id, user_email, professor_id, review_text, timestamp) VALUES (?, ?, ?, ?, ?)'
+    chunk = []
+    count = 0
+    start = time.perf_counter()
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == batch:
+            with conn:
+                conn.executemany(sql, chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        with conn:
+            conn.executemany(sql, chunk)
+        count += len(chunk)
+    return count / (time.perf_counter() - start)
+
+
+def median_ms(fn, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reviews', type=int, default=1000000)
+    parser.add_argument('--words', type=int, default=20, help='mean words per review')
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words, cum_weights = vocabulary(rng, args.vocabulary)
+    queries = [(label, text or words[len(words) // 2]) for label, text in QUERIES]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'database.db')
+        migrations.migrate(path)
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Same table without the triggers, to see what keeping the index costs
+        conn.execute('CREATE TABLE reviews_plain AS SELECT * FROM reviews WHERE 0')
+
+        print(f'{args.reviews} reviews, ~{args.words} words each, {args.vocabulary} word vocabulary')
+        plain = insert(conn, 'reviews_plain', review_rows(args.reviews, random.Random(args.seed), words,
+                                                          cum_weights, args.words))
+        indexed = insert(conn, 'reviews', review_rows(args.reviews, random.Random(args.seed), words,
+                                                      cum_weights, args.words))
+        print(f'  insert without index  {plain:9.0f} rows/s')
+        print(f'  insert with triggers  {indexed:9.0f} rows/s')
+        conn.execute('DROP TABLE reviews_plain')
+
+        conn.isolation_level = None
+        start = time.perf_counter()
+        text_search.rebuild(conn)
+        text_search.optimize(conn)
+        print(f'  rebuild + optimize    {time.perf_counter() - start:9.1f}s')
+        try:
+            index_bytes, table_bytes = conn.execute(
+                "SELECT SUM(pgsize) FILTER (WHERE name LIKE 'reviews_fts%'), "
+                "SUM(pgsize) FILTER (WHERE name = 'reviews') FROM dbstat").fetchone()
+            print(f'  index size            {index_bytes / 2 ** 20:9.1f}MiB '
+                  f'(reviews table {table_bytes / 2 ** 20:.1f}MiB)')
+        except sqlite3.OperationalError:
+            pass  # SQLite built without dbstat
+
+        print(f'\nmedian of {args.runs} runs, ms   {"FTS5 page":>10} {"rank all":>10} {"LIKE page":>10} '
+              f'{"FTS5 count":>11} {"LIKE count":>11}  matches (FTS5 / LIKE)')
+        for label, text in queries:
+            fts_page, _ = median_ms(lambda: text_search.search(conn, 'reviews', text), args.runs)
+            match = text_search.match_query(text)
+            rank_all, _ = median_ms(lambda: conn.execute(
+                "SELECT rowid, snippet(reviews_fts, 0, '[', ']', '…', 16) FROM reviews_fts "
+                'WHERE reviews_fts MATCH ? ORDER BY rank LIMIT 21', (match,)).fetchall(), args.runs)
+            fts_count_ms, fts_count = median_ms(lambda: conn.execute(
+                'SELECT COUNT(*) FROM reviews_fts WHERE reviews_fts MATCH ?', (match,)).fetchone()[0], args.runs)
+
+            # What a LIKE search would be: every word as a substring, newest first
+            terms = re.findall(r'"([^"]*)"', match)
+            where = ' AND '.join(['review_text LIKE ?'] * len(terms))
+            params = [f'%{term}%' for term in terms]
+            like_page, _ = median_ms(lambda: conn.execute(
+                f'SELECT id, review_text FROM reviews WHERE {where} ORDER BY id DESC LIMIT 20', params).fetchall(),
+                args.runs)
+            like_count_ms, like_count = median_ms(lambda: conn.execute(
+                f'SELECT COUNT(*) FROM reviews WHERE {where}', params).fetchone()[0], args.runs)
+            print(f'  {label:<12} {text!r:<18} {fts_page:10.1f} {rank_all:10.1f} {like_page:10.1f} '
+                  f'{fts_count_ms:11.1f} {like_count_ms:11.1f}  {fts_count} / {like_count}')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Time import_professors against the old row-by-row change.py loop.
+
+    python -m benchmarks.bench_import --rows 1000000
+"""
+import argparse
+import csv
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import pandas as pd
+
+import import_professors
+import migrations
+from benchmarks.synthetic import professor_rows
+
+
+def write_csv(path, rows, seed):
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Name', 'Designation', 'Photo', 'Profile', 'Avg_rating', 'no_ratings', 'id'])
+        for prof_id, name, designation, photo, avg, count, profile in professor_rows(rows, seed):
+            if rng.random() < 0.05:
+                # The Excel export artifact modified.csv carries.
+                designation += '_x000D_\nCentre for Executive Education'
+            writer.writerow([name, designation, photo, profile, avg, count, prof_id])
+
+
+def legacy_import(csv_path, db_path):
+    # The body of change.py before this script, kept verbatim.
+    df = pd.read_csv(csv_path)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    for _, row in df.iterrows():
+        cursor.execute('''
+            INSERT OR REPLACE INTO professors (id, Name, Designation, Photo, Profile, Avg_rating, no_ratings)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            int(row['id']),
+            row['Name'],
+            row['Designation'],
+            row['Photo'],
+            row['Profile'],
+            float(row['Avg_rating']),
+            int(row['no_ratings'])
+        ))
+    conn.commit()
+    conn.close()
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--skip-legacy', action='store_true')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'professors.csv')
+        write_csv(csv_path, args.rows, args.seed)
+        print(f'{args.rows} rows, {os.path.getsize(csv_path) / 1e6:.0f} MB of CSV')
+
+        db_path = os.path.join(tmp, 'new.db')
+        migrations.migrate(db_path)
+        first = timed(import_professors.run, db_path, csv_path, args.chunk_size)
+        again = timed(import_professors.run, db_path, csv_path, args.chunk_size)
+        dry = timed(import_professors.run, db_path, csv_path, args.chunk_size, dry_run=True)
+        print(f'  import   fresh {first:7.1f}s ({args.rows / first:,.0f} rows/s)   '
+              f're-import {again:7.1f}s   dry-run {dry:7.1f}s')
+
+        if not args.skip_legacy:
+            legacy_db = os.path.join(tmp, 'legacy.db')
+            migrations.migrate(legacy_db)
+            legacy = timed(legacy_import, csv_path, legacy_db)
+            print(f'  change.py fresh {legacy:7.1f}s ({args.rows / legacy:,.0f} rows/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Login latency under concurrency at several password-hash cost settings.
+
+For each setting a scratch database is seeded with users whose passwords
+were hashed at that cost, and threads post /login through the Flask test
+client.  Reports throughput, p50/p99 latency and how often the hasher
+refused work as busy, so the cost can be chosen against the login load the
+site actually sees.
+
+    python -m benchmarks.bench_login --logins 200 --threads 8 --workers 2
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import migrations
+from credentials import PasswordHasher
+
+
+SETTINGS = [
+    ('scrypt n=2^12', dict(scheme='scrypt', scrypt_n=2 ** 12)),
+    ('scrypt n=2^14', dict(scheme='scrypt', scrypt_n=2 ** 14)),
+    ('scrypt n=2^15', dict(scheme='scrypt', scrypt_n=2 ** 15)),
+    ('pbkdf2 100k', dict(scheme='pbkdf2_sha256', pbkdf2_iterations=100_000)),
+    ('pbkdf2 600k', dict(scheme='pbkdf2_sha256', pbkdf2_iterations=600_000)),
+]
+
+
+def email(index):
+    return f'loadtest{index}@mahindrauniversity.edu.in'
+
+
+def seed(path, hasher, users):
+    conn = sqlite3.connect(path)
+    conn.execute('DELETE FROM users')
+    conn.executemany(
+        'INSERT INTO users (email, password, year, semester, academic_year, school, branch) '
+        "VALUES (?, ?, '1', '1', '1', 'ECSE', 'cs')",
+        [(email(i), hasher.hash(f'password{i}')) for i in range(users)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def worker(app, index, count, users, results, barrier):
+    client = app.test_client()
+    barrier.wait()
+    for n in range(count):
+        user = (index + n * 7) % users
+        start = time.perf_counter()
+        response = client.post('/login', data={'username': email(user), 'password': f'password{user}'})
+        results.append((time.perf_counter() - start, response.headers.get('Location', '')))
+        with client.session_transaction() as session:
+            session.clear()
+
+
+def run(app_module, path, label, settings, args):
+    hasher = PasswordHasher(workers=args.workers, max_pending=args.max_pending, **settings)
+    seed(path, hasher, args.users)
+    app_module.passwords = hasher
+
+    per_thread = args.logins // args.threads
+    results = []
+    barrier = threading.Barrier(args.threads + 1)
+    threads = [threading.Thread(target=worker, args=(app_module.app, i, per_thread, args.users, results, barrier))
+               for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    failed = sum(1 for _, location in results if not location.endswith('/index'))
+    stats = hasher.snapshot()
+    print(f'{label:<15} {len(results) / elapsed:8.1f}/s  '
+          f'p50={latencies[len(latencies) // 2] * 1000:7.1f}ms  '
+          f'p99={latencies[int(len(latencies) * 0.99)] * 1000:7.1f}ms  '
+          f'busy={stats["busy"]}  failed={failed}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=200, help='logins per setting')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=2, help='hasher thread pool size')
+    parser.add_argument('--max-pending', type=int, default=32)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'database.db')
+        migrations.migrate(path)
+        # main opens database.db relative to the working directory on import.
+        os.chdir(tmp)
+        os.environ.setdefault('RESPONSE_CACHE', 'memory')
+        import main as app_module
+
+        print(f'{args.logins} logins per setting from {args.threads} threads, {args.workers} hasher workers '
+              f'({os.cpu_count()} CPUs)')
+        for label, settings in SETTINGS:
+            run(app_module, path, label, settings, args)
+        os.chdir('/')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Push OTP-sized mails through MailDispatcher into a local aiosmtpd server.
+
+    python -m benchmarks.bench_mailer --messages 500 --workers 2
+"""
+import argparse
+import time
+from email.mime.text import MIMEText
+
+from aiosmtpd.controller import Controller
+
+from mailer import MailDispatcher
+
+
+class CountingHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return '250 OK'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--port', type=int, default=8025)
+    args = parser.parse_args()
+
+    handler = CountingHandler()
+    controller = Controller(handler, hostname='127.0.0.1', port=args.port)
+    controller.start()
+    dispatcher = MailDispatcher('127.0.0.1', args.port, use_tls=False, workers=args.workers,
+                                batch_size=args.batch_size, queue_size=args.messages)
+    try:
+        start = time.perf_counter()
+        submit_times = []
+        for i in range(args.messages):
+            msg = MIMEText(f'Your OTP is: {100000 + i}.')
+            msg['From'] = 'noreply@example.edu'
+            msg['To'] = f'student{i}@example.edu'
+            msg['Subject'] = 'Your OTP for Registration'
+            t = time.perf_counter()
+            dispatcher.submit(msg)
+            submit_times.append(time.perf_counter() - t)
+        dispatcher.stop(timeout=120)
+        elapsed = time.perf_counter() - start
+    finally:
+        controller.stop()
+
+    submit_times.sort()
+    print(f'submitted {args.messages} in {sum(submit_times) * 1000:.1f}ms '
+          f'(p99 submit {submit_times[int(len(submit_times) * 0.99)] * 1e6:.0f}us)')
+    print(f'delivered {handler.received} in {elapsed:.2f}s ({handler.received / elapsed:.0f} msg/s)')
+    print(dispatcher.snapshot())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Latency and accuracy of the staged OCR pipeline against the old one.
+
+    python -m benchmarks.bench_ocr
+    python -m benchmarks.bench_ocr --fixtures /tmp/attendance   # generates 40 images
+
+The OCR comparison needs a real Tesseract install (set TESSERACT_CMD if it
+is not on the default path); without one only the preprocessing before the
+first Tesseract call is measured.
+"""
+import argparse
+import os
+import re
+import statistics
+import time
+
+import cv2
+import numpy as np
+import pytesseract
+
+import ocr
+from benchmarks import attendance_fixtures
+
+
+def legacy_extract(image_bytes):
+    # extract_attendance_percentage() before the staged pipeline, verbatim.
+    npimg = np.frombuffer(image_bytes, np.uint8)
+    img = cv2.imdecode(npimg, cv2.IMREAD_COLOR)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    _, thresh = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY)
+    text = pytesseract.image_to_string(thresh)
+
+    match = re.search(r'(\d+)\s*/\s*(\d+)\s*=\s*(\d+(\.\d+)?)', text)
+    if match:
+        return float(match.group(3))
+    return "Could not extract attendance percentage."
+
+
+def measure(extract, corpus):
+    times, correct = [], 0
+    for _, image_bytes, expected in corpus:
+        start = time.perf_counter()
+        result = extract(image_bytes)
+        times.append((time.perf_counter() - start) * 1000)
+        if isinstance(result, float) and abs(result - expected) < 0.01:
+            correct += 1
+    times.sort()
+    return {
+        'p50_ms': round(statistics.median(times), 1),
+        'p95_ms': round(times[min(len(times) - 1, int(len(times) * 0.95))], 1),
+        'accuracy': round(correct / len(corpus), 3),
+    }
+
+
+def measure_preprocessing(corpus):
+    # Everything stage 1 does before Tesseract, and how much of the image it
+    # hands over.
+    times, areas, found = [], [], 0
+    for _, image_bytes, _ in corpus:
+        start = time.perf_counter()
+        thresh = ocr.binarize(ocr.downscale(ocr.decode_grayscale(image_bytes)))
+        boxes = ocr.text_regions(thresh)
+        sheet = ocr.stack_regions(thresh, boxes) if boxes else thresh
+        times.append((time.perf_counter() - start) * 1000)
+        areas.append(sheet.size / thresh.size)
+        found += bool(boxes)
+    times.sort()
+    return {
+        'p50_ms': round(statistics.median(times), 1),
+        'p95_ms': round(times[min(len(times) - 1, int(len(times) * 0.95))], 1),
+        'regions_found': round(found / len(corpus), 3),
+        'ocr_area': round(statistics.mean(areas), 3),
+    }
+
+
+def tesseract_available():
+    try:
+        pytesseract.get_tesseract_version()
+    except (pytesseract.TesseractNotFoundError, OSError):
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--fixtures', default=os.path.join('tests', 'fixtures', 'attendance'))
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.fixtures, 'labels.csv')):
+        attendance_fixtures.generate(args.fixtures, 40)
+    corpus = list(attendance_fixtures.load(args.fixtures))
+
+    print(f'{len(corpus)} images from {args.fixtures}')
+    print('preprocessing', measure_preprocessing(corpus))
+    if not tesseract_available():
+        print('Tesseract not found; skipping the OCR comparison')
+        return
+    print('legacy ', measure(legacy_extract, corpus))
+    print('staged ', measure(ocr.extract_attendance_percentage, corpus))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""What the rate limiter and admission gates cost, and whether they hold
+across worker processes.
+
+Against a scratch database, reports:
+
+  - latency of one RateLimiter check (MemoryBucketBackend and
+    SQLiteBucketBackend), for clients with tokens left and clients being
+    refused, and of an AdmissionGate acquire + release;
+  - `--processes` processes, standing in for gunicorn workers, hammering
+    one client's bucket for `--seconds`: how many requests each backend let
+    through against what the bucket allows (capacity + refill x seconds).
+    The memory backend lets each process through on its own;
+  - the same processes taking leases on one gate: the most held at once
+    must never exceed its limit.
+
+    python -m benchmarks.bench_rate_limit --processes 4 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+import db
+import migrations
+from rate_limit import AdmissionGate, MemoryBucketBackend, SQLiteBucketBackend
+
+
+CAPACITY = 30
+REFILL = 5.0
+
+
+def percentiles(times):
+    times = sorted(times)
+    return statistics.median(times) * 1e6, times[int(len(times) * 0.99)] * 1e6
+
+
+def take_latency(backend, keys, runs):
+    times = []
+    for i in range(runs):
+        start = time.perf_counter()
+        backend.take(keys[i % len(keys)], 1, CAPACITY, REFILL)
+        times.append(time.perf_counter() - start)
+    return percentiles(times)
+
+
+def hammer(path, backend_name, seconds, results):
+    pool = db.ConnectionPool(path, size=1)
+    backend = MemoryBucketBackend() if backend_name == 'memory' else SQLiteBucketBackend(pool)
+    allowed = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        if not backend.take('user:hammer', 1, CAPACITY, REFILL):
+            allowed += 1
+    results.put(allowed)
+    pool.close()
+
+
+def hold_leases(path, limit, seconds, results):
+    pool = db.ConnectionPool(path, size=1)
+    gate = AdmissionGate(pool, 'bench', limit)
+    most = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        lease = gate.acquire()
+        if lease is not None:
+            with pool.connection() as conn:
+                held = conn.execute('SELECT COUNT(*) FROM admission_leases WHERE gate = ?', ('bench',)).fetchone()[0]
+            most = max(most, held)
+            time.sleep(0.002)
+            gate.release(lease)
+    results.put((most, gate.stats['admitted'], gate.stats['rejected']))
+    pool.close()
+
+
+def in_processes(target, args, count):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [context.Process(target=target, args=(*args, results)) for _ in range(count)]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return collected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=20000)
+    parser.add_argument('--clients', type=int, default=10000)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--gate-limit', type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'database.db')
+        migrations.migrate(path)
+        pool = db.ConnectionPool(path, size=1)
+
+        print(f'one check, microseconds p50 / p99 ({args.runs} runs)')
+        keys = [f'ip:10.0.{i // 256}.{i % 256}' for i in range(args.clients)]
+        for label, backend in (('memory', MemoryBucketBackend()), ('sqlite', SQLiteBucketBackend(pool))):
+            p50, p99 = take_latency(backend, keys, args.runs)
+            print(f'  {label:<7} spread over {args.clients} clients  {p50:7.1f} / {p99:7.1f}')
+            p50, p99 = take_latency(backend, ['user:one'], args.runs)
+            print(f'  {label:<7} one client, refused       {p50:7.1f} / {p99:7.1f}')
+        gate = AdmissionGate(pool, 'latency', limit=4)
+        times = []
+        for _ in range(args.runs // 10):
+            start = time.perf_counter()
+            gate.release(gate.acquire())
+            times.append(time.perf_counter() - start)
+        p50, p99 = percentiles(times)
+        print(f'  gate acquire + release              {p50:7.1f} / {p99:7.1f}')
+        pool.close()
+
+        allowed_total = CAPACITY + REFILL * args.seconds
+        print(f'\n{args.processes} processes, one client, {args.seconds:.0f}s: the bucket allows ~{allowed_total:.0f}')
+        for label in ('memory', 'sqlite'):
+            counts = in_processes(hammer, (path, label, args.seconds), args.processes)
+            print(f'  {label:<7} let through {sum(counts):6}  (per process {counts})')
+
+        results = in_processes(hold_leases, (path, args.gate_limit, args.seconds), args.processes)
+        print(f'\ngate limit {args.gate_limit}, {args.processes} processes: most held at once '
+              f'{max(most for most, _, _ in results)}, admitted {sum(r[1] for r in results)}, '
+              f'refused {sum(r[2] for r in results)}')
+
+
+if __name__ == '__main__':
+    main()
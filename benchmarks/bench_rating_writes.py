@@ -0,0 +1,120 @@
+"""Fire concurrent ratings at submit_rating() and check nothing was lost.
+
+Runs the real app against a scratch database through the Flask test
+client, one client per thread, all rating a handful of professors so the
+writes contend.  Exits non-zero if any professor's counts disagree with
+the ratings actually stored.
+
+    python -m benchmarks.bench_rating_writes --ratings 5000 --threads 16 --professors 3
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import migrations
+from benchmarks.synthetic import professor_rows
+from rating_stats import ITEMS, WEIGHTED
+
+
+def seed(path, professors):
+    migrations.migrate(path)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        'INSERT INTO professors (id, Name, Designation, Photo, Avg_rating, no_ratings, Profile) '
+        'VALUES (?, ?, ?, ?, 0.0, 0, ?)',
+        [(row[0], row[1], row[2], row[3], row[6]) for row in professor_rows(professors)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def worker(app, index, count, professors, results, barrier):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['email'] = f'loadtest{index}@mahindrauniversity.edu.in'
+        session['attendance'] = 90.0
+    rng = random.Random(index)
+    barrier.wait()
+    for _ in range(count):
+        prof_id = rng.randrange(professors)
+        form = {item: rng.randint(1, 5) for item in ITEMS}
+        start = time.perf_counter()
+        response = client.post(f'/submit_rating/{prof_id}', data=form)
+        results.append((time.perf_counter() - start, response.status_code))
+        # Pending flashes would otherwise pile up in the session cookie.
+        with client.session_transaction() as session:
+            session.pop('_flashes', None)
+
+
+def check(path):
+    conn = sqlite3.connect(path)
+    problems = []
+    rows = conn.execute(f'''
+        SELECT p.id, p.no_ratings, p.imported_ratings, s.n,
+               (SELECT COUNT(*) FROM ratings r WHERE r.professor_id = p.id)
+        FROM professors p
+        LEFT JOIN professor_rating_stats s ON s.professor_id = p.id AND s.item = '{WEIGHTED}'
+    ''').fetchall()
+    for prof_id, no_ratings, imported, stats_n, stored in rows:
+        if no_ratings != imported + stored or (stats_n or 0) != stored:
+            problems.append(f'professor {prof_id}: no_ratings={no_ratings} stats n={stats_n} rows={stored}')
+    total = conn.execute('SELECT COUNT(*) FROM ratings').fetchone()[0]
+    conn.close()
+    return total, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ratings', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--professors', type=int, default=3, help='fewer professors means more contention')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'database.db')
+        seed(path, args.professors)
+        # main opens database.db relative to the working directory on import.
+        os.chdir(tmp)
+        os.environ.setdefault('RESPONSE_CACHE', 'memory')
+        import main as app_module
+        app = app_module.app
+
+        per_thread = args.ratings // args.threads
+        results = []
+        barrier = threading.Barrier(args.threads + 1)
+        threads = [threading.Thread(target=worker, args=(app, i, per_thread, args.professors, results, barrier))
+                   for i in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        sent = per_thread * args.threads
+        stored, problems = check(path)
+        latencies = sorted(latency for latency, _ in results)
+        pool = app_module.db.get_pool(app).snapshot()
+
+        print(f'{sent} ratings from {args.threads} threads in {elapsed:.2f}s ({sent / elapsed:.0f}/s)')
+        print(f'  latency p50={latencies[len(latencies) // 2] * 1000:.1f}ms '
+              f'p99={latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms')
+        print(f'  stored={stored}  busy_retries={pool["busy_retries"]}  busy_failures={pool["busy_failures"]}')
+        if stored != sent - pool['busy_failures']:
+            problems.append(f'{sent} sent, {pool["busy_failures"]} refused as busy, but {stored} stored')
+        for problem in problems:
+            print('  MISMATCH', problem)
+        os.chdir('/')
+        if problems:
+            sys.exit(1)
+        print('  all counts exact')
+
+
+if __name__ == '__main__':
+    main()
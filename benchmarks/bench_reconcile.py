@@ -0,0 +1,126 @@
+"""Throughput of rating reconciliation (rating_stats.reconcile) at scale.
+
+Seeds a scratch database with professors and millions of ratings, then
+times:
+
+  - a full audit, every professor marked and recomputed, at several batch
+    sizes (ratings per transaction): professors and ratings per second and
+    how long each batch held the write lock (the longest is what a
+    concurrent rating waits at worst);
+  - rating_stats.rebuild(), the pandas recompute of everything, for scale;
+  - the normal case: a few accounts deleted, their professors marked by the
+    triggers and reconciled.
+
+    python -m benchmarks.bench_reconcile --ratings 3000000 --professors 20000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import migrations
+import rating_stats
+from benchmarks.synthetic import professor_rows
+
+
+def seed(path, args):
+    migrations.migrate(path)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executemany(
+        'INSERT INTO professors (id, Name, Designation, Photo, Avg_rating, no_ratings, Profile) '
+        'VALUES (?, ?, ?, ?, 0.0, 0, ?)',
+        [(row[0], row[1], row[2], row[3], row[6]) for row in professor_rows(args.professors, args.seed)]
+    )
+    rng = random.Random(args.seed)
+    columns = rating_stats.TEACHING_ITEMS + rating_stats.CONTENT_ITEMS
+
+    def rows():
+        for i in range(args.ratings):
+            scores = {item: rng.randint(1, 5) for item in rating_stats.ITEMS}
+            # A fifth of the ratings go to the most popular 1% of professors
+            prof_id = rng.randrange(args.professors if rng.random() < 0.8 else args.professors // 100 or 1)
+            yield (prof_id, f'user{rng.randrange(args.users)}@example.edu',
+                   scores[rating_stats.OVERALL_ITEM], round(rating_stats.weighted_rating(scores), 2),
+                   *(scores[item] for item in columns))
+    conn.executemany(
+        f'INSERT INTO ratings (professor_id, user_email, overall_rating, rating, {", ".join(columns)}) '
+        f'VALUES ({", ".join("?" * (4 + len(columns)))})',
+        rows()
+    )
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+def timed_reconcile(conn, batch_ratings):
+    """Like rating_stats.reconcile(), timing each batch's transaction."""
+    batches = []
+    professors = 0
+    discrepancies = 0
+    while True:
+        start = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        count, found = rating_stats.reconcile_batch(conn, batch_ratings)
+        conn.execute('COMMIT')
+        if not count:
+            break
+        batches.append(time.perf_counter() - start)
+        professors += count
+        discrepancies += sum(1 for discrepancy in found if discrepancy['corrected'])
+    return professors, batches, discrepancies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ratings', type=int, default=3000000)
+    parser.add_argument('--professors', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=200000)
+    parser.add_argument('--batch-ratings', default='5000,20000,100000')
+    parser.add_argument('--deleted-users', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'database.db')
+        start = time.perf_counter()
+        seed(path, args)
+        print(f'{args.ratings} ratings of {args.professors} professors, seeded in '
+              f'{time.perf_counter() - start:.0f}s')
+        conn = sqlite3.connect(path, isolation_level=None)
+
+        start = time.perf_counter()
+        rating_stats.rebuild(conn)
+        print(f'  rebuild() (pandas, everything)   {time.perf_counter() - start:7.1f}s')
+
+        print('full audit, every professor marked')
+        for batch_ratings in (int(size) for size in args.batch_ratings.split(',')):
+            rating_stats.mark_all(conn)
+            start = time.perf_counter()
+            professors, batches, discrepancies = timed_reconcile(conn, batch_ratings)
+            elapsed = time.perf_counter() - start
+            print(f'  batch {batch_ratings:>6}  {elapsed:6.1f}s  {professors / elapsed:8.0f} professors/s  '
+                  f'{args.ratings / elapsed:9.0f} ratings/s  lock held p50 {statistics.median(batches) * 1000:6.1f}ms '
+                  f'max {max(batches) * 1000:6.1f}ms  {discrepancies} corrected')
+
+        users = [f'user{i}@example.edu' for i in random.Random(args.seed).sample(range(args.users),
+                                                                                 args.deleted_users)]
+        conn.execute('BEGIN IMMEDIATE')
+        deleted = sum(conn.execute('DELETE FROM ratings WHERE user_email = ?', (user,)).rowcount for user in users)
+        conn.execute('COMMIT')
+        marked = conn.execute('SELECT COUNT(*) FROM dirty_professors').fetchone()[0]
+        start = time.perf_counter()
+        count, discrepancies = rating_stats.reconcile(conn)
+        elapsed = time.perf_counter() - start
+        corrected = sum(1 for discrepancy in discrepancies if discrepancy['corrected'])
+        print(f'{args.deleted_users} accounts deleted ({deleted} ratings): {marked} professors marked, '
+              f'reconciled in {elapsed * 1000:.1f}ms, {len(discrepancies) - corrected} updated, '
+              f'{corrected} corrected')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Compare the old index() search path with ProfessorSearchIndex.
+
+    python -m benchmarks.bench_search_index --sizes 300 30000 300000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from fuzzywuzzy import fuzz, process
+
+from benchmarks.synthetic import FIRST_NAMES, LAST_NAMES, professors_db
+from search_index import ProfessorSearchIndex
+
+
+def legacy_search(conn, search_query):
+    # The body of index() before the in-memory index, kept verbatim.
+    all_professors = conn.execute('SELECT * FROM professors').fetchall()
+    all_professors_list = [dict(row) for row in all_professors]
+
+    exact_matches = [prof for prof in all_professors_list if search_query in prof['Name'].lower()]
+    if len(exact_matches) < 15:
+        names = [prof['Name'] for prof in all_professors_list]
+        matched_names = process.extract(search_query, names, limit=15, scorer=fuzz.partial_ratio)
+        return exact_matches + [prof for prof in all_professors_list if prof['Name'] in [match[0] for match in matched_names] and prof not in exact_matches]
+    return exact_matches
+
+
+def sample_queries(count, seed):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        word = rng.choice(FIRST_NAMES + LAST_NAMES).lower()
+        kind = rng.random()
+        if kind < 0.4:
+            queries.append(word)
+        elif kind < 0.7:
+            # one-character typo
+            i = rng.randrange(len(word))
+            queries.append(word[:i] + rng.choice('aeiouxyz') + word[i + 1:])
+        else:
+            queries.append(f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'.lower())
+    return queries
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def run(size, queries, legacy_queries):
+    conn = professors_db(size)
+    index = ProfessorSearchIndex(cache_size=0)
+    # The synthetic database has no change counters
+    build_ms, _ = timed(index.refresh, conn, {})
+    cached = ProfessorSearchIndex()
+    cached.refresh(conn, {})
+    for q in queries:
+        cached.search(q)
+
+    index_times = [timed(index.search, q)[0] for q in queries]
+    cached_times = [timed(cached.search, q)[0] for q in queries]
+
+    legacy_times = []
+    mismatches = 0
+    for q in queries[:legacy_queries]:
+        ms, expected = timed(legacy_search, conn, q)
+        legacy_times.append(ms)
+        if [p['id'] for p in expected] != [p['id'] for p in index.search(q)]:
+            mismatches += 1
+    conn.close()
+
+    def summary(times):
+        times = sorted(times)
+        p99 = times[min(len(times) - 1, int(len(times) * 0.99))]
+        return f'p50={statistics.median(times):9.3f}ms  p99={p99:9.3f}ms'
+
+    print(f'professors={size:>7}  build={build_ms:8.1f}ms')
+    print(f'  index   {summary(index_times)}  ({len(index_times)} queries, cold)')
+    print(f'  cached  {summary(cached_times)}  (same queries, repeated)')
+    if legacy_times:
+        print(f'  legacy  {summary(legacy_times)}  ({len(legacy_times)} queries, '
+              f'{mismatches} result lists differ)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[300, 30000, 300000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--legacy-queries', type=int, default=10,
+                        help='the old path is slow at large sizes, so only replay a few queries')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    queries = sample_queries(args.queries, args.seed)
+    for size in args.sizes:
+        run(size, queries, args.legacy_queries)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Requests per second through each way of serving the app.
+
+Starts the Flask development server (what `python main.py` runs), gunicorn
+with gunicorn.conf.py and waitress (wsgi.py) in turn against the same
+seeded scratch database, and has concurrent keep-alive clients fetch a mix
+of read-only pages for a fixed time.
+
+    python -m benchmarks.bench_serving --seconds 20 --clients 16
+    python -m benchmarks.bench_serving --servers gunicorn --workers 4 --threads 8
+"""
+import argparse
+import http.client
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import bench_app
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PATHS = ['/', '/index?query=kumar', '/api/top-professors', '/about_us', '/professors/1', '/professors/2']
+
+
+def commands(port, args):
+    return {
+        'dev': [sys.executable, '-c', f"import main; main.app.run(host='127.0.0.1', port={port})"],
+        'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+                     '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers), '--threads', str(args.threads),
+                     'wsgi:app'],
+        'waitress': [sys.executable, os.path.join(ROOT, 'wsgi.py')],
+    }
+
+
+def wait_ready(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with {process.returncode}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/readyz')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('server did not become ready')
+
+
+def fetch(conn, path):
+    conn.request('GET', path)
+    response = conn.getresponse()
+    response.read()
+    return response
+
+
+def client(port, paths, stop, results, seed):
+    rng = random.Random(seed)
+    conn = None
+    while not stop.is_set():
+        path = rng.choice(paths)
+        start = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                response = fetch(conn, path)
+            else:
+                try:
+                    response = fetch(conn, path)
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    # The server closed an idle keep-alive connection (or a
+                    # worker was recycled); retry once, as browsers do.
+                    conn.close()
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                    response = fetch(conn, path)
+            status = response.status
+            if response.will_close:
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException):
+            if conn is not None:
+                conn.close()
+            conn = None
+            status = 0
+        results.append((time.perf_counter() - start, status))
+    if conn is not None:
+        conn.close()
+
+
+def load(port, clients, seconds, warmup):
+    results = []
+    stop = threading.Event()
+    threads = [threading.Thread(target=client, args=(port, PATHS, stop, results, i)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+    del results[:]
+    start = time.perf_counter()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return elapsed, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', default='dev,gunicorn,waitress')
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker / waitress')
+    parser.add_argument('--port', type=int, default=18000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seed_args = argparse.Namespace(professors=1000, users=500, ratings=20000, reviews=5000, posts=2000,
+                                       replies=10000, seed=1)
+        bench_app.seed(os.path.join(tmp, 'database.db'), seed_args)
+
+        # No uploads are made; TESSERACT_CMD only has to name an existing file
+        # for the production settings check.
+        env = dict(os.environ, PYTHONPATH=ROOT, SECRET_KEY='bench-secret', BIND=f'127.0.0.1:{args.port}',
+                   THREADS=str(args.threads), TESSERACT_CMD=sys.executable)
+        print(f'{args.clients} keep-alive clients, {args.seconds:.0f}s per server, {os.cpu_count()} CPUs')
+        for name in args.servers.split(','):
+            process = subprocess.Popen(commands(args.port, args)[name], cwd=tmp, env=env,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_ready(args.port, process)
+                elapsed, results = load(args.port, args.clients, args.seconds, args.warmup)
+            finally:
+                process.terminate()
+                process.wait(timeout=60)
+
+            latencies = sorted(latency * 1000 for latency, _ in results)
+            errors = sum(1 for _, status in results if status != 200)
+            print(f'  {name:<9} {len(results) / elapsed:8.1f} req/s  '
+                  f'p50={latencies[len(latencies) // 2]:7.1f}ms  '
+                  f'p99={latencies[int(len(latencies) * 0.99)]:7.1f}ms  errors={errors}')
+
+
+if __name__ == '__main__':
+    main()
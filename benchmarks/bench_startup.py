@@ -0,0 +1,135 @@
+"""Import time and worker memory of the app.
+
+Import time comes from `python -X importtime -c "import main"`.  It is
+compared with importing the heavy dependencies main.py used to load
+eagerly (OpenCV, numpy, pytesseract and pandas, fuzzywuzzy, the email
+package) before main, so the difference is what lazy loading saves.
+
+Memory: gunicorn is started with and without GUNICORN_PRELOAD=1 and each
+worker is warmed with a few pages.  The report gives every worker's RSS,
+PSS (shared pages split between the processes sharing them) and USS
+(pages only that worker has), from /proc/<pid>/smaps_rollup, so Linux
+only.
+
+    python -m benchmarks.bench_startup --runs 5 --workers 4
+"""
+import argparse
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import bench_app, bench_serving
+
+
+ROOT = bench_serving.ROOT
+
+EAGER = 'import cv2, numpy, pytesseract, fuzzywuzzy.fuzz, email.mime.multipart, email.mime.text'
+
+RSS_AFTER_IMPORT = '''
+import main
+with open('/proc/self/status') as f:
+    print(next(line.split()[1] for line in f if line.startswith('VmRSS')))
+'''
+
+
+def import_profile(code, cwd, env):
+    """(total import microseconds, {module main imports: cumulative us}, RSS KiB)."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=cwd, env=env,
+                            capture_output=True, text=True, check=True)
+    total = 0
+    children = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            total += int(cumulative)
+        elif depth == 2:
+            children[name.strip()] = int(cumulative)
+    return total, children, int(result.stdout.strip().splitlines()[-1])
+
+
+def smaps(pid):
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss': values['Rss'],
+        'pss': values['Pss'],
+        'uss': values['Private_Clean'] + values['Private_Dirty'],
+    }
+
+
+def worker_pids(master):
+    with open(f'/proc/{master}/task/{master}/children') as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def gunicorn_memory(cwd, env, workers, port, preload):
+    env = dict(env, GUNICORN_PRELOAD='1' if preload else '0', BIND=f'127.0.0.1:{port}')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+         '--workers', str(workers), 'wsgi:app'],
+        cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        start = time.perf_counter()
+        bench_serving.wait_ready(port, process)
+        ready = time.perf_counter() - start
+        # Enough requests that every worker has served the listing and search pages
+        for _ in range(20 * workers):
+            for path in ('/', '/index?query=kumar', '/professors/1'):
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                conn.request('GET', path)
+                conn.getresponse().read()
+                conn.close()
+        return ready, [smaps(pid) for pid in worker_pids(process.pid)]
+    finally:
+        process.terminate()
+        process.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='import timings to take the median of')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=18001)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seed_args = argparse.Namespace(professors=1000, users=50, ratings=5000, reviews=1000, posts=200,
+                                       replies=1000, seed=1)
+        bench_app.seed(os.path.join(tmp, 'database.db'), seed_args)
+        env = dict(os.environ, PYTHONPATH=ROOT, SECRET_KEY='bench-secret', TESSERACT_CMD=sys.executable,
+                   RESPONSE_CACHE='off')
+
+        print(f'import main (median of {args.runs})')
+        for label, code in (('lazy', RSS_AFTER_IMPORT), ('eager', EAGER + '\n' + RSS_AFTER_IMPORT)):
+            runs = [import_profile(code, tmp, env) for _ in range(args.runs)]
+            total = statistics.median(run[0] for run in runs)
+            rss = statistics.median(run[2] for run in runs)
+            print(f'  {label:<6} {total / 1000:7.1f}ms  RSS {rss / 1024:6.1f}MiB')
+            if label == 'lazy':
+                slowest = sorted(runs[0][1].items(), key=lambda item: item[1], reverse=True)[:6]
+                print('         slowest in main: ' + ', '.join(f'{name} {us / 1000:.0f}ms' for name, us in slowest))
+
+        print(f'gunicorn, {args.workers} workers, after warming each one (MiB)')
+        for preload in (False, True):
+            ready, workers = gunicorn_memory(tmp, env, args.workers, args.port, preload)
+            label = 'preload' if preload else 'per-worker import'
+            print(f'  {label:<18} ready in {ready:4.1f}s  '
+                  f'RSS {statistics.mean(w["rss"] for w in workers) / 1024:6.1f}  '
+                  f'PSS {statistics.mean(w["pss"] for w in workers) / 1024:6.1f}  '
+                  f'USS {statistics.mean(w["uss"] for w in workers) / 1024:6.1f}  (mean per worker)')
+
+
+if __name__ == '__main__':
+    main()
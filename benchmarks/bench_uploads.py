@@ -0,0 +1,79 @@
+"""Memory one upload costs the request process, measured with tracemalloc.
+
+For each kind of upload, reports the peak bytes allocated while
+UploadIngestor reads it (what the request buffers) and, for accepted
+screenshots, while ocr.decode_grayscale() decodes it, against a plain
+full-colour cv2.imdecode of the same bytes.  The upload body itself is
+built before tracing starts, as Werkzeug's spooled stream would hold it.
+
+    python -m benchmarks.bench_uploads --max-mb 5
+"""
+import argparse
+import io
+import os
+import struct
+import tracemalloc
+import zlib
+
+import cv2
+import numpy as np
+from werkzeug.datastructures import FileStorage
+
+import ocr
+from benchmarks import attendance_fixtures
+from uploads import UploadIngestor, UploadRejected
+
+
+def png_header(width, height):
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    chunk = b'IHDR' + ihdr
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', len(ihdr)) + chunk + struct.pack('>I', zlib.crc32(chunk))
+
+
+def uploads(max_bytes):
+    import random
+    rng = random.Random(0)
+    screenshot, _ = attendance_fixtures.render(rng)
+    return [
+        ('phone screenshot (png)', cv2.imencode('.png', screenshot)[1].tobytes()),
+        ('phone screenshot (jpeg)', cv2.imencode('.jpg', screenshot, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()),
+        ('body over the limit', png_header(1080, 2340) + os.urandom(4 * max_bytes)),
+        ('20000 x 20000 header', png_header(20000, 20000) + os.urandom(max_bytes // 2)),
+        ('not an image', os.urandom(max_bytes // 2)),
+    ]
+
+
+def traced_peak(fn):
+    tracemalloc.start()
+    try:
+        result = fn()
+    except UploadRejected as e:
+        result = e
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-mb', type=float, default=5)
+    args = parser.parse_args()
+    max_bytes = int(args.max_mb * 1024 * 1024)
+    ingestor = UploadIngestor(max_bytes=max_bytes)
+
+    print(f'upload limit {max_bytes // 1024} KB; peak KB allocated')
+    print(f'  {"upload":<26} {"body KB":>9} {"read":>9} {"decode":>9} {"imdecode":>9}  outcome')
+    for label, body in uploads(max_bytes):
+        stream = FileStorage(stream=io.BytesIO(body), filename='upload')
+        result, read_peak = traced_peak(lambda: ingestor.read(stream))
+        if isinstance(result, UploadRejected):
+            print(f'  {label:<26} {len(body) // 1024:9} {read_peak // 1024:9} {"":>9} {"":>9}  rejected: {result}')
+            continue
+        _, decode_peak = traced_peak(lambda: ocr.decode_grayscale(result))
+        _, full_peak = traced_peak(lambda: cv2.imdecode(np.frombuffer(result, np.uint8), cv2.IMREAD_COLOR))
+        print(f'  {label:<26} {len(body) // 1024:9} {read_peak // 1024:9} {decode_peak // 1024:9} '
+              f'{full_peak // 1024:9}  accepted')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import random
+import sqlite3
+
+
+FIRST_NAMES = ['Aarav', 'Aditi', 'Ananya', 'Arjun', 'Deepa', 'Divya', 'Farhan', 'Gita', 'Harsh', 'Isha',
+               'Karthik', 'Kavya', 'Lakshmi', 'Manoj', 'Meera', 'Nikhil', 'Pooja', 'Priya', 'Rahul', 'Ravi',
+               'Sanjay', 'Shreya', 'Sneha', 'Suresh', 'Swapna', 'Tara', 'Uday', 'Varun', 'Vidya', 'Yash']
+LAST_NAMES = ['Acharya', 'Bhat', 'Chandra', 'Desai', 'Gupta', 'Iyer', 'Joshi', 'Kapoor', 'Krishnan', 'Kumar',
+              'Menon', 'Mishra', 'Nair', 'Patel', 'Pillai', 'Rao', 'Reddy', 'Saxena', 'Sharma', 'Singh',
+              'Srinivasan', 'Subramanian', 'Thakur', 'Varma', 'Venkatesh']
+DESIGNATIONS = ['Professor', 'Associate Professor', 'Assistant Professor', 'Faculty Associate', 'Visiting Faculty']
+
+PROFESSORS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS professors (
+        id INTEGER PRIMARY KEY,
+        Name TEXT,
+        Designation TEXT,
+        Photo TEXT,
+        Avg_rating REAL,
+        no_ratings INTEGER,
+        Profile TEXT
+    )
+'''
+
+
+def professor_name(rng):
+    return f'{rng.choice(FIRST_NAMES)[0]}. {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+
+def professor_rows(count, seed=0, rated_fraction=0.3):
+    rng = random.Random(seed)
+    for prof_id in range(count):
+        rated = rng.random() < rated_fraction
+        yield (
+            prof_id,
+            professor_name(rng),
+            rng.choice(DESIGNATIONS),
+            f'https://example.edu/photos/{prof_id}.webp',
+            round(rng.uniform(1, 5), 2) if rated else 0.0,
+            rng.randint(1, 40) if rated else 0,
+            f'https://example.edu/faculty/{prof_id}/',
+        )
+
+
+def professors_db(count, seed=0, path=':memory:'):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute(PROFESSORS_SCHEMA)
+    conn.executemany('INSERT INTO professors VALUES (?, ?, ?, ?, ?, ?, ?)', professor_rows(count, seed))
+    conn.commit()
+    return conn
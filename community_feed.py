@@ -0,0 +1,84 @@
+from pagination import encode_cursor
+
+
+POSTS_PER_PAGE = 20
+REPLIES_PER_POST = 5
+
+FIRST_PAGE = 'SELECT * FROM community_posts ORDER BY timestamp DESC, id DESC LIMIT ?'
+PAGE_BEFORE = ('SELECT * FROM community_posts WHERE (timestamp, id) < (?, ?) '
+               'ORDER BY timestamp DESC, id DESC LIMIT ?')
+REPLY_COUNTS = 'SELECT post_id, COUNT(*) FROM community_replies WHERE post_id IN ({placeholders}) GROUP BY post_id'
+FIRST_REPLIES = 'SELECT * FROM community_replies WHERE post_id = ? ORDER BY timestamp, id LIMIT ?'
+THREAD = 'SELECT * FROM community_replies WHERE post_id = ? ORDER BY timestamp, id'
+
+
+def fetch_posts(conn, before=None, limit=POSTS_PER_PAGE):
+    """One page of posts, newest first, and the cursor for the next page.
+
+    Keyset pagination on (timestamp, id), so page N costs the same as page 1.
+    """
+    if before is None:
+        rows = conn.execute(FIRST_PAGE, (limit + 1,)).fetchall()
+    else:
+        rows = conn.execute(PAGE_BEFORE, (before[0], before[1], limit + 1)).fetchall()
+
+    posts = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = posts[-1]
+        next_cursor = encode_cursor(last['timestamp'], last['id'])
+    return posts, next_cursor
+
+
+def build_threads(replies):
+    """Nest replies under their parents in a single pass.
+
+    `replies` must be in (timestamp, id) order, which puts every parent
+    before its children.  Returns {post_id: [top-level replies]}, each reply
+    a dict with a 'children' list.  Replies whose parent is not in `replies`
+    are treated as top-level.
+    """
+    nodes = {}
+    threads = {}
+    for reply in replies:
+        node = dict(reply)
+        node['children'] = []
+        nodes[node['id']] = node
+        parent = nodes.get(node['parent_reply_id'])
+        if parent is not None:
+            parent['children'].append(node)
+        else:
+            threads.setdefault(node['post_id'], []).append(node)
+    return threads
+
+
+def attach_replies(conn, posts, per_post=REPLIES_PER_POST):
+    """Give each post its reply count and its first `per_post` replies as a thread.
+
+    The first replies by (timestamp, id) always include their own parents,
+    so the partial thread is well formed.
+    """
+    if not posts:
+        return posts
+    post_ids = [post['id'] for post in posts]
+    placeholders = ', '.join('?' * len(post_ids))
+
+    counts = dict(conn.execute(REPLY_COUNTS.format(placeholders=placeholders), post_ids).fetchall())
+    # One short indexed read per post (same prepared statement each time), so
+    # a post with thousands of replies costs no more than one with five.
+    replies = []
+    for post_id in post_ids:
+        replies += conn.execute(FIRST_REPLIES, (post_id, per_post)).fetchall()
+    replies.sort(key=lambda reply: (reply['timestamp'], reply['id']))
+    threads = build_threads(replies)
+
+    for post in posts:
+        post['reply_count'] = counts.get(post['id'], 0)
+        post['replies'] = threads.get(post['id'], [])
+    return posts
+
+
+def fetch_thread(conn, post_id):
+    """Every reply to one post, nested."""
+    replies = conn.execute(THREAD, (post_id,)).fetchall()
+    return build_threads(replies).get(post_id, []), len(replies)
@@ -0,0 +1,54 @@
+"""App settings, read from the environment (and .env) in one place.
+
+main.py loads the class named by APP_CONFIG (default config.Config, for
+`python main.py`); wsgi.py selects ProductionConfig.
+"""
+import os
+import shutil
+
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+# The key the app shipped with; only acceptable on a developer machine.
+DEV_SECRET_KEY = 'your_secret_key_here'
+
+
+def default_tesseract():
+    return shutil.which('tesseract') or r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+
+class Config:
+    SECRET_KEY = os.getenv('SECRET_KEY') or DEV_SECRET_KEY
+    DATABASE = os.getenv('DATABASE', 'database.db')
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+    TESSERACT_CMD = os.getenv('TESSERACT_CMD') or default_tesseract()
+    UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', 5 * 1024 * 1024))
+    MAX_CONTENT_LENGTH = UPLOAD_MAX_BYTES + 64 * 1024  # + form fields
+    # /metrics needs `Authorization: Bearer <token>`; unset, only local scrapers get it
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    # Proxies in front of the app whose X-Forwarded-For/-Proto to believe;
+    # 0 when clients connect directly
+    TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+
+    @classmethod
+    def check(cls):
+        """Settings that would be wrong to serve with; empty if fine."""
+        return []
+
+
+class ProductionConfig(Config):
+    SESSION_COOKIE_SAMESITE = 'Lax'
+    SESSION_COOKIE_SECURE = os.getenv('SESSION_COOKIE_SECURE', '0') == '1'
+
+    @classmethod
+    def check(cls):
+        problems = []
+        if cls.SECRET_KEY == DEV_SECRET_KEY:
+            # Every worker must sign sessions with the same, private key.
+            problems.append('SECRET_KEY is not set')
+        if not os.path.exists(cls.TESSERACT_CMD):
+            problems.append(f'Tesseract not found at {cls.TESSERACT_CMD} (set TESSERACT_CMD)')
+        return problems
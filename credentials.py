@@ -0,0 +1,153 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode().rstrip('=')
+
+
+def _unb64(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+class PasswordHasher:
+    """Password hashing and verification with hashlib's scrypt or PBKDF2.
+
+    Hashes are stored as `scrypt$n$r$p$salt$hash` or
+    `pbkdf2_sha256$iterations$salt$hash`, so the cost travels with each row
+    and raising it later only affects new hashes (and rows upgraded on
+    login, see needs_rehash()).  Anything else in the password column is a
+    legacy plaintext password.
+
+    The KDF runs on a small thread pool (hashlib releases the GIL while it
+    works), and at most `max_pending` hashes may be queued; past that
+    HasherBusy is raised rather than letting a burst of logins tie up
+    every request thread.
+    """
+
+    def __init__(self, scheme='scrypt', scrypt_n=2 ** 14, scrypt_r=8, scrypt_p=1,
+                 pbkdf2_iterations=600_000, workers=2, max_pending=32, wait=5.0):
+        if scheme not in ('scrypt', 'pbkdf2_sha256'):
+            raise ValueError(f'unknown password scheme {scheme!r}')
+        self.scheme = scheme
+        self.scrypt_n = scrypt_n
+        self.scrypt_r = scrypt_r
+        self.scrypt_p = scrypt_p
+        self.pbkdf2_iterations = pbkdf2_iterations
+        self.workers = workers
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.stats = {
+            'hashed': 0,
+            'verified': 0,
+            'failed': 0,        # wrong password (or unknown user)
+            'legacy': 0,        # plaintext rows checked
+            'busy': 0,          # refused because max_pending were queued
+            'kdf_seconds': 0.0,
+        }
+
+    def _get_executor(self):
+        # Threads do not survive a fork, so each worker builds its own pool.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='kdf')
+        return self._executor
+
+    def _derive(self, scheme, params, password, salt):
+        start = time.perf_counter()
+        if scheme == 'scrypt':
+            n, r, p = params
+            digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                                    maxmem=2 * 128 * n * r * p, dklen=32)
+        else:
+            digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, params[0])
+        with self._lock:
+            self.stats['kdf_seconds'] += time.perf_counter() - start
+        return digest
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.wait):
+            with self._lock:
+                self.stats['busy'] += 1
+            raise HasherBusy('too many password checks in progress')
+        try:
+            with self._lock:
+                executor = self._get_executor()
+            return executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def _params(self):
+        if self.scheme == 'scrypt':
+            return (self.scrypt_n, self.scrypt_r, self.scrypt_p)
+        return (self.pbkdf2_iterations,)
+
+    def _hash(self, password):
+        salt = os.urandom(16)
+        params = self._params()
+        digest = self._derive(self.scheme, params, password, salt)
+        with self._lock:
+            self.stats['hashed'] += 1
+        return '$'.join([self.scheme, *map(str, params), _b64(salt), _b64(digest)])
+
+    def hash(self, password):
+        return self._run(self._hash, password)
+
+    @staticmethod
+    def parse(stored):
+        """(scheme, params, salt, digest), or None for a legacy plaintext value."""
+        parts = (stored or '').split('$')
+        try:
+            if parts[0] == 'scrypt' and len(parts) == 6:
+                return 'scrypt', tuple(int(x) for x in parts[1:4]), _unb64(parts[4]), _unb64(parts[5])
+            if parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+                return 'pbkdf2_sha256', (int(parts[1]),), _unb64(parts[2]), _unb64(parts[3])
+        except ValueError:
+            pass
+        return None
+
+    def _verify(self, stored, password):
+        parsed = self.parse(stored)
+        if stored is None:
+            # Unknown user: spend the same time as a real check, so response
+            # times do not reveal which emails are registered.
+            self._derive(self.scheme, self._params(), password, b'\0' * 16)
+            ok = False
+        elif parsed is None:
+            with self._lock:
+                self.stats['legacy'] += 1
+            ok = hmac.compare_digest(stored.encode(), password.encode())
+        else:
+            scheme, params, salt, digest = parsed
+            ok = hmac.compare_digest(self._derive(scheme, params, password, salt), digest)
+        with self._lock:
+            self.stats['verified' if ok else 'failed'] += 1
+        return ok
+
+    def verify(self, stored, password):
+        """True if `password` matches the stored value (hash or legacy plaintext)."""
+        return self._run(self._verify, stored, password or '')
+
+    def needs_rehash(self, stored):
+        """True for plaintext rows and hashes made with other settings."""
+        parsed = self.parse(stored)
+        return parsed is None or parsed[0] != self.scheme or parsed[1] != self._params()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['scheme'] = self.scheme
+        stats['params'] = list(self._params())
+        return stats
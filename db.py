@@ -0,0 +1,265 @@
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context
+
+import migrations
+
+
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -20000',      # ~20 MB page cache per connection
+    'PRAGMA mmap_size = 268435456',    # 256 MB
+    'PRAGMA temp_store = MEMORY',
+)
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    pass
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Reports each statement and the time to run it (and any fetch*()
+    calls on its results) to the connection's observer."""
+
+    def _timed(self, method, sql, *args):
+        start = time.perf_counter()
+        try:
+            return method(self, sql, *args)
+        finally:
+            self._sql = sql
+            self.connection.observer(sql, time.perf_counter() - start)
+
+    def execute(self, sql, parameters=()):
+        return self._timed(sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(sqlite3.Cursor.executemany, sql, seq_of_parameters)
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            # Counted as time, not as another execution of the statement
+            sql = getattr(self, '_sql', None)
+            if sql is not None:
+                self.connection.observer(sql, time.perf_counter() - start, executed=False)
+
+    def fetchone(self):
+        return self._fetch(sqlite3.Cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(sqlite3.Cursor.fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(sqlite3.Cursor.fetchall)
+
+
+class TimedConnection(sqlite3.Connection):
+    observer = None
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class ConnectionPool:
+    """A fixed-size pool of SQLite connections shared by request threads.
+
+    Connections are opened lazily up to `size`, tuned with PRAGMAS and keep
+    sqlite3's per-connection prepared statement cache between requests.
+    If `observer` is given it is called as observer(sql, seconds) after
+    every statement run on a pool connection, and with executed=False for
+    the time spent fetching a statement's rows.
+    """
+
+    def __init__(self, path, size=8, timeout=10.0, statement_cache=256, observer=None):
+        self.path = path
+        self.observer = observer
+        self.size = size
+        self.timeout = timeout
+        self.statement_cache = statement_cache
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self.stats = {
+            'opened': 0,        # connections created
+            'acquired': 0,      # checkouts
+            'reused': 0,        # checkouts served by an idle connection
+            'waits': 0,         # checkouts that had to wait for a release
+            'wait_seconds': 0.0,
+            'timeouts': 0,
+            'busy_retries': 0,  # write transactions retried after SQLITE_BUSY
+            'busy_failures': 0, # ... and given up on
+        }
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=self.statement_cache,
+                               factory=TimedConnection if self.observer else sqlite3.Connection)
+        if self.observer:
+            conn.observer = self.observer
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+
+        if conn is None:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+                with self._lock:
+                    self.stats['opened'] += 1
+                    self.stats['acquired'] += 1
+                return conn
+
+            start = time.perf_counter()
+            try:
+                conn = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                with self._lock:
+                    self.stats['timeouts'] += 1
+                raise PoolTimeout('timed out waiting for a database connection')
+            with self._lock:
+                self.stats['waits'] += 1
+                self.stats['wait_seconds'] += time.perf_counter() - start
+
+        with self._lock:
+            self.stats['acquired'] += 1
+            self.stats['reused'] += 1
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def run_immediate(self, conn, work, retries=5, backoff=0.05):
+        """Run `work(conn)` in a BEGIN IMMEDIATE transaction and commit.
+
+        IMMEDIATE takes the write lock up front, so the transaction cannot
+        fail half way through on a lock upgrade; the connection's busy timeout
+        covers ordinary waits.  If the lock still cannot be had the whole
+        transaction is retried with jittered backoff, and after `retries`
+        attempts the OperationalError is raised.
+        """
+        for attempt in range(retries + 1):
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                result = work(conn)
+                conn.commit()
+                return result
+            except sqlite3.OperationalError as e:
+                if conn.in_transaction:
+                    conn.rollback()
+                if 'locked' not in str(e) and 'busy' not in str(e):
+                    raise
+                with self._lock:
+                    self.stats['busy_failures' if attempt == retries else 'busy_retries'] += 1
+                if attempt == retries:
+                    raise
+                time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+            except Exception:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+
+    @contextmanager
+    def connection(self):
+        # A request thread that already holds a connection (get_db()) uses it
+        # rather than taking a second one: with every connection held by a
+        # request waiting for another, the pool would only free up on timeout.
+        # A connection with uncommitted work is left alone, since the caller
+        # may commit.
+        held = g.get('db') if has_app_context() and current_app.extensions.get('db_pool') is self else None
+        if held is not None and not held.in_transaction:
+            yield held
+            return
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['open'] = self._opened
+        stats['idle'] = self._idle.qsize()
+        stats['size'] = self.size
+        return stats
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._opened -= 1
+
+
+def init_app(app, observer=None):
+    app.config.setdefault('DATABASE', 'database.db')
+    app.config.setdefault('DB_POOL_SIZE', 8)
+    app.config.setdefault('DB_POOL_TIMEOUT', 10.0)
+    app.config.setdefault('DB_MIGRATE_ON_START', True)
+    if app.config['DB_MIGRATE_ON_START']:
+        migrations.migrate(app.config['DATABASE'])
+    app.extensions['db_pool'] = ConnectionPool(
+        app.config['DATABASE'],
+        size=app.config['DB_POOL_SIZE'],
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        observer=observer,
+    )
+    app.teardown_appcontext(close_db)
+
+
+def get_pool(app=None):
+    return (app or current_app).extensions['db_pool']
+
+
+def get_db():
+    """The connection for the current request, checked out on first use."""
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+    return g.db
+
+
+def data_versions(conn):
+    """{name: version} of the change counters in `data_versions`, which
+    triggers bump on every write to the tables they cover."""
+    return {row[0]: row[1] for row in conn.execute('SELECT name, version FROM data_versions')}
+
+
+def close_db(exc=None):
+    # Anything left uncommitted (error paths, early returns) is rolled back
+    # before the connection goes back to the pool.
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().release(conn)
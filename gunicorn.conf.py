@@ -0,0 +1,88 @@
+"""gunicorn settings for the production server.
+
+    SECRET_KEY=... gunicorn -c gunicorn.conf.py wsgi:app
+
+Workers are processes with a pool of threads each (gthread).  Most of a
+request's blocking work releases the GIL: SQLite queries, the scrypt
+password check (which has its own small pool) and waits for a database
+connection.  OCR runs in each worker's process pool and mail is sent from
+background threads, so neither holds a request thread for long.  Template
+rendering and fuzzy search need the GIL, so there are about as many
+processes as CPUs.  There is no point in more threads than database
+connections.
+
+gevent is not a good fit.  sqlite3, hashlib and the OCR process pool do
+not yield to its event loop, so a single slow query would stall every
+request in the worker.
+
+Memory: every worker has its own OCR pool of OCR_WORKERS processes.
+On small machines set OCR_WORKERS=1.
+
+Graceful reload: `kill -HUP <master pid>` starts workers on the new code.
+The old workers finish their in-flight requests (up to graceful_timeout),
+drain queued mail and OCR jobs (see main.shutdown()) and exit.  SIGTERM
+stops the server the same way.
+
+Behind a reverse proxy (the hosting platform's router, nginx) set
+TRUSTED_PROXY_HOPS to the number of proxies in front of gunicorn, usually
+1.  The app then takes the client's address from X-Forwarded-For.  Without
+it every visitor appears to come from the proxy: anonymous clients share
+one rate limit bucket, and with a proxy on the same host anyone gets
+/metrics.  Never set it higher than the real number of proxies, or
+clients can pick their own address.
+
+Liveness is /healthz, always 200 while the worker serves requests.
+Readiness is /readyz: 200 once the database answers and is fully migrated,
+503 with the problems listed otherwise.  Prometheus metrics are at
+/metrics: a scraper on another host needs METRICS_TOKEN set and sends it
+as `Authorization: Bearer <token>`.
+
+Measured with benchmarks/bench_serving.py: 16 keep-alive clients on a
+mix of read-only pages, 1 CPU, so one gunicorn worker with 8 threads.
+
+                     req/s    p50      p99
+  Flask dev server    481    32.7ms   54.7ms
+  gunicorn            576    24.4ms   60.1ms
+  waitress            609    25.2ms   58.9ms
+
+With one CPU the gain comes from less per-request overhead, not from
+parallelism.  Add workers when there are more cores.
+"""
+import multiprocessing
+import os
+
+
+bind = os.getenv('BIND', '0.0.0.0:10000')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.getenv('GUNICORN_THREADS', os.getenv('DB_POOL_SIZE', '8')))
+
+# Requests only enqueue OCR and mail, so anything past this is stuck
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+# Recycle workers now and then to return fragmented memory (OpenCV, pandas)
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '5000'))
+max_requests_jitter = max_requests // 10
+
+# By default each worker imports the app itself, so a HUP reload picks up
+# new code.  GUNICORN_PRELOAD=1 imports it once in the master and runs
+# main.preload() before forking: workers then share the loaded modules, the
+# search index and leaderboard copy-on-write and start faster, but only a
+# full restart (not HUP) loads new code.
+preload_app = os.getenv('GUNICORN_PRELOAD', '0') == '1'
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')   # e.g. '-' for stdout
+errorlog = '-'
+
+
+def when_ready(server):
+    if preload_app:
+        import main
+        main.preload()
+
+
+def worker_exit(server, worker):
+    import main
+    main.shutdown()
@@ -0,0 +1,167 @@
+"""Import professors from a CSV export into database.db.
+
+The CSV is streamed in chunks into a temporary staging table and merged
+with one INSERT ... ON CONFLICT DO UPDATE, all in a single transaction.
+Names, designations, photos and profile links are updated; ratings the
+site has collected are left alone.  The CSV's Avg_rating/no_ratings only
+seed professors that are new (as their imported baseline), unless
+--import-ratings is given.
+
+    python import_professors.py modified.csv
+    python import_professors.py modified.csv --dry-run     # show what would change
+"""
+import argparse
+import sqlite3
+import time
+
+import pandas as pd
+
+import migrations
+from rating_stats import REFRESH_PROFESSOR
+
+
+COLUMNS = ['id', 'Name', 'Designation', 'Photo', 'Profile', 'Avg_rating', 'no_ratings']
+TEXT_COLUMNS = ['Name', 'Designation', 'Photo', 'Profile']
+PROFILE_FIELDS = ['Name', 'Designation', 'Photo', 'Profile']
+
+STAGING = '''
+    CREATE TEMP TABLE professors_staging (
+        id INTEGER PRIMARY KEY,
+        Name TEXT,
+        Designation TEXT,
+        Photo TEXT,
+        Profile TEXT,
+        Avg_rating REAL,
+        no_ratings INTEGER
+    )
+'''
+
+
+def clean_text(value):
+    """'Dean_x000D_\nSchool  of X ' -> 'Dean School of X'."""
+    if not isinstance(value, str):
+        return value
+    if '_x000D_' in value:
+        value = value.replace('_x000D_', ' ')
+    return ' '.join(value.split())
+
+
+def clean(chunk):
+    """Drop Excel line-break artifacts and stray whitespace, and coerce the
+    numeric columns.  The text cleanup uses plain str methods per cell, which
+    is several times faster than the equivalent .str.replace regex chain."""
+    for column in TEXT_COLUMNS:
+        chunk[column] = chunk[column].map(clean_text)
+    chunk['Avg_rating'] = pd.to_numeric(chunk['Avg_rating'], errors='coerce').fillna(0.0)
+    chunk['no_ratings'] = pd.to_numeric(chunk['no_ratings'], errors='coerce').fillna(0).astype('int64')
+    chunk['id'] = pd.to_numeric(chunk['id'], errors='coerce')
+    return chunk.dropna(subset=['id', 'Name'])
+
+
+def stage(conn, csv_path, chunk_size):
+    """Load the CSV into professors_staging.  Returns (rows read, rows staged)."""
+    conn.execute(STAGING)
+    read = 0
+    for chunk in pd.read_csv(csv_path, usecols=COLUMNS, dtype=str, chunksize=chunk_size):
+        read += len(chunk)
+        chunk = clean(chunk)[COLUMNS]
+        chunk['id'] = chunk['id'].astype('int64')
+        rows = chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None)
+        # A later row for the same id wins, as the row-by-row REPLACE did.
+        conn.executemany('INSERT OR REPLACE INTO temp.professors_staging VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+    return read, conn.execute('SELECT COUNT(*) FROM temp.professors_staging').fetchone()[0]
+
+
+def diff(conn, limit):
+    """Counts of new, changed and unchanged professors, and a sample of the changes."""
+    changed_where = ' OR '.join(f's.{field} IS NOT p.{field}' for field in PROFILE_FIELDS)
+    new = conn.execute('''
+        SELECT COUNT(*) FROM temp.professors_staging s WHERE NOT EXISTS (SELECT 1 FROM professors p WHERE p.id = s.id)
+    ''').fetchone()[0]
+    changed = conn.execute(f'''
+        SELECT s.id, {', '.join(f'p.{f}, s.{f}' for f in PROFILE_FIELDS)}
+        FROM temp.professors_staging s JOIN professors p ON p.id = s.id
+        WHERE {changed_where}
+        ORDER BY s.id
+    ''').fetchall()
+    total = conn.execute('SELECT COUNT(*) FROM temp.professors_staging').fetchone()[0]
+
+    samples = []
+    for row in changed[:limit]:
+        fields = []
+        for i, field in enumerate(PROFILE_FIELDS):
+            old, new_value = row[1 + 2 * i], row[2 + 2 * i]
+            if old != new_value:
+                fields.append(f'{field}: {old!r} -> {new_value!r}')
+        samples.append(f'  ~ {row[0]}: ' + '; '.join(fields))
+    return {'new': new, 'changed': len(changed), 'unchanged': total - new - len(changed)}, samples
+
+
+def merge(conn, import_ratings):
+    """Upsert the staged rows into professors."""
+    conn.execute(f'''
+        INSERT INTO professors (id, Name, Designation, Photo, Profile, Avg_rating, no_ratings,
+                                imported_ratings, imported_rating_total)
+        SELECT id, Name, Designation, Photo, Profile, ROUND(Avg_rating, 2), no_ratings,
+               no_ratings, Avg_rating * no_ratings
+        FROM temp.professors_staging WHERE true
+        ON CONFLICT (id) DO UPDATE SET
+            {', '.join(f'{field} = excluded.{field}' for field in PROFILE_FIELDS)}
+            {', imported_ratings = excluded.imported_ratings, '
+             'imported_rating_total = excluded.imported_rating_total' if import_ratings else ''}
+    ''')
+    if import_ratings:
+        conn.executemany(REFRESH_PROFESSOR, conn.execute('SELECT id FROM temp.professors_staging').fetchall())
+    # Rendered pages in the shared response cache may show the old rows.
+    conn.execute('DELETE FROM response_cache')
+    conn.execute('DELETE FROM response_cache_tags')
+
+
+def run(db_path, csv_path, chunk_size=50000, dry_run=False, import_ratings=False, show=20):
+    migrations.migrate(db_path)
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    try:
+        start = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            read, staged = stage(conn, csv_path, chunk_size)
+            counts, samples = diff(conn, show)
+            if dry_run:
+                conn.execute('ROLLBACK')
+            else:
+                merge(conn, import_ratings)
+                conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        elapsed = time.perf_counter() - start
+    finally:
+        conn.close()
+
+    print(f"{'Would import' if dry_run else 'Imported'} {staged} professors from {csv_path} "
+          f"({read - staged} rows skipped or duplicated) in {elapsed:.2f}s, {read / elapsed:,.0f} rows/s")
+    print(f"  new={counts['new']} changed={counts['changed']} unchanged={counts['unchanged']}")
+    if dry_run:
+        for line in samples:
+            print(line)
+        if counts['changed'] > len(samples):
+            print(f"  ... and {counts['changed'] - len(samples)} more")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv', nargs='?', default='modified.csv')
+    parser.add_argument('--db', default='database.db')
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--dry-run', action='store_true', help='report what would change and roll back')
+    parser.add_argument('--import-ratings', action='store_true',
+                        help="replace existing professors' imported rating baseline with the CSV's")
+    parser.add_argument('--show', type=int, default=20, help='changed rows to list in --dry-run')
+    args = parser.parse_args()
+    run(args.db, args.csv, args.chunk_size, args.dry_run, args.import_ratings, args.show)
+
+
+if __name__ == '__main__':
+    main()
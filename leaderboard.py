@@ -0,0 +1,133 @@
+import random
+import threading
+from bisect import bisect_left, insort
+
+from db import data_versions
+
+
+# The professor columns /api/top-professors has always returned
+FIELDS = ('id', 'Name', 'Designation', 'Photo', 'Avg_rating', 'no_ratings', 'Profile')
+
+
+class Leaderboard:
+    """Top professors by Avg_rating, kept in memory for index() and the API.
+
+    Rated professors live in a list sorted by (-Avg_rating, id), so a new
+    rating is one bisect to find the old key, then a `del` and an insort.
+    Those two shift the list's tail, O(n) pointer moves, which at 20,000
+    rated professors is about 12us per rating; a heap or skip list would
+    make top() dearer to save time that never shows up.  When fewer than
+    `size` professors are rated, the page is filled from a pre-shuffled
+    reservoir of unrated professors that is walked with a cursor and
+    reshuffled once it has been used up.
+
+    ensure_loaded() compares the copy with the `data_versions` counters
+    before every read and reloads it when another worker (or a script)
+    changed `professors`, so each worker serves the same ranking.
+    """
+
+    def __init__(self, size=15, rng=None):
+        self.size = size
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._rows = {}
+        self._ranked = []
+        self._unrated = set()
+        self._reservoir = []
+        self._cursor = 0
+        self._versions = {}
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def build(self, rows, versions=None):
+        rows = {row['id']: {field: row[field] for field in FIELDS} for row in rows}
+        ranked = sorted((-row['Avg_rating'], prof_id) for prof_id, row in rows.items() if row['no_ratings'] > 0)
+        unrated = {prof_id for prof_id, row in rows.items() if row['no_ratings'] == 0}
+        reservoir = list(unrated)
+        self._rng.shuffle(reservoir)
+
+        with self._lock:
+            self._rows = rows
+            self._ranked = ranked
+            self._unrated = unrated
+            self._reservoir = reservoir
+            self._cursor = 0
+            self._versions = versions or {}
+            self._loaded = True
+
+    def refresh(self, conn, versions=None):
+        # Counters first, as in ProfessorSearchIndex.refresh()
+        versions = data_versions(conn) if versions is None else versions
+        self.build(conn.execute(f'SELECT {", ".join(FIELDS)} FROM professors').fetchall(), versions)
+
+    def refresh_ratings(self, conn, versions):
+        with self._lock:
+            rows = {prof_id: dict(row) for prof_id, row in self._rows.items()}
+        for prof_id, avg_rating, no_ratings in conn.execute('SELECT id, Avg_rating, no_ratings FROM professors'):
+            if prof_id in rows:
+                rows[prof_id].update(Avg_rating=avg_rating, no_ratings=no_ratings)
+        self.build(rows.values(), versions)
+
+    def ensure_loaded(self, connect):
+        conn = connect()
+        versions = data_versions(conn)
+        if self._loaded and self._versions == versions:
+            return
+        if not self._loaded or self._versions.get('professors') != versions.get('professors'):
+            self.refresh(conn, versions)
+        else:
+            self.refresh_ratings(conn, versions)
+
+    def record_rating(self, prof_id, avg_rating, no_ratings, version=None):
+        """Apply a rating this process just wrote; `version` as in
+        ProfessorSearchIndex.update_rating()."""
+        with self._lock:
+            if version is not None and self._versions.get('professor_ratings') == version - 1:
+                self._versions = {**self._versions, 'professor_ratings': version}
+            row = self._rows.get(prof_id)
+            if row is None:
+                return
+
+            if row['no_ratings'] > 0:
+                old_key = (-row['Avg_rating'], prof_id)
+                i = bisect_left(self._ranked, old_key)
+                if i < len(self._ranked) and self._ranked[i] == old_key:
+                    del self._ranked[i]
+
+            row['Avg_rating'] = avg_rating
+            row['no_ratings'] = no_ratings
+            if no_ratings > 0:
+                insort(self._ranked, (-avg_rating, prof_id))
+                # Left in the reservoir; _draw_unrated() skips it from now on.
+                self._unrated.discard(prof_id)
+            else:
+                self._unrated.add(prof_id)
+                self._reservoir.append(prof_id)
+
+    def _draw_unrated(self, count):
+        picked = []
+        scanned = 0
+        while len(picked) < count and scanned < len(self._reservoir):
+            if self._cursor >= len(self._reservoir):
+                self._reservoir = [prof_id for prof_id in self._reservoir if prof_id in self._unrated]
+                self._rng.shuffle(self._reservoir)
+                self._cursor = 0
+                scanned = 0
+                if not self._reservoir:
+                    break
+            prof_id = self._reservoir[self._cursor]
+            self._cursor += 1
+            scanned += 1
+            if prof_id in self._unrated and prof_id not in picked:
+                picked.append(prof_id)
+        return picked
+
+    def top(self):
+        with self._lock:
+            ids = [prof_id for _, prof_id in self._ranked[:self.size]]
+            if len(ids) < self.size:
+                ids += self._draw_unrated(self.size - len(ids))
+            return [dict(self._rows[prof_id]) for prof_id in ids]
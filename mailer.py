@@ -0,0 +1,183 @@
+import os
+import queue
+import smtplib
+import threading
+import time
+
+
+class MailDispatcher:
+    """Sends mail from background threads over long-lived SMTP sessions.
+
+    submit() only enqueues, so request threads never wait on the network.
+    Each worker keeps one authenticated session open, sends whatever is
+    queued in batches of up to `batch_size`, reconnects when the server drops
+    the session and retries a failed message with exponential backoff.
+    Threads are started on first use in each process, so the dispatcher is
+    safe to create before gunicorn forks.  Delivery times and failures are
+    reported to `metrics`, if given.
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_tls=True,
+                 workers=2, queue_size=1000, batch_size=20, max_retries=3,
+                 backoff=1.0, idle_timeout=60.0, smtp_factory=smtplib.SMTP, metrics=None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.smtp_factory = smtp_factory
+        self.metrics = metrics
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self._stopping = threading.Event()
+        self.stats = {
+            'queued': 0,
+            'dropped': 0,       # queue full at submit()
+            'sent': 0,
+            'failed': 0,        # gave up after max_retries
+            'retries': 0,
+            'connects': 0,
+            'batches': 0,
+            'send_seconds': 0.0,
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid() and self._threads:
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._threads = [
+                threading.Thread(target=self._run, name=f'mailer-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=10.0):
+        """Let the workers drain the queue, then close their sessions."""
+        self._stopping.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def submit(self, msg, on_done=None):
+        """Queue `msg`; False if the queue is full.  `on_done()` is called
+        once it has been sent or given up on."""
+        self.start()
+        try:
+            self._queue.put_nowait((msg, on_done))
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('queued')
+        return True
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['pending'] = self.pending()
+        return stats
+
+    # ---- worker side ----
+
+    def _connect(self):
+        server = self.smtp_factory(self.host, self.port, timeout=30)
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._count('connects')
+        return server
+
+    def _close(self, server):
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _next_batch(self):
+        try:
+            first = self._queue.get(timeout=min(self.idle_timeout, 1.0))
+        except queue.Empty:
+            return []
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _deliver(self, server, msg):
+        """Send one message, reconnecting and backing off on failure."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                if server is None:
+                    server = self._connect()
+                start = time.perf_counter()
+                server.send_message(msg)
+                elapsed = time.perf_counter() - start
+                self._count('send_seconds', elapsed)
+                if self.metrics is not None:
+                    self.metrics.observe_span('smtp_send_message', elapsed)
+                self._count('sent')
+                return server
+            except (smtplib.SMTPException, OSError) as e:
+                self._close(server)
+                server = None
+                if attempt == self.max_retries:
+                    self._count('failed')
+                    if self.metrics is not None:
+                        self.metrics.error('smtp_send_message')
+                    print(f"Failed to send mail to {msg['To']}: {e}")
+                    return None
+                self._count('retries')
+                time.sleep(self.backoff * (2 ** attempt))
+        return server
+
+    def _run(self):
+        server = None
+        last_used = time.monotonic()
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                if self._stopping.is_set():
+                    break
+                if server is not None and time.monotonic() - last_used > self.idle_timeout:
+                    self._close(server)
+                    server = None
+                continue
+
+            self._count('batches')
+            for msg, on_done in batch:
+                server = self._deliver(server, msg)
+                if on_done is not None:
+                    try:
+                        on_done()
+                    except Exception as e:
+                        print(f"Mail callback failed: {e}")
+                self._queue.task_done()
+            last_used = time.monotonic()
+        self._close(server)
@@ -1,38 +1,184 @@
-from flask import Flask, jsonify, render_template, request, redirect, url_for, session, flash
+from flask import Flask, Response, abort, jsonify, make_response, render_template, request, redirect, url_for, session, flash
+import hmac
 import sqlite3
 import random
 import os
 import re
 from datetime import datetime
-import cv2
-import pytesseract
-import numpy as np
 import re
-import difflib
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
+from werkzeug.middleware.proxy_fix import ProxyFix
+import db
+from db import get_db
+from search_index import ProfessorSearchIndex
+from leaderboard import Leaderboard
+from mailer import MailDispatcher
+from otp_store import MemoryOTPStore, SQLiteOTPStore
+from ocr_jobs import OCRJobQueue
+from ocr_cache import OCRResultCache, content_key, perceptual_key
+from uploads import UploadIngestor, UploadRejected
+from credentials import HasherBusy, PasswordHasher
+from metrics import Metrics
+from account_deletion import AccountDeleter
+from rating_reconciler import RatingReconciler
+from rate_limit import AdmissionGate, MemoryBucketBackend, RateLimiter, SQLiteBucketBackend, parse_costs
+import account_deletion
+import community_feed
+import migrations
+import professor_reviews
+import queries
+import rating_stats
+import text_search
+from pagination import canonical_cursor, decode_cursor
+from response_cache import MemoryCacheBackend, ResponseCache, SQLiteCacheBackend
 
 
-
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-
 app = Flask(__name__)
-app.secret_key = 'your_secret_key_here'
+# Settings from the environment, see config.py; wsgi.py picks ProductionConfig
+app.config.from_object(os.getenv('APP_CONFIG', 'config.Config'))
+# Behind a proxy every request comes from its address; the rate limits, the
+# /metrics check and url_for() need the client's (see gunicorn.conf.py)
+if app.config['TRUSTED_PROXY_HOPS']:
+    hops = app.config['TRUSTED_PROXY_HOPS']
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+
+# Per-route latency, SQL timings by statement and spans, scraped from /metrics;
+# set SLOW_REQUEST_MS to log slow requests with their statement breakdown
+SLOW_REQUEST_MS = os.getenv('SLOW_REQUEST_MS')
+metrics = Metrics(slow_request_seconds=float(SLOW_REQUEST_MS) / 1000 if SLOW_REQUEST_MS else None)
+metrics.init_app(app)
+db.init_app(app, observer=metrics.observe_query if os.getenv('SQL_TIMING', '1') == '1' else None)
 
 load_dotenv()
 EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASS = os.getenv("EMAIL_PASS")
 
-
-otp_storage = {}  # Temporarily store OTPs
-
-
-def get_db_connection():
-    conn = sqlite3.connect('database.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+# OTP mails go out from background threads over a reused SMTP session
+mailer = MailDispatcher(
+    os.getenv("SMTP_HOST", "smtp.gmail.com"),
+    int(os.getenv("SMTP_PORT", "587")),
+    EMAIL_USER,
+    EMAIL_PASS,
+    use_tls=os.getenv("SMTP_STARTTLS", "1") == "1",
+    workers=int(os.getenv("MAIL_WORKERS", "2")),
+    metrics=metrics,
+)
+
+
+# Pending registrations; the SQLite backend is shared by every worker process
+OTP_TTL = int(os.getenv("OTP_TTL", "600"))
+if os.getenv("OTP_STORE", "sqlite") == "memory":
+    otp_storage = MemoryOTPStore(ttl=OTP_TTL)
+else:
+    otp_storage = SQLiteOTPStore(db.get_pool(app), ttl=OTP_TTL)
+
+# Passwords are hashed with a KDF on a bounded thread pool; the cost is tunable
+passwords = PasswordHasher(
+    scheme=os.getenv("PASSWORD_SCHEME", "scrypt"),
+    scrypt_n=int(os.getenv("SCRYPT_N", str(2 ** 14))),
+    pbkdf2_iterations=int(os.getenv("PBKDF2_ITERATIONS", "600000")),
+    workers=int(os.getenv("PASSWORD_WORKERS", "2")),
+    max_pending=int(os.getenv("PASSWORD_MAX_PENDING", "32")),
+)
+
+# Screenshots are size- and header-checked before anything decodes them
+uploads = UploadIngestor(max_bytes=app.config['UPLOAD_MAX_BYTES'])
+
+# Attendance OCR runs in a process pool with a bounded number of pending jobs;
+# results are cached by upload hash so re-uploads skip Tesseract
+ocr_cache = OCRResultCache(
+    pool=db.get_pool(app) if os.getenv("OCR_CACHE_SHARED", "1") == "1" else None,
+)
+OCR_CACHE_PERCEPTUAL = os.getenv("OCR_CACHE_PERCEPTUAL", "0") == "1"
+ocr_jobs = OCRJobQueue(
+    db.get_pool(app),
+    max_workers=int(os.getenv("OCR_WORKERS", "2")),
+    max_pending=int(os.getenv("OCR_MAX_PENDING", "16")),
+    cache=ocr_cache,
+    metrics=metrics,
+)
+professor_index = ProfessorSearchIndex()  # Built on first search, see index()
+leaderboard = Leaderboard(size=15)  # Top rated professors, kept current by submit_rating()
+
+# Rendered read-only pages; the write routes invalidate them by tag
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "sqlite")
+response_cache = ResponseCache(
+    MemoryCacheBackend() if RESPONSE_CACHE == "memory" else SQLiteCacheBackend(db.get_pool(app)),
+    default_ttl=int(os.getenv("RESPONSE_CACHE_TTL", "300")),
+    enabled=RESPONSE_CACHE != "off",
+)
+
+
+def apply_rating_corrections(discrepancies):
+    for discrepancy in discrepancies:
+        prof_id = discrepancy['professor_id']
+        professor_index.update_rating(prof_id, discrepancy['avg_rating'][1])
+        leaderboard.record_rating(prof_id, discrepancy['avg_rating'][1], discrepancy['no_ratings'][1])
+    response_cache.invalidate('professors', *(f"professor:{d['professor_id']}" for d in discrepancies))
+
+
+# Professors whose ratings were deleted or changed outside submit_rating()
+# are recomputed in the background; RATING_RECONCILE_INTERVAL=0 leaves it to
+# `python rating_stats.py --reconcile`
+rating_reconciler = RatingReconciler(
+    db.get_pool(app),
+    interval=float(os.getenv("RATING_RECONCILE_INTERVAL", "300")),
+    on_change=apply_rating_corrections,
+    metrics=metrics,
+)
+app.before_request(rating_reconciler.start)
+
+
+def account_deleted(email, professor_ids):
+    response_cache.invalidate('professors', 'community', *(f'professor:{prof_id}' for prof_id in professor_ids))
+    # The ratings triggers marked the professors this user rated
+    rating_reconciler.wake()
+
+
+# delete_account() removes the login at once; ratings, reviews and community
+# content follow in short chunks from a background thread
+account_deleter = AccountDeleter(
+    db.get_pool(app),
+    chunk_rows=int(os.getenv("ACCOUNT_DELETE_CHUNK", "500")),
+    on_done=account_deleted,
+    metrics=metrics,
+)
+app.before_request(account_deleter.start)
+
+
+# Forms refused by the rate limiter or an admission gate are shown again with
+# the reason flashed; other routes get JSON.  Both answer 429 with Retry-After.
+LIMITED_PAGES = {'index': 'index.html', 'register': 'register.html', 'upload_attendance': 'upload.html'}
+
+
+def too_many_requests(retry_after):
+    template = LIMITED_PAGES.get(request.endpoint)
+    if template is None:
+        response = jsonify({'error': 'too many requests', 'retry_after': retry_after})
+    else:
+        flash(f'Too many requests. Please try again in {retry_after} seconds.', 'danger')
+        response = make_response(render_template(template, professors=[]))
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+# A token bucket per signed-in user (or address) that the expensive routes
+# draw on by cost; the SQLite backend makes the limit hold across workers
+RATE_LIMIT = os.getenv("RATE_LIMIT", "sqlite")
+rate_limiter = RateLimiter(
+    MemoryBucketBackend() if RATE_LIMIT == "memory" else SQLiteBucketBackend(db.get_pool(app)),
+    capacity=float(os.getenv("RATE_LIMIT_CAPACITY", "30")),
+    refill_per_second=float(os.getenv("RATE_LIMIT_REFILL", "0.5")),
+    costs=parse_costs(os.getenv("RATE_LIMIT_COSTS", "search=1,register=10,attendance=5")),
+    on_limited=too_many_requests,
+    enabled=RATE_LIMIT != "off",
+)
+
+# OCR jobs and OTP mails in flight across all workers; past these, new ones
+# are refused at once rather than queued
+ocr_admission = AdmissionGate(db.get_pool(app), 'ocr', limit=int(os.getenv("OCR_MAX_CONCURRENT", "4")))
+smtp_admission = AdmissionGate(db.get_pool(app), 'smtp', limit=int(os.getenv("SMTP_MAX_CONCURRENT", "8")))
 
 
 def is_logged_in():
@@ -40,7 +186,12 @@ def is_logged_in():
 
 
 # -------------------- Registration with OTP --------------------
-def send_otp_email(recipient_email, otp):
+@metrics.timed('send_otp_email')
+def send_otp_email(recipient_email, otp, on_done=None):
+    # The email package is loaded with the first registration
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
+
     subject = "Your OTP for Registration"
     body = f"Your OTP is: {otp}. Please enter this to complete your registration."
 
@@ -51,16 +202,11 @@ def send_otp_email(recipient_email, otp):
 
     msg.attach(MIMEText(body, 'plain'))
 
-    try:
-        with smtplib.SMTP('smtp.gmail.com', 587) as server:
-            server.starttls()
-            server.login(EMAIL_USER, EMAIL_PASS)
-            server.send_message(msg)
-        print(f"OTP sent to {recipient_email}")
-    except Exception as e:
-        print(f"Failed to send OTP: {e}")
+    # Delivered (and retried) by the mailer threads; False if the queue is full
+    return mailer.submit(msg, on_done)
 
 @app.route('/register', methods=['GET', 'POST'])
+@rate_limiter.limit('register')
 def register():
     if request.method == 'POST':
         email = request.form['email']
@@ -75,29 +221,53 @@ def register():
             flash('Invalid email domain. Use @mahindrauniversity.edu.in email.')
             return redirect(url_for('register'))
 
-        conn = get_db_connection()
-        user = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
-        conn.close()
+        conn = get_db()
+        user = conn.execute(queries.USER_BY_EMAIL, (email,)).fetchone()
 
         if user:
             flash('Email already registered. Please login.')
             return redirect(url_for('login'))
+        if account_deletion.in_progress(conn, email):
+            flash('The account you deleted with this email is still being removed. Please try again in a minute.')
+            return redirect(url_for('register'))
 
-        otp = str(random.randint(100000, 999999))
-        otp_storage[email] = {
-            'otp': otp,
-            'data': {
-                'email': email,
-                'password': password,
-                'year': year,
-                'semester': semester,
-                'academic_year': academic_year,
-                'school': school,
-                'branch': branch
-            }
-        }
-
-        send_otp_email(email, otp)
+        # Held until the OTP mail has gone out
+        lease = smtp_admission.acquire()
+        if lease is None:
+            return too_many_requests(smtp_admission.retry_after())
+
+        try:
+            # Only the hash is kept, in the pending registration and then in users
+            try:
+                password_hash = passwords.hash(password)
+            except HasherBusy:
+                smtp_admission.release(lease)
+                flash('We are handling a lot of sign-ups right now. Please try again in a moment.')
+                return redirect(url_for('register'))
+
+            otp = str(random.randint(100000, 999999))
+            otp_storage.start_sweeper()
+            otp_storage.put(email, {
+                'otp': otp,
+                'data': {
+                    'email': email,
+                    'password': password_hash,
+                    'year': year,
+                    'semester': semester,
+                    'academic_year': academic_year,
+                    'school': school,
+                    'branch': branch
+                }
+            })
+
+            if not send_otp_email(email, otp, on_done=lambda: smtp_admission.release(lease)):
+                smtp_admission.release(lease)
+                metrics.error('send_otp_email')
+                flash('We could not send your OTP right now. Please try again in a minute.')
+                return redirect(url_for('register'))
+        except Exception:
+            smtp_admission.release(lease)
+            raise
         flash("OTP sent to your Mahindra University email. Please check your inbox.")
         return render_template('verify_otp.html', email=email)
 
@@ -109,9 +279,13 @@ def verify_otp():
     email = request.form['email']
     entered_otp = request.form['otp']
 
-    if email in otp_storage and otp_storage[email]['otp'] == entered_otp:
-        new_user = otp_storage[email]['data']
-        conn = get_db_connection()
+    pending = otp_storage.get(email)
+    if pending and pending['otp'] == entered_otp and otp_storage.pop(email):
+        new_user = pending['data']
+        conn = get_db()
+        if account_deletion.in_progress(conn, email):
+            flash('The account you deleted with this email is still being removed. Please try again in a minute.')
+            return redirect(url_for('register'))
         conn.execute('''
             INSERT INTO users (email, password, year, semester, academic_year, school, branch)
             VALUES (?, ?, ?, ?, ?, ?, ?)
@@ -120,8 +294,6 @@ def verify_otp():
             new_user['academic_year'], new_user['school'], new_user['branch']
         ))
         conn.commit()
-        conn.close()
-        del otp_storage[email]
 
         flash('Registration successful. Please log in.')
         return redirect(url_for('login'))
@@ -137,18 +309,37 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
 
-        conn = get_db_connection()
-        user = conn.execute('SELECT * FROM users WHERE email = ? AND password = ?', (username, password)).fetchone()
-        conn.close()
+        conn = get_db()
+        user = conn.execute(queries.USER_BY_EMAIL, (username,)).fetchone()
+        stored = user['password'] if user else None
 
-        if user:
-            session['email'] = user['email']
-            flash('Logged in successfully!', 'success')
-            return redirect(url_for('index'))
-        else:
+        try:
+            valid = passwords.verify(stored, password)
+        except HasherBusy:
+            flash('Too many people are logging in right now. Please try again in a moment.', 'danger')
+            return redirect(url_for('login'))
+
+        if not valid:
             flash('Invalid username or password', 'danger')
             return redirect(url_for('login'))
 
+        session['email'] = user['email']
+        if passwords.needs_rehash(stored):
+            # Plaintext rows (and hashes from older cost settings) are
+            # upgraded the first time their owner logs in.  Best effort: the
+            # password was right, so a busy hasher or database only means
+            # trying again at the next login.
+            try:
+                conn.execute('UPDATE users SET password = ? WHERE email = ? AND password = ?',
+                             (passwords.hash(password), user['email'], stored))
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print("Password upgrade failed:", e)
+                metrics.error('password_rehash')
+        flash('Logged in successfully!', 'success')
+        return redirect(url_for('index'))
+
     return render_template('login.html')
 
 
@@ -161,45 +352,21 @@ def logout():
 
 
 # -------------------- Home / Index --------------------
-from fuzzywuzzy import fuzz, process
-
 @app.route('/')
 @app.route('/index')
+@rate_limiter.limit('search', methods=('GET',), when=lambda: bool(request.args.get('query')))
+@response_cache.cached(tags=('professors',), unless=lambda: bool(request.args.get('query')), shows_flashes=True)
 def index():
     search_query = request.args.get('query', '').lower()
-    conn = get_db_connection()
-
-    # Fetch all professors
-    all_professors = conn.execute('SELECT * FROM professors').fetchall()
-    all_professors_list = [dict(row) for row in all_professors]
 
-    # Step 1: Exact Name Match First
     if search_query:
-        # Get exact matches first
-        exact_matches = [prof for prof in all_professors_list if search_query in prof['Name'].lower()]
-
-        # Step 2: If less than 15 exact matches, find close matches
-        if len(exact_matches) < 15:
-            names = [prof['Name'] for prof in all_professors_list]
-            matched_names = process.extract(search_query, names, limit=15, scorer=fuzz.partial_ratio)
-
-            # Get close matches that are not already in exact matches
-            matched_profs = exact_matches + [prof for prof in all_professors_list if prof['Name'] in [match[0] for match in matched_names] and prof not in exact_matches]
-        else:
-            matched_profs = exact_matches
+        # Exact name matches first, then close matches, served from the in-memory index
+        professor_index.ensure_loaded(get_db)
+        matched_profs = professor_index.search(search_query, limit=15)
     else:
         # If no search query, show top rated professors
-        rated = conn.execute('SELECT * FROM professors WHERE no_ratings > 0 ORDER BY Avg_rating DESC LIMIT 15').fetchall()
-        rated_list = [dict(row) for row in rated]
-        rated_count = len(rated_list)
-
-        if rated_count < 15:
-            needed = 15 - rated_count
-            unrated = conn.execute('SELECT * FROM professors WHERE no_ratings = 0 ORDER BY RANDOM() LIMIT ?', (needed,)).fetchall()
-            unrated_list = [dict(row) for row in unrated]
-            matched_profs = rated_list + unrated_list
-        else:
-            matched_profs = rated_list
+        leaderboard.ensure_loaded(get_db)
+        matched_profs = leaderboard.top()
 
     professors_list = [{
         'Name': prof['Name'],
@@ -209,7 +376,6 @@ def index():
         'id': prof['id']
     } for prof in matched_profs]
 
-    conn.close()
     return render_template('index.html', professors=professors_list)
 
 
@@ -217,37 +383,37 @@ def index():
 
 
 @app.route('/api/top-professors')
+@response_cache.cached(tags=('professors',), vary=lambda: 'all')
 def top_professors():
-    conn = get_db_connection()
-    rated = conn.execute('SELECT * FROM professors WHERE no_ratings > 0 ORDER BY Avg_rating DESC LIMIT 15').fetchall()
-    rated_list = [dict(row) for row in rated]
-    rated_count = len(rated_list)
-
-    if rated_count < 15:
-        needed = 15 - rated_count
-        unrated = conn.execute('SELECT * FROM professors WHERE no_ratings = 0 ORDER BY RANDOM() LIMIT ?', (needed,)).fetchall()
-        unrated_list = [dict(row) for row in unrated]
-        final_list = rated_list + unrated_list
-    else:
-        final_list = rated_list
-
-    result = [dict(prof) for prof in final_list]
-    conn.close()
-    return jsonify(result)
+    leaderboard.ensure_loaded(get_db)
+    return jsonify(leaderboard.top())
 
 
 # -------------------- Professor Profile Page --------------------
 @app.route('/professor/<name>')
 def professor_by_name(name):
-    conn = get_db_connection()
-    prof = conn.execute('SELECT * FROM professors WHERE Name = ?', (name,)).fetchone()
+    # Old name-based links; names are not unique, so the page itself is by id.
+    prof = get_db().execute(queries.PROFESSOR_ID_BY_NAME, (name,)).fetchone()
+
+    if not prof:
+        flash("Professor not found.")
+        return redirect(url_for('index'))
+
+    return redirect(url_for('professor_page', prof_id=prof['id']), code=301)
+
+
+@app.route('/professors/<int:prof_id>')
+@response_cache.cached(tags=lambda prof_id: (f'professor:{prof_id}',), shows_flashes=True,
+                       params={'before': canonical_cursor})
+def professor_page(prof_id):
+    conn = get_db()
+    prof = conn.execute(queries.PROFESSOR_BY_ID, (prof_id,)).fetchone()
 
     if not prof:
         flash("Professor not found.")
-        conn.close()
         return redirect(url_for('index'))
 
-    reviews = conn.execute('SELECT * FROM reviews WHERE professor_id = ? ORDER BY timestamp DESC', (prof['id'],)).fetchall()
+    reviews, next_cursor = professor_reviews.fetch_reviews(conn, prof_id, decode_cursor(request.args.get('before')))
 
     professor_info = {
         'id': prof['id'],
@@ -256,48 +422,114 @@ def professor_by_name(name):
         'Photo': prof['Photo'],
         'Avg_rating': prof['Avg_rating'],
         'No_ratings': prof['no_ratings'],
+        'No_reviews': prof['review_count'],
         'Profile_link': prof['Profile']
     }
 
-    conn.close()
-    return render_template('professor.html', professor=professor_info, reviews=reviews)
+    return render_template('professor.html', professor=professor_info, reviews=reviews, next_cursor=next_cursor,
+                           rating_stats=rating_stats.load(conn, prof_id))
+
+
+@app.route('/api/professors/<int:prof_id>/reviews')
+def professor_reviews_api(prof_id):
+    conn = get_db()
+    prof = conn.execute(queries.PROFESSOR_REVIEW_COUNTERS, (prof_id,)).fetchone()
+    if not prof:
+        return jsonify({'error': 'professor not found'}), 404
+
+    cursor = request.args.get('before')
+    etag = professor_reviews.reviews_etag(prof, cursor)
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        reviews, next_cursor = professor_reviews.fetch_reviews(conn, prof_id, decode_cursor(cursor))
+        response = jsonify({
+            'professor_id': prof_id,
+            'review_count': prof['review_count'],
+            'reviews': reviews,
+            'next_cursor': next_cursor,
+        })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 
 #----route for uploading the attendance
+def apply_attendance_result(percentage):
+    """Store an OCR result in the session and return where to send the user."""
+    if percentage is None:
+        flash("Could not extract a valid attendance percentage.", 'danger')
+        return url_for('upload_attendance')
+
+    session['attendance'] = percentage
+    if percentage >= 75:
+        flash(f'Attendance verified: {percentage}%', 'success')
+        return url_for('index')
+    else:
+        flash(f'Attendance too low ({percentage}%). Must be at least 75%.', 'danger')
+        return url_for('upload_attendance')
+
+
 @app.route('/upload_attendance', methods=['GET', 'POST'])
+@rate_limiter.limit('attendance')
 def upload_attendance():
     if request.method == 'POST':
         file = request.files['image']
         if file:
-            image_bytes = file.read()
-            percentage = extract_attendance_percentage(image_bytes)
-
             try:
-                percentage = float(percentage)
-                session['attendance'] = percentage
-                if percentage >= 75:
-                    flash(f'Attendance verified: {percentage}%', 'success')
-                    return redirect(url_for('index'))
-                else:
-                    flash(f'Attendance too low ({percentage}%). Must be at least 75%.', 'danger')
-                    return redirect(url_for('upload_attendance'))
-            except ValueError:
-                flash("Could not extract a valid attendance percentage.", 'danger')
+                image_bytes = uploads.read(file)
+            except UploadRejected as e:
+                flash(str(e), 'danger')
                 return redirect(url_for('upload_attendance'))
 
+            # Re-uploads of a screenshot we have already read skip OCR entirely
+            cache_keys = [content_key(image_bytes)]
+            if OCR_CACHE_PERCEPTUAL:
+                cache_keys.append(perceptual_key(image_bytes, session.get('email', request.remote_addr)))
+            cached = ocr_cache.get(cache_keys)
+            if cached is not None:
+                return redirect(apply_attendance_result(cached['percentage']))
+
+            # OCR runs in the process pool; the page polls attendance_status()
+            lease = ocr_admission.acquire()
+            if lease is None:
+                return too_many_requests(ocr_admission.retry_after())
+            try:
+                job_id = ocr_jobs.submit(image_bytes, cache_keys, on_done=lambda: ocr_admission.release(lease))
+            except Exception:
+                ocr_admission.release(lease)
+                raise
+            if job_id is None:
+                ocr_admission.release(lease)
+                return too_many_requests(ocr_admission.retry_after())
+
+            session['ocr_job'] = job_id
+            return render_template('upload.html', job_id=job_id)
+
     return render_template('upload.html')
 
-def extract_attendance_percentage(image_bytes):
-    npimg = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(npimg, cv2.IMREAD_COLOR)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    _, thresh = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY)
-    text = pytesseract.image_to_string(thresh)
 
-    match = re.search(r'(\d+)\s*/\s*(\d+)\s*=\s*(\d+(\.\d+)?)', text)
-    if match:
-        return float(match.group(3))
-    return "Could not extract attendance percentage."
+@app.errorhandler(413)
+def upload_too_large(e):
+    flash(f"Screenshots must be under {uploads.max_bytes // (1024 * 1024)}MB.", 'danger')
+    return redirect(url_for('upload_attendance'))
+
+
+@app.route('/upload_attendance/status/<job_id>')
+def attendance_status(job_id):
+    if session.get('ocr_job') != job_id:
+        return jsonify({'status': 'unknown'}), 404
+
+    job = ocr_jobs.status(job_id)
+    if job is None:
+        session.pop('ocr_job', None)
+        return jsonify({'status': 'unknown'}), 404
+    if job['status'] in ('queued', 'running'):
+        return jsonify({'status': job['status']})
+
+    session.pop('ocr_job', None)
+    return jsonify({'status': job['status'], 'redirect': apply_attendance_result(job['percentage'])})
+
 
 # -------------------- Rating Submission --------------------
 @app.route('/questionnaire/<int:prof_id>')
@@ -323,52 +555,31 @@ def submit_rating(prof_id):
         flash("You must be logged in to submit a rating.")
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    professor = cursor.execute('SELECT * FROM professors WHERE id = ?', (prof_id,)).fetchone()
+    conn = get_db()
+    professor = conn.execute(queries.PROFESSOR_EXISTS, (prof_id,)).fetchone()
     if professor is None:
         flash("Professor not found.")
-        conn.close()
         return redirect(url_for('index'))
 
     try:
         # Collect rating components
-        teaching_effectiveness = [
-            int(request.form['explain_concepts']),
-            int(request.form['clear_lectures']),
-            int(request.form['encourages_participation']),
-            int(request.form['responsiveness'])
-        ]
-        course_content_materials = [
-            int(request.form['helpful_materials']),
-            int(request.form['manageable_workload']),
-            int(request.form['fair_grading'])
-        ]
-        overall_rating = int(request.form['overall_rating'])
-        comment = request.form.get('comment', '').strip()
-
-        # Compute weighted average
-        teaching_avg = sum(teaching_effectiveness) / len(teaching_effectiveness)
-        content_avg = sum(course_content_materials) / len(course_content_materials)
-        weighted_avg = (teaching_avg * 0.4) + (content_avg * 0.3) + (overall_rating * 0.3)
-        weighted_avg = round(weighted_avg, 2)
-
-        # Update professor's overall rating stats
-        old_no_ratings = professor['no_ratings']
-        old_avg_rating = professor['Avg_rating']
-        new_no_ratings = old_no_ratings + 1
-        new_avg_rating = ((old_avg_rating * old_no_ratings) + weighted_avg) / new_no_ratings
-        new_avg_rating = round(new_avg_rating, 2)
-
-        cursor.execute('''
-            UPDATE professors
-            SET Avg_rating = ?, no_ratings = ?
-            WHERE id = ?
-        ''', (new_avg_rating, new_no_ratings, prof_id))
-
-        # Save rating to 'ratings' table
-        cursor.execute('''
+        scores = {item: int(request.form[item]) for item in rating_stats.ITEMS}
+        if not all(1 <= score <= 5 for score in scores.values()):
+            raise ValueError(f"rating out of range: {scores}")
+    except (KeyError, ValueError) as e:
+        print("Invalid rating submission:", e)
+        flash("Please answer every question with a rating from 1 to 5.", "danger")
+        return redirect(url_for('questionnaire', prof_id=prof_id))
+    comment = request.form.get('comment', '').strip()
+
+    # Compute weighted average from the raw scores
+    teaching_avg = sum(scores[item] for item in rating_stats.TEACHING_ITEMS) / len(rating_stats.TEACHING_ITEMS)
+    content_avg = sum(scores[item] for item in rating_stats.CONTENT_ITEMS) / len(rating_stats.CONTENT_ITEMS)
+    weighted_avg = round(rating_stats.weighted_rating(scores), 2)
+
+    def save_rating(conn):
+        # Save rating to 'ratings' table, every item as answered
+        conn.execute(f'''
             INSERT INTO ratings (
                 professor_id,
                 user_email,
@@ -377,30 +588,48 @@ def submit_rating(prof_id):
                 overall_rating,
                 rating,
                 comment,
-                timestamp
+                timestamp,
+                {', '.join(rating_stats.TEACHING_ITEMS + rating_stats.CONTENT_ITEMS)}
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             prof_id,
             session['email'],
-            int(teaching_avg),
-            int(content_avg),
-            overall_rating,
+            teaching_avg,
+            content_avg,
+            scores[rating_stats.OVERALL_ITEM],
             weighted_avg,
             comment,
-            datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            *(scores[item] for item in rating_stats.TEACHING_ITEMS + rating_stats.CONTENT_ITEMS)
         ))
 
-        conn.commit()
-        flash("Your rating has been submitted successfully!", "success")
+        # Exact per-item aggregates; Avg_rating is recomputed from their sums
+        # by a single UPDATE, never from values read earlier in Python
+        new_avg_rating, new_no_ratings = rating_stats.record(conn, prof_id, scores, weighted_avg)
+        # The counter that UPDATE bumped, read under the same write lock
+        return new_avg_rating, new_no_ratings, db.data_versions(conn)['professor_ratings']
 
+    try:
+        # BEGIN IMMEDIATE, retried with backoff if the write lock is busy
+        new_avg_rating, new_no_ratings, ratings_version = db.get_pool().run_immediate(conn, save_rating)
+    except sqlite3.OperationalError as e:
+        print("Database busy during rating submission:", e)
+        metrics.error('submit_rating_busy')
+        flash("The site is busy right now and your rating was not saved. Please try again.", "danger")
+        return redirect(url_for('professor_page', prof_id=prof_id))
     except Exception as e:
         print("Error during rating submission:", e)
+        metrics.error('submit_rating')
         flash("An error occurred while submitting your rating.", "danger")
-    finally:
-        conn.close()
+        return redirect(url_for('professor_page', prof_id=prof_id))
 
-    return redirect(url_for('professor_by_name', name=professor['Name']))
+    response_cache.invalidate('professors', f'professor:{prof_id}')
+    professor_index.update_rating(prof_id, new_avg_rating, ratings_version)
+    leaderboard.record_rating(prof_id, new_avg_rating, new_no_ratings, ratings_version)
+    flash("Your rating has been submitted successfully!", "success")
+
+    return redirect(url_for('professor_page', prof_id=prof_id))
 
 
 # -------------------- Review Submission --------------------
@@ -420,9 +649,8 @@ def write_review(professor_id):
         return redirect(url_for('index'))  # Prevent review if attendance is below 75%
 
     # Fetch professor info for the page
-    conn = get_db_connection()
-    professor = conn.execute('SELECT * FROM professors WHERE id = ?', (professor_id,)).fetchone()
-    conn.close()
+    conn = get_db()
+    professor = conn.execute(queries.PROFESSOR_BY_ID, (professor_id,)).fetchone()
 
     if professor is None:
         flash("Professor not found.")
@@ -443,11 +671,11 @@ def submit_review(professor_id):
         review_text = request.form['review_text']
         user_email = session['email']
 
-        conn = get_db_connection()
+        conn = get_db()
         cursor = conn.cursor()
 
         # Fetch professor info
-        cursor.execute("SELECT Name FROM professors WHERE id = ?", (professor_id,))
+        cursor.execute(queries.PROFESSOR_NAME, (professor_id,))
         prof = cursor.fetchone()
         if not prof:
             flash('Professor not found.', 'danger')
@@ -464,10 +692,10 @@ def submit_review(professor_id):
         ''', (user_email, professor_id, professor_name, review_text, datetime.now()))
 
         conn.commit()
-        conn.close()
+        response_cache.invalidate(f'professor:{professor_id}')
 
         flash('Your review has been submitted!', 'success')
-        return redirect(url_for('professor_by_name', name=professor_name))
+        return redirect(url_for('professor_page', prof_id=professor_id))
 
     # If GET request, show the review form
     return render_template('write_review.html', professor_id=professor_id)
@@ -479,34 +707,12 @@ def profile():
     if not is_logged_in():
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
+    conn = get_db()
     user_email = session['email']
-    user = conn.execute('SELECT * FROM users WHERE email = ?', (user_email,)).fetchone()
-    ratings = conn.execute(''' 
-        SELECT 
-            r.teaching_rating, 
-            r.content_rating, 
-            r.overall_rating, 
-            r.rating, 
-            r.comment, 
-            r.timestamp, 
-            p.Name AS professor_name, 
-            p.id AS professor_id 
-        FROM ratings r
-        JOIN professors p ON r.professor_id = p.id
-        WHERE r.user_email = ?
-        ORDER BY r.timestamp DESC
-    ''', (user_email,)).fetchall()
-
-    reviews = conn.execute('''
-        SELECT rv.review_text, rv.timestamp, p.Name AS professor_name, p.id AS professor_id
-        FROM reviews rv
-        JOIN professors p ON rv.professor_id = p.id
-        WHERE rv.user_email = ?
-        ORDER BY rv.timestamp DESC
-    ''', (user_email,)).fetchall()
-
-    conn.close()
+    user = conn.execute(queries.USER_BY_EMAIL, (user_email,)).fetchone()
+    ratings = conn.execute(queries.USER_RATINGS, (user_email,)).fetchall()
+    reviews = conn.execute(queries.USER_REVIEWS, (user_email,)).fetchall()
+
 
     return render_template('profile.html', user=user, ratings=ratings, reviews=reviews)
 
@@ -520,13 +726,12 @@ def join_community():
         return redirect('/login')
 
     email = session['email']
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor()
 
     # Check if user already has a community username
-    existing_user = cursor.execute("SELECT * FROM community_users WHERE email = ?", (email,)).fetchone()
+    existing_user = cursor.execute(queries.COMMUNITY_USER_BY_EMAIL, (email,)).fetchone()
     if existing_user:
-        conn.close()
         flash('You already have a community username.')
         return redirect('/community')
 
@@ -534,20 +739,17 @@ def join_community():
         username = request.form['username'].strip()
 
         # Check if username is taken
-        taken = cursor.execute("SELECT * FROM community_users WHERE username = ?", (username,)).fetchone()
+        taken = cursor.execute(queries.COMMUNITY_USER_BY_USERNAME, (username,)).fetchone()
         if taken:
-            conn.close()
             flash('Username already taken. Please choose another.')
             return redirect('/join_community')
 
         # Save the new community user
         cursor.execute("INSERT INTO community_users (email, username) VALUES (?, ?)", (email, username))
         conn.commit()
-        conn.close()
         flash('Welcome to the community!')
         return redirect('/community')
 
-    conn.close()
     return render_template('join_community.html')
 
 
@@ -558,14 +760,13 @@ def community():
         return redirect('/login')
 
     email = session['email']
-    conn = get_db_connection()
+    conn = get_db()
     cursor = conn.cursor()
 
     # Fetch the username from the community_users table
-    user = cursor.execute("SELECT username FROM community_users WHERE email = ?", (email,)).fetchone()
+    user = cursor.execute(queries.COMMUNITY_USERNAME, (email,)).fetchone()
 
     if not user:
-        conn.close()
         flash("You must join the community first.")
         return redirect('/join_community')
 
@@ -579,27 +780,41 @@ def community():
             (username, message)
         )
         conn.commit()
+        response_cache.invalidate('community')
 
-    # Fetch all posts
-    posts = cursor.execute('SELECT * FROM community_posts ORDER BY timestamp DESC').fetchall()
-    all_replies = cursor.execute('SELECT * FROM community_replies ORDER BY timestamp ASC').fetchall()
-    conn.close()
-
-    # Group replies by post_id
-    post_reply_map = {}
-    for reply in all_replies:
-        post_id = reply['post_id']
-        post_reply_map.setdefault(post_id, []).append(reply)
-
-    # Attach replies to their respective posts
-    enriched_posts = []
-    for post in posts:
-        enriched_posts.append({
-            **dict(post),
-            'replies': post_reply_map.get(post['id'], [])
-        })
+    # One page of posts, each with its first few replies
+    before = decode_cursor(request.args.get('before'))
+    posts, next_cursor = community_feed.fetch_posts(conn, before)
+    community_feed.attach_replies(conn, posts)
+
+    return render_template('community.html', username=username, posts=posts, next_cursor=next_cursor,
+                           replies_per_post=community_feed.REPLIES_PER_POST)
+
+
+@app.route('/api/community/posts')
+@response_cache.cached(tags=('community',), vary=lambda: 'all', unless=lambda: not is_logged_in(),
+                       params={'before': canonical_cursor})
+def community_posts_api():
+    if 'email' not in session:
+        return jsonify({'error': 'login required'}), 401
 
-    return render_template('community.html', username=username, posts=enriched_posts)
+    conn = get_db()
+    before = decode_cursor(request.args.get('before'))
+    posts, next_cursor = community_feed.fetch_posts(conn, before)
+    community_feed.attach_replies(conn, posts)
+    html = render_template('_community_posts.html', posts=posts, replies_per_post=community_feed.REPLIES_PER_POST)
+    return jsonify({'posts': posts, 'next_cursor': next_cursor, 'html': html})
+
+
+@app.route('/api/community/posts/<int:post_id>/replies')
+@response_cache.cached(tags=('community',), vary=lambda: 'all', unless=lambda: not is_logged_in())
+def community_thread(post_id):
+    if 'email' not in session:
+        return jsonify({'error': 'login required'}), 401
+
+    thread, count = community_feed.fetch_thread(get_db(), post_id)
+    html = render_template('_community_posts.html', thread=thread, post_id=post_id)
+    return jsonify({'post_id': post_id, 'reply_count': count, 'replies': thread, 'html': html})
 
 
 
@@ -612,12 +827,11 @@ def reply():
 
     email = session['email']  # Get email from the session
     username = session.get('username')
+    conn = get_db()
 
     # If username is not in session, fetch from DB
     if not username:
-        conn = get_db_connection()
-        user = conn.execute('SELECT username FROM community_users WHERE email = ?', (email,)).fetchone()
-        conn.close()
+        user = conn.execute(queries.COMMUNITY_USERNAME, (email,)).fetchone()
 
         if user:
             username = user['username']
@@ -633,7 +847,6 @@ def reply():
     if parent_reply_id == '' or parent_reply_id is None:
         parent_reply_id = None
 
-    conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute(
         '''
@@ -643,11 +856,113 @@ def reply():
         (post_id, parent_reply_id, username, message)
     )
     conn.commit()
-    conn.close()
+    response_cache.invalidate('community')
 
     return redirect('/community')
 
+
+# -------------------- Full-text Search --------------------
+@app.route('/api/search/<scope>')
+@rate_limiter.limit('search', methods=('GET',))
+def search_api(scope):
+    # ?q=words "a phrase" prefix*  &page=N; scope is reviews, posts or replies
+    if scope not in text_search.SCOPES:
+        return jsonify({'error': 'unknown search scope'}), 404
+    if scope != 'reviews' and 'email' not in session:
+        return jsonify({'error': 'login required'}), 401
+
+    query = request.args.get('q', '')
+    if text_search.match_query(query) is None:
+        return jsonify({'error': 'query required'}), 400
+    results, next_page = text_search.search(get_db(), scope, query, request.args.get('page', 1, type=int))
+    return jsonify({'results': results, 'next_page': next_page})
+
+
+def metrics_allowed():
+    # Internal pool, queue and limiter state is not for the public
+    token = app.config.get('METRICS_TOKEN')
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    if not metrics_allowed():
+        abort(404)
+    text = metrics.render({
+        'db_pool': db.get_pool().snapshot,
+        'ocr_jobs': ocr_jobs.snapshot,
+        'ocr_cache': ocr_cache.snapshot,
+        'uploads': uploads.snapshot,
+        'mailer': mailer.snapshot,
+        'passwords': passwords.snapshot,
+        'response_cache': response_cache.snapshot,
+        'rating_reconciler': rating_reconciler.snapshot,
+        'account_deleter': account_deleter.snapshot,
+        'rate_limiter': rate_limiter.snapshot,
+        'ocr_admission': ocr_admission.snapshot,
+        'smtp_admission': smtp_admission.snapshot,
+    })
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+
+# -------------------- Health checks --------------------
+@app.route('/healthz')
+def liveness():
+    # The process is up and serving requests; nothing else is checked
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/readyz')
+def readiness():
+    """Ready for traffic: the database answers and is fully migrated."""
+    problems = []
+    try:
+        with db.get_pool().connection() as conn:
+            version = migrations.schema_version(conn)
+        latest = migrations.MIGRATIONS[-1][0]
+        if version < latest:
+            problems.append(f'schema version {version}, expected {latest}')
+    except sqlite3.Error as e:
+        problems.append(f'database: {e}')
+    if problems:
+        return jsonify({'status': 'unavailable', 'problems': problems}), 503
+    return jsonify({'status': 'ready'})
+
+
+def preload():
+    """Load what each worker would otherwise load on first use (fuzzywuzzy,
+    the email package, the search index and leaderboard), for a server that
+    imports the app once and forks workers from it: the workers then share
+    those pages copy-on-write.  The database connections used for it are
+    closed again, since a connection must not cross a fork."""
+    from email.mime.multipart import MIMEMultipart  # noqa: F401
+    from email.mime.text import MIMEText  # noqa: F401
+    if OCR_CACHE_PERCEPTUAL:
+        import cv2  # noqa: F401
+
+    with app.app_context():
+        professor_index.ensure_loaded(get_db)
+        leaderboard.ensure_loaded(get_db)
+    db.get_pool(app).close()
+
+
+def shutdown():
+    """Deliver queued mail, finish queued OCR jobs, stop the background
+    threads and close the database connections.  Called by the WSGI server
+    as a worker exits, so a graceful reload or stop does not drop work that
+    was already accepted; an account deletion stopped half way resumes in
+    the next worker."""
+    mailer.stop()
+    ocr_jobs.shutdown(wait=True)
+    rating_reconciler.stop()
+    account_deleter.stop()
+    db.get_pool(app).close()
+
+
 @app.route('/about_us')
+@response_cache.cached(ttl=3600)
 def about_us():
     return render_template('about_us.html')
 
@@ -659,25 +974,27 @@ def delete_account():
         return redirect(url_for('login'))
 
     if request.method == 'POST':
-        email = session['email']
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Delete user-related data
-        cursor.execute('DELETE FROM ratings WHERE user_email = ?', (email,))
-        cursor.execute('DELETE FROM reviews WHERE user_email = ?', (email,))
-        cursor.execute('DELETE FROM community_users WHERE email = ?', (email,))
-        cursor.execute('DELETE FROM users WHERE email = ?', (email,))
-
-        conn.commit()
-        conn.close()
+        # The login goes now; the user's data is removed in the background
+        deletion_id = account_deleter.submit(session['email'])
 
         # Clear the session
         session.pop('email', None)
-        flash('Your account and all associated data have been deleted.', 'success')
+        session.pop('username', None)
+        session['account_deletion'] = deletion_id
+        flash('Your account has been deleted. Your ratings, reviews and posts are being removed.', 'success')
         return redirect(url_for('index'))
 
     return render_template('delete.html')
+
+
+@app.route('/api/account-deletion')
+def account_deletion_status():
+    # Only the job of the account deleted from this browser
+    deletion_id = session.get('account_deletion')
+    status = account_deleter.status(get_db(), deletion_id) if deletion_id else None
+    if status is None:
+        return jsonify({'status': 'unknown'}), 404
+    return jsonify(status)
    
 
 
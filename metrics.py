@@ -0,0 +1,257 @@
+import functools
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import request
+
+
+# Seconds; the same buckets serve requests, statements and spans.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+@functools.lru_cache(maxsize=2048)
+def normalize_sql(sql):
+    """Statement text with literals replaced by ? and whitespace collapsed,
+    so every execution of the same query is counted under one name."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _flatten(prefix, value, labels=()):
+    """(name, labels, number) for every number in a nested snapshot dict.
+    A dict whose values are all dicts (e.g. per-route counters) becomes a
+    `name` label instead of part of the metric name."""
+    if isinstance(value, bool):
+        yield prefix, labels, int(value)
+    elif isinstance(value, (int, float)):
+        yield prefix, labels, value
+    elif isinstance(value, dict):
+        nested = value and all(isinstance(v, dict) for v in value.values())
+        for key, child in value.items():
+            if nested:
+                yield from _flatten(prefix, child, labels + (('name', key),))
+            else:
+                yield from _flatten(f'{prefix}_{key}', child, labels)
+
+
+class Metrics:
+    """Per-endpoint request latency, per-statement SQL timings and named
+    spans, rendered in the Prometheus text format by render().
+
+    Counters are per process; with several gunicorn workers each /metrics
+    scrape sees the worker that served it.  Requests slower than
+    `slow_request_seconds` are printed with the statements and spans that
+    ran while serving them.
+    """
+
+    def __init__(self, slow_request_seconds=None, max_statements=500, buckets=BUCKETS):
+        self.slow_request_seconds = slow_request_seconds
+        self.max_statements = max_statements
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.requests = {}      # (endpoint, method) -> Histogram
+        self.responses = {}     # (endpoint, method, status) -> count
+        self.statements = {}    # normalized sql -> [count, seconds]
+        self.spans = {}         # name -> Histogram
+        self.errors = {}        # where -> count
+        self.slow_requests = 0
+
+    # ---- requests ----
+
+    def init_app(self, app):
+        app.before_request(self._begin_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _begin_request(self):
+        self._local.trace = {'start': time.perf_counter(), 'statements': {}, 'spans': [], 'done': False}
+
+    def _after_request(self, response):
+        self._end_request(response.status_code)
+        return response
+
+    def _teardown_request(self, exc=None):
+        # An unhandled exception skips after_request; count it as a 500.
+        self._end_request(500)
+
+    def _end_request(self, status):
+        trace = getattr(self._local, 'trace', None)
+        if trace is None or trace['done']:
+            return
+        trace['done'] = True
+        elapsed = time.perf_counter() - trace['start']
+        endpoint = request.endpoint or 'unmatched'
+        with self._lock:
+            histogram = self.requests.get((endpoint, request.method))
+            if histogram is None:
+                histogram = self.requests[(endpoint, request.method)] = Histogram(self.buckets)
+            histogram.observe(elapsed)
+            key = (endpoint, request.method, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+            slow = self.slow_request_seconds is not None and elapsed >= self.slow_request_seconds
+            if slow:
+                self.slow_requests += 1
+        if slow:
+            self._log_slow(trace, elapsed, status)
+        self._local.trace = None
+
+    def _log_slow(self, trace, elapsed, status):
+        statements = sorted(trace['statements'].items(), key=lambda item: item[1][1], reverse=True)
+        sql_count = sum(count for _, (count, _) in statements)
+        sql_seconds = sum(seconds for _, (_, seconds) in statements)
+        lines = [f'Slow request: {request.method} {request.full_path.rstrip("?")} -> {status} '
+                 f'in {elapsed * 1000:.1f}ms ({sql_count} queries, {sql_seconds * 1000:.1f}ms in SQL)']
+        for sql, (count, seconds) in statements[:10]:
+            lines.append(f'    {seconds * 1000:8.1f}ms  {count:4}x  {sql[:200]}')
+        for name, seconds in trace['spans']:
+            lines.append(f'    {seconds * 1000:8.1f}ms  span  {name}')
+        print('\n'.join(lines))
+
+    # ---- statements, spans, errors ----
+
+    def observe_query(self, sql, seconds, executed=True):
+        """Called by the connection pool after each statement, and again
+        (executed=False) for the time spent fetching its rows."""
+        text = normalize_sql(sql)
+        with self._lock:
+            totals = self.statements.get(text)
+            if totals is None:
+                if len(self.statements) >= self.max_statements:
+                    text = 'other'
+                totals = self.statements.setdefault(text, [0, 0.0])
+            totals[0] += executed
+            totals[1] += seconds
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            totals = trace['statements'].setdefault(text, [0, 0.0])
+            totals[0] += executed
+            totals[1] += seconds
+
+    def observe_span(self, name, seconds):
+        with self._lock:
+            histogram = self.spans.get(name)
+            if histogram is None:
+                histogram = self.spans[name] = Histogram(self.buckets)
+            histogram.observe(seconds)
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace['spans'].append((name, seconds))
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_span(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """Decorator form of span()."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def error(self, where):
+        with self._lock:
+            self.errors[where] = self.errors.get(where, 0) + 1
+
+    # ---- export ----
+
+    def _histogram_lines(self, name, labels, histogram):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            yield f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}'
+        yield f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {histogram.count}'
+        yield f'{name}_sum{_labels(labels)} {histogram.sum:.6f}'
+        yield f'{name}_count{_labels(labels)} {histogram.count}'
+
+    def render(self, collectors=None):
+        """Prometheus text exposition.  `collectors` maps a name to a
+        snapshot() callable; every number in it is exported as a gauge."""
+        with self._lock:
+            requests = {key: histogram for key, histogram in self.requests.items()}
+            responses = dict(self.responses)
+            statements = {sql: list(totals) for sql, totals in self.statements.items()}
+            spans = dict(self.spans)
+            errors = dict(self.errors)
+            slow = self.slow_requests
+
+            lines = ['# HELP app_request_duration_seconds Time to serve a request, by endpoint.',
+                     '# TYPE app_request_duration_seconds histogram']
+            for (endpoint, method), histogram in sorted(requests.items()):
+                lines.extend(self._histogram_lines('app_request_duration_seconds',
+                                                   (('endpoint', endpoint), ('method', method)), histogram))
+            lines += ['# HELP app_span_duration_seconds Time spent in instrumented functions.',
+                      '# TYPE app_span_duration_seconds histogram']
+            for name, histogram in sorted(spans.items()):
+                lines.extend(self._histogram_lines('app_span_duration_seconds', (('span', name),), histogram))
+
+        lines += ['# HELP app_responses_total Responses by endpoint and status.',
+                  '# TYPE app_responses_total counter']
+        for (endpoint, method, status), count in sorted(responses.items()):
+            labels = _labels((('endpoint', endpoint), ('method', method), ('status', status)))
+            lines.append(f'app_responses_total{labels} {count}')
+
+        lines += ['# HELP app_sql_statements_total SQL statements executed, by normalized text.',
+                  '# TYPE app_sql_statements_total counter']
+        for sql, (count, _) in sorted(statements.items()):
+            lines.append(f'app_sql_statements_total{_labels((("statement", sql),))} {count}')
+        lines += ['# HELP app_sql_seconds_total Time spent executing SQL statements, by normalized text.',
+                  '# TYPE app_sql_seconds_total counter']
+        for sql, (_, seconds) in sorted(statements.items()):
+            lines.append(f'app_sql_seconds_total{_labels((("statement", sql),))} {seconds:.6f}')
+
+        lines += ['# TYPE app_errors_total counter']
+        for where, count in sorted(errors.items()):
+            lines.append(f'app_errors_total{_labels((("where", where),))} {count}')
+        lines += ['# TYPE app_slow_requests_total counter', f'app_slow_requests_total {slow}']
+
+        for collector, snapshot in (collectors or {}).items():
+            seen = set()
+            for name, labels, value in _flatten(f'app_{collector}', snapshot()):
+                if name not in seen:
+                    lines.append(f'# TYPE {name} gauge')
+                    seen.add(name)
+                lines.append(f'{name}{_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
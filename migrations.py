@@ -0,0 +1,556 @@
+"""Versioned schema migrations for database.db.
+
+The schema version lives in `PRAGMA user_version`; each migration runs in its
+own IMMEDIATE transaction and bumps it, so starting several workers at once is
+safe.  Run by the app at startup, or by hand:
+
+    python migrations.py   # migrate database.db
+
+tests/test_query_plans.py checks the hot statements against the result.
+"""
+import argparse
+import sqlite3
+import sys
+
+
+BASE_TABLES = (
+    '''CREATE TABLE IF NOT EXISTS users (
+        email TEXT PRIMARY KEY,
+        password TEXT,
+        year TEXT,
+        semester TEXT,
+        academic_year TEXT,
+        school TEXT,
+        branch TEXT
+    )''',
+    '''CREATE TABLE IF NOT EXISTS professors (
+        id INTEGER PRIMARY KEY,
+        Name TEXT,
+        Designation TEXT,
+        Photo TEXT,
+        Avg_rating REAL,
+        no_ratings INTEGER,
+        Profile TEXT
+    )''',
+    '''CREATE TABLE IF NOT EXISTS reviews (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_email TEXT,
+        professor_id INTEGER,
+        professor_name TEXT,
+        teaching_rating REAL,
+        content_rating REAL,
+        overall_rating REAL,
+        final_weighted_rating REAL,
+        review_text TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        review TEXT,
+        FOREIGN KEY (user_email) REFERENCES users(email),
+        FOREIGN KEY (professor_id) REFERENCES professors(id)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS ratings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        professor_id INTEGER,
+        user_email TEXT,
+        teaching_rating INTEGER,
+        content_rating INTEGER,
+        overall_rating INTEGER,
+        rating REAL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (professor_id) REFERENCES professors (id),
+        FOREIGN KEY (user_email) REFERENCES users (email)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS community_users (
+        email TEXT PRIMARY KEY,
+        username TEXT UNIQUE NOT NULL,
+        FOREIGN KEY (email) REFERENCES users(email) ON DELETE CASCADE
+    )''',
+    '''CREATE TABLE IF NOT EXISTS community_posts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        message TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (username) REFERENCES community_users(username) ON DELETE CASCADE
+    )''',
+    '''CREATE TABLE IF NOT EXISTS community_replies (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        post_id INTEGER NOT NULL,
+        username TEXT NOT NULL,
+        message TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        parent_reply_id INTEGER,
+        FOREIGN KEY (post_id) REFERENCES community_posts(id) ON DELETE CASCADE,
+        FOREIGN KEY (username) REFERENCES community_users(username) ON DELETE CASCADE
+    )''',
+)
+
+# Columns the app writes that older copies of the database may lack.
+EXPECTED_COLUMNS = {
+    'ratings': {'comment': 'TEXT'},
+    'community_replies': {'parent_reply_id': 'INTEGER'},
+    'reviews': {'review': 'TEXT'},
+}
+
+# Columns added to tables created by earlier migrations.
+OCR_JOB_METRIC_COLUMNS = {'upload_bytes': 'INTEGER', 'peak_rss_kb': 'INTEGER'}
+ACCOUNT_DELETION_CLAIM_COLUMNS = {'owner': 'TEXT', 'heartbeat': 'REAL'}
+RATING_ITEM_COLUMNS = {
+    'explain_concepts': 'INTEGER',
+    'clear_lectures': 'INTEGER',
+    'encourages_participation': 'INTEGER',
+    'responsiveness': 'INTEGER',
+    'helpful_materials': 'INTEGER',
+    'manageable_workload': 'INTEGER',
+    'fair_grading': 'INTEGER',
+}
+# Every column of `ratings` the aggregates are built from
+RATING_CHANGE_COLUMNS = (*RATING_ITEM_COLUMNS, 'overall_rating', 'rating')
+
+HOT_QUERY_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_professors_name ON professors (Name)',
+    'CREATE INDEX IF NOT EXISTS idx_professors_rating ON professors (Avg_rating, no_ratings)',
+    'CREATE INDEX IF NOT EXISTS idx_professors_unrated ON professors (no_ratings)',
+    'CREATE INDEX IF NOT EXISTS idx_reviews_professor ON reviews (professor_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_reviews_user ON reviews (user_email, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_ratings_user ON ratings (user_email, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_ratings_professor ON ratings (professor_id)',
+    'CREATE INDEX IF NOT EXISTS idx_community_posts_timestamp ON community_posts (timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_community_replies_post ON community_replies (post_id, timestamp)',
+)
+
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def create_base_tables(conn):
+    for statement in BASE_TABLES:
+        conn.execute(statement)
+
+
+def reconcile_columns(conn):
+    for table, columns in EXPECTED_COLUMNS.items():
+        existing = table_columns(conn, table)
+        for column, column_type in columns.items():
+            if column not in existing:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+
+def create_hot_query_indexes(conn):
+    for statement in HOT_QUERY_INDEXES:
+        conn.execute(statement)
+    conn.execute('ANALYZE')
+
+
+def create_pending_registrations(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pending_registrations (
+            email TEXT PRIMARY KEY,
+            otp TEXT NOT NULL,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pending_registrations_expiry ON pending_registrations (expires_at)')
+
+
+def create_ocr_jobs(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ocr_jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            percentage REAL,
+            submitted_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ocr_jobs_submitted ON ocr_jobs (submitted_at)')
+
+
+def create_ocr_cache(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ocr_cache (
+            key TEXT PRIMARY KEY,
+            percentage REAL,
+            run_seconds REAL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ocr_cache_expiry ON ocr_cache (expires_at)')
+
+
+def add_ocr_job_metrics(conn):
+    existing = table_columns(conn, 'ocr_jobs')
+    for column, column_type in OCR_JOB_METRIC_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f'ALTER TABLE ocr_jobs ADD COLUMN {column} {column_type}')
+
+
+def add_professor_review_counters(conn):
+    existing = table_columns(conn, 'professors')
+    if 'review_count' not in existing:
+        conn.execute('ALTER TABLE professors ADD COLUMN review_count INTEGER NOT NULL DEFAULT 0')
+    if 'last_review_id' not in existing:
+        conn.execute('ALTER TABLE professors ADD COLUMN last_review_id INTEGER NOT NULL DEFAULT 0')
+    conn.execute('''
+        UPDATE professors SET
+            review_count = (SELECT COUNT(*) FROM reviews WHERE professor_id = professors.id),
+            last_review_id = COALESCE((SELECT MAX(id) FROM reviews WHERE professor_id = professors.id), 0)
+    ''')
+    # Kept in step by SQLite itself, so every writer (routes, imports,
+    # account deletion) maintains them.
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS reviews_count_insert AFTER INSERT ON reviews BEGIN
+            UPDATE professors SET review_count = review_count + 1,
+                                  last_review_id = MAX(last_review_id, NEW.id)
+            WHERE id = NEW.professor_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS reviews_count_delete AFTER DELETE ON reviews BEGIN
+            UPDATE professors SET review_count = review_count - 1
+            WHERE id = OLD.professor_id;
+        END
+    ''')
+
+
+def create_response_cache(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS response_cache (
+            key TEXT PRIMARY KEY,
+            body BLOB NOT NULL,
+            mimetype TEXT NOT NULL,
+            etag TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_expiry ON response_cache (expires_at)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS response_cache_tags (
+            tag TEXT NOT NULL,
+            key TEXT NOT NULL,
+            PRIMARY KEY (tag, key)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_tags_key ON response_cache_tags (key)')
+
+
+def create_rating_stats(conn):
+    existing = table_columns(conn, 'ratings')
+    for column, column_type in RATING_ITEM_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f'ALTER TABLE ratings ADD COLUMN {column} {column_type}')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS professor_rating_stats (
+            professor_id INTEGER NOT NULL,
+            item TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            total REAL NOT NULL,
+            total_sq REAL NOT NULL,
+            h1 INTEGER NOT NULL, h2 INTEGER NOT NULL, h3 INTEGER NOT NULL,
+            h4 INTEGER NOT NULL, h5 INTEGER NOT NULL,
+            PRIMARY KEY (professor_id, item)
+        ) WITHOUT ROWID
+    ''')
+    # Older rows only kept the final score and the overall item.
+    for item, column in (('weighted', 'rating'), ('overall_rating', 'overall_rating')):
+        conn.execute(f'''
+            INSERT OR REPLACE INTO professor_rating_stats
+            SELECT professor_id, '{item}', COUNT(*), SUM(v), SUM(v * v),
+                   SUM(b = 1), SUM(b = 2), SUM(b = 3), SUM(b = 4), SUM(b = 5)
+            FROM (SELECT professor_id, {column} AS v, MIN(5, MAX(1, CAST({column} + 0.5 AS INTEGER))) AS b
+                  FROM ratings WHERE {column} IS NOT NULL AND professor_id IS NOT NULL)
+            GROUP BY professor_id
+        ''')
+
+    # Ratings counted on a professor with no row in `ratings` came from the
+    # CSV import; keep them as a baseline Avg_rating is computed on top of.
+    existing = table_columns(conn, 'professors')
+    if 'imported_ratings' not in existing:
+        conn.execute('ALTER TABLE professors ADD COLUMN imported_ratings INTEGER NOT NULL DEFAULT 0')
+    if 'imported_rating_total' not in existing:
+        conn.execute('ALTER TABLE professors ADD COLUMN imported_rating_total REAL NOT NULL DEFAULT 0')
+    conn.execute('''
+        UPDATE professors SET
+            imported_ratings = MAX(0, COALESCE(no_ratings, 0) - COALESCE(
+                (SELECT n FROM professor_rating_stats WHERE professor_id = professors.id AND item = 'weighted'), 0)),
+            imported_rating_total = MAX(0, COALESCE(Avg_rating * no_ratings, 0) - COALESCE(
+                (SELECT total FROM professor_rating_stats WHERE professor_id = professors.id AND item = 'weighted'), 0))
+    ''')
+    conn.execute('UPDATE professors SET imported_rating_total = 0 WHERE imported_ratings = 0')
+
+
+# (FTS5 table, source table, column); text_search.py searches these.
+FULL_TEXT_INDEXES = (
+    ('reviews_fts', 'reviews', 'review_text'),
+    ('community_posts_fts', 'community_posts', 'message'),
+    ('community_replies_fts', 'community_replies', 'message'),
+)
+
+
+def create_full_text_indexes(conn):
+    for fts, table, column in FULL_TEXT_INDEXES:
+        # External content: the index points at the source rows by id instead
+        # of keeping a second copy of the text.
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {column}, content='{table}', content_rowid='id',
+                tokenize='porter unicode61 remove_diacritics 2'
+            )
+        ''')
+        # The old values must be handed back on delete, so every change to the
+        # column has to go through these triggers (or be followed by a rebuild).
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, {column}) VALUES (NEW.id, NEW.{column});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column}) VALUES ('delete', OLD.id, OLD.{column});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {column} ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column}) VALUES ('delete', OLD.id, OLD.{column});
+                INSERT INTO {fts} (rowid, {column}) VALUES (NEW.id, NEW.{column});
+            END
+        ''')
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+def create_dirty_professors(conn):
+    # Professors whose aggregates may no longer match `ratings`; emptied by
+    # rating_stats.reconcile().  submit_rating() keeps the aggregates exact
+    # itself, so only changes that bypass it mark a professor.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dirty_professors (
+            professor_id INTEGER PRIMARY KEY,
+            marked_at REAL NOT NULL
+        )
+    ''')
+    now = "(julianday('now') - 2440587.5) * 86400.0"
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS ratings_dirty_delete AFTER DELETE ON ratings
+        WHEN OLD.professor_id IS NOT NULL BEGIN
+            INSERT OR IGNORE INTO dirty_professors VALUES (OLD.professor_id, {now});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS ratings_dirty_update AFTER UPDATE OF
+            professor_id, rating, {', '.join(RATING_ITEM_COLUMNS)}, overall_rating ON ratings BEGIN
+            INSERT OR IGNORE INTO dirty_professors SELECT OLD.professor_id, {now} WHERE OLD.professor_id IS NOT NULL;
+            INSERT OR IGNORE INTO dirty_professors SELECT NEW.professor_id, {now} WHERE NEW.professor_id IS NOT NULL;
+        END
+    ''')
+
+
+def create_account_deletions(conn):
+    # Everything account deletion removes is found through an index
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_community_posts_user ON community_posts (username)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_community_replies_user ON community_replies (username)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS account_deletions (
+            id INTEGER PRIMARY KEY,
+            email TEXT NOT NULL,
+            username TEXT,
+            status TEXT NOT NULL,
+            requested_at REAL NOT NULL,
+            finished_at REAL,
+            deleted_rows INTEGER NOT NULL DEFAULT 0,
+            error TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_account_deletions_email ON account_deletions (email, status)')
+
+
+def create_rate_limits(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_updated ON rate_limit_buckets (updated_at)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS admission_leases (
+            id INTEGER PRIMARY KEY,
+            gate TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_admission_leases_gate ON admission_leases (gate, expires_at)')
+
+
+# Counters bumped by triggers whenever `professors` changes, so each worker's
+# in-memory copies (search index, leaderboard) can tell they are stale
+# whichever process made the change.  Ratings only move the second one.
+PROFESSOR_VERSION_TRIGGERS = (
+    ('professors_version_insert', 'AFTER INSERT ON professors', 'professors'),
+    ('professors_version_delete', 'AFTER DELETE ON professors', 'professors'),
+    ('professors_version_update', 'AFTER UPDATE OF Name, Designation, Photo, Profile ON professors', 'professors'),
+    ('professors_version_rating', 'AFTER UPDATE OF Avg_rating, no_ratings ON professors', 'professor_ratings'),
+)
+
+
+def create_data_versions(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES ('professors', 0), ('professor_ratings', 0)")
+    for name, event, counter in PROFESSOR_VERSION_TRIGGERS:
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN
+                UPDATE data_versions SET version = version + 1 WHERE name = '{counter}';
+            END
+        ''')
+
+
+def rename_ocr_job_rss_column(conn):
+    # It is the pool process's lifetime peak when the job finished, not the job's own
+    if 'peak_rss_kb' in table_columns(conn, 'ocr_jobs'):
+        conn.execute('ALTER TABLE ocr_jobs RENAME COLUMN peak_rss_kb TO worker_peak_rss_kb')
+
+
+def add_account_deletion_claims(conn):
+    existing = table_columns(conn, 'account_deletions')
+    for column, column_type in ACCOUNT_DELETION_CLAIM_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f'ALTER TABLE account_deletions ADD COLUMN {column} {column_type}')
+
+
+def create_rating_changes(conn):
+    # The ratings the dirty triggers saw removed (sign -1) or added (+1)
+    # outside submit_rating().  reconcile() applies them to the stored
+    # aggregates to tell numbers that are only behind those changes from
+    # numbers that were wrong, and clears them with the professor's mark.
+    columns = ', '.join(RATING_CHANGE_COLUMNS)
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS rating_changes (
+            id INTEGER PRIMARY KEY,
+            professor_id INTEGER NOT NULL,
+            sign INTEGER NOT NULL,
+            {', '.join(f'{column} REAL' for column in RATING_CHANGE_COLUMNS)}
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rating_changes_professor ON rating_changes (professor_id)')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS ratings_change_delete AFTER DELETE ON ratings
+        WHEN OLD.professor_id IS NOT NULL BEGIN
+            INSERT INTO rating_changes (professor_id, sign, {columns})
+            VALUES (OLD.professor_id, -1, {', '.join(f'OLD.{column}' for column in RATING_CHANGE_COLUMNS)});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS ratings_change_update AFTER UPDATE OF
+            professor_id, {columns} ON ratings BEGIN
+            INSERT INTO rating_changes (professor_id, sign, {columns})
+            SELECT OLD.professor_id, -1, {', '.join(f'OLD.{column}' for column in RATING_CHANGE_COLUMNS)}
+            WHERE OLD.professor_id IS NOT NULL;
+            INSERT INTO rating_changes (professor_id, sign, {columns})
+            SELECT NEW.professor_id, 1, {', '.join(f'NEW.{column}' for column in RATING_CHANGE_COLUMNS)}
+            WHERE NEW.professor_id IS NOT NULL;
+        END
+    ''')
+
+
+def create_account_deletion_professors(conn):
+    # Professors whose ratings or reviews a job has removed so far, written
+    # with each chunk, so a job resumed by another deleter reports them all
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS account_deletion_professors (
+            deletion_id INTEGER NOT NULL,
+            professor_id INTEGER NOT NULL,
+            PRIMARY KEY (deletion_id, professor_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def never_reuse_admission_lease_ids(conn):
+    # A plain INTEGER PRIMARY KEY hands a swept lease's id to the next
+    # acquire(), so the first holder's late release() would delete the new
+    # lease.  AUTOINCREMENT never reuses one; the table is rebuilt to get it.
+    conn.execute('''
+        CREATE TABLE admission_leases_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            gate TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('INSERT INTO admission_leases_new (id, gate, expires_at) '
+                 'SELECT id, gate, expires_at FROM admission_leases')
+    conn.execute('DROP TABLE admission_leases')
+    conn.execute('ALTER TABLE admission_leases_new RENAME TO admission_leases')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_admission_leases_gate ON admission_leases (gate, expires_at)')
+
+
+# (version, description, function); append only, never renumber.
+MIGRATIONS = [
+    (1, 'base tables', create_base_tables),
+    (2, 'add columns missing from older databases', reconcile_columns),
+    (3, 'indexes for hot queries', create_hot_query_indexes),
+    (4, 'pending registrations table for the OTP store', create_pending_registrations),
+    (5, 'attendance OCR job table', create_ocr_jobs),
+    (6, 'shared OCR result cache', create_ocr_cache),
+    (7, 'per-upload size and memory columns on ocr_jobs', add_ocr_job_metrics),
+    (8, 'per-professor review counters', add_professor_review_counters),
+    (9, 'shared response cache', create_response_cache),
+    (10, 'per-item rating aggregates', create_rating_stats),
+    (11, 'full-text indexes on reviews and community posts', create_full_text_indexes),
+    (12, 'dirty-professor markers for rating reconciliation', create_dirty_professors),
+    (13, 'indexes and job table for chunked account deletion', create_account_deletions),
+    (14, 'shared rate limit buckets and admission leases', create_rate_limits),
+    (15, 'change counters for the in-memory professor copies', create_data_versions),
+    (16, 'name ocr_jobs.peak_rss_kb for what it holds', rename_ocr_job_rss_column),
+    (17, 'owner and heartbeat on account deletion jobs', add_account_deletion_claims),
+    (18, 'log of rating changes awaiting reconciliation', create_rating_changes),
+    (19, 'professors affected by each account deletion job', create_account_deletion_professors),
+    (20, 'admission lease ids that are never reused', never_reuse_admission_lease_ids),
+]
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(path, verbose=False):
+    conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+    try:
+        for version, description, apply in MIGRATIONS:
+            if schema_version(conn) >= version:
+                continue
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Another worker may have got here first.
+                if schema_version(conn) < version:
+                    apply(conn)
+                    conn.execute(f'PRAGMA user_version = {version}')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            if verbose:
+                print(f'Applied migration {version}: {description}')
+        return schema_version(conn)
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Migrate database.db to the latest schema.')
+    parser.add_argument('--db', default='database.db')
+    args = parser.parse_args(argv)
+
+    version = migrate(args.db, verbose=True)
+    print(f'{args.db} is at schema version {version}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
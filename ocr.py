@@ -0,0 +1,141 @@
+import re
+
+import cv2
+import numpy as np
+import pytesseract
+
+from config import Config
+from uploads import sniff_image
+
+
+pytesseract.pytesseract.tesseract_cmd = Config.TESSERACT_CMD
+
+ATTENDANCE_PATTERN = re.compile(r'(\d+)\s*/\s*(\d+)\s*=\s*(\d+(\.\d+)?)')
+
+# Text lines are OCRed with only the characters the pattern needs.  The
+# lines arrive stacked one under another (see stack_regions), so this is
+# --psm 6 (a uniform block of text) rather than --psm 7, which would read
+# the whole sheet as a single line.
+LINE_CONFIG = '--psm 6 -c tessedit_char_whitelist=0123456789/=.'
+
+MAX_SIDE = 1600          # longer side after downscaling; phone screenshots are ~2400
+MAX_REGIONS = 40         # more text lines than this and the whole image is OCRed
+REGION_GAP = 12          # white rows between stacked lines
+
+
+def decode_flag(image_bytes, max_side=MAX_SIDE):
+    """The cheapest grayscale decode that still leaves `max_side` pixels.
+
+    libjpeg can scale by 1/2, 1/4 or 1/8 while decoding, so a big phone
+    screenshot never exists in memory at full resolution.
+    """
+    sniffed = sniff_image(image_bytes[:256 * 1024])
+    if sniffed is None:
+        return cv2.IMREAD_GRAYSCALE
+    longest = max(sniffed[1], sniffed[2])
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+                         (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                         (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)):
+        if longest // factor >= max_side:
+            return flag
+    return cv2.IMREAD_GRAYSCALE
+
+
+def decode_grayscale(image_bytes):
+    npimg = np.frombuffer(image_bytes, np.uint8)
+    return cv2.imdecode(npimg, decode_flag(image_bytes))
+
+
+def downscale(gray, max_side=MAX_SIDE):
+    height, width = gray.shape[:2]
+    scale = max_side / max(height, width)
+    if scale >= 1:
+        return gray
+    return cv2.resize(gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+def binarize(gray):
+    _, thresh = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY)
+    return thresh
+
+
+def text_regions(thresh, max_regions=MAX_REGIONS):
+    """Bounding boxes of the text rows in a binarised screenshot.
+
+    Dark text is smeared horizontally so each word run becomes one blob,
+    blobs that are too flat or too tall to be text are dropped, and blobs
+    sharing a row are merged so a table row comes back as a single line.
+    Returns [] when there are more than `max_regions` rows.
+    """
+    ink = cv2.bitwise_not(thresh)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(15, thresh.shape[1] // 60), 3))
+    blobs = cv2.dilate(ink, kernel, iterations=1)
+    contours, _ = cv2.findContours(blobs, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    boxes = sorted(
+        box for box in (cv2.boundingRect(contour) for contour in contours)
+        if 8 <= box[3] <= 150 and box[2] >= box[3]
+    )
+    boxes.sort(key=lambda box: box[1] + box[3] / 2)
+
+    rows = []
+    for x, y, w, h in boxes:
+        if rows:
+            rx, ry, rw, rh = rows[-1]
+            # Same row when the vertical centre falls inside the previous row.
+            if ry <= y + h / 2 <= ry + rh:
+                x0, y0 = min(rx, x), min(ry, y)
+                rows[-1] = (x0, y0, max(rx + rw, x + w) - x0, max(ry + rh, y + h) - y0)
+                continue
+        rows.append((x, y, w, h))
+
+    if len(rows) > max_regions:
+        return []
+    return rows
+
+
+def stack_regions(thresh, boxes, gap=REGION_GAP):
+    """The cropped lines, left-aligned one under another on a white sheet."""
+    pad = 4
+    crops = []
+    for x, y, w, h in boxes:
+        y0, y1 = max(0, y - pad), min(thresh.shape[0], y + h + pad)
+        x0, x1 = max(0, x - pad), min(thresh.shape[1], x + w + pad)
+        crops.append(thresh[y0:y1, x0:x1])
+
+    width = max(crop.shape[1] for crop in crops) + 2 * gap
+    height = sum(crop.shape[0] for crop in crops) + gap * (len(crops) + 1)
+    sheet = np.full((height, width), 255, np.uint8)
+    y = gap
+    for crop in crops:
+        sheet[y:y + crop.shape[0], gap:gap + crop.shape[1]] = crop
+        y += crop.shape[0] + gap
+    return sheet
+
+
+def match_percentage(text):
+    match = ATTENDANCE_PATTERN.search(text)
+    if match:
+        return float(match.group(3))
+    return None
+
+
+def extract_attendance_percentage(image_bytes):
+    gray = decode_grayscale(image_bytes)
+    if gray is None:
+        return "Could not extract attendance percentage."
+    thresh = binarize(downscale(gray))
+
+    # Stage 1: only the text lines, in one Tesseract call (each call is a
+    # subprocess, so OCRing the lines separately would cost more than it saves).
+    boxes = text_regions(thresh)
+    if boxes:
+        percentage = match_percentage(pytesseract.image_to_string(stack_regions(thresh, boxes), config=LINE_CONFIG))
+        if percentage is not None:
+            return percentage
+
+    # Stage 2: the whole image with default settings, as before.
+    percentage = match_percentage(pytesseract.image_to_string(thresh))
+    if percentage is not None:
+        return percentage
+    return "Could not extract attendance percentage."
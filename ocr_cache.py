@@ -0,0 +1,158 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def content_key(image_bytes):
+    return 'sha256:' + hashlib.sha256(image_bytes).hexdigest()
+
+
+def perceptual_key(image_bytes, owner, size=16):
+    """dHash of a reduced-resolution decode, scoped to `owner`.
+
+    Catches the same screenshot re-encoded or resized; matched by Hamming
+    distance in OCRResultCache.get().  Two different screenshots of the
+    same portal page can hash alike, which is why the key includes the
+    uploader and why this lookup is opt-in.
+    """
+    # OpenCV is only loaded by workers that use the (opt-in) perceptual keys
+    import cv2
+    import numpy as np
+
+    gray = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        return None
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+    return f'dhash:{owner}:{bits.tobytes().hex()}'
+
+
+def hamming(key, other):
+    a = int(key.rsplit(':', 1)[1], 16)
+    b = int(other.rsplit(':', 1)[1], 16)
+    return bin(a ^ b).count('1')
+
+
+class OCRResultCache:
+    """Bounded LRU of OCR results with a TTL, optionally backed by the
+    `ocr_cache` table so every worker shares what any of them has OCRed.
+
+    Entries are {'percentage': float or None, 'run_seconds': float}; a None
+    percentage caches "could not extract" so a bad screenshot is not OCRed
+    again either.  `run_seconds` is what the original OCR took, which is
+    how `saved_seconds` is counted.
+    """
+
+    def __init__(self, max_entries=2048, ttl=24 * 3600, pool=None, max_distance=6):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.pool = pool
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, entry)
+        self.stats = {
+            'hits': 0,
+            'perceptual_hits': 0,
+            'shared_hits': 0,      # found in SQLite, not in this process
+            'misses': 0,
+            'saved_seconds': 0.0,
+        }
+
+    def _get_local(self, key, now):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[0] <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def _put_local(self, key, entry, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_shared(self, key, now):
+        if self.pool is None:
+            return None
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                'SELECT percentage, run_seconds, expires_at FROM ocr_cache WHERE key = ? AND expires_at > ?',
+                (key, now)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = {'percentage': row['percentage'], 'run_seconds': row['run_seconds']}
+        self._put_local(key, entry, row['expires_at'])
+        return entry
+
+    def _nearest_perceptual(self, key, now):
+        """The stored dhash key of the same owner closest to `key`, if close enough."""
+        prefix = key.rsplit(':', 1)[0] + ':'
+        with self._lock:
+            candidates = [k for k in self._entries if k.startswith(prefix)]
+        if self.pool is not None:
+            with self.pool.connection() as conn:
+                candidates += [row['key'] for row in conn.execute(
+                    'SELECT key FROM ocr_cache WHERE key >= ? AND key < ? AND expires_at > ?',
+                    (prefix, prefix[:-1] + ';', now)
+                )]
+        best = min(candidates, key=lambda k: hamming(key, k), default=None)
+        if best is not None and hamming(key, best) <= self.max_distance:
+            return best
+        return None
+
+    def get(self, keys):
+        """The first cached entry for any of `keys` (most specific first)."""
+        now = time.time()
+        for key in keys:
+            if key is None:
+                continue
+            if key.startswith('dhash:'):
+                key = self._nearest_perceptual(key, now)
+                if key is None:
+                    continue
+            entry = self._get_local(key, now)
+            shared = False
+            if entry is None:
+                entry = self._get_shared(key, now)
+                shared = entry is not None
+            if entry is not None:
+                with self._lock:
+                    self.stats['hits'] += 1
+                    self.stats['perceptual_hits'] += key.startswith('dhash:')
+                    self.stats['shared_hits'] += shared
+                    self.stats['saved_seconds'] += entry['run_seconds'] or 0.0
+                return entry
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, keys, percentage, run_seconds):
+        entry = {'percentage': percentage, 'run_seconds': run_seconds}
+        expires_at = time.time() + self.ttl
+        keys = [key for key in keys if key is not None]
+        for key in keys:
+            self._put_local(key, entry, expires_at)
+        if self.pool is None or not keys:
+            return
+        with self.pool.connection() as conn:
+            conn.execute('DELETE FROM ocr_cache WHERE expires_at <= ?', (time.time(),))
+            conn.executemany(
+                'INSERT OR REPLACE INTO ocr_cache (key, percentage, run_seconds, expires_at) VALUES (?, ?, ?, ?)',
+                [(key, percentage, run_seconds, expires_at) for key in keys]
+            )
+            conn.commit()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,178 @@
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from uploads import process_peak_rss_kb
+
+
+def run_ocr_job(image_bytes):
+    """Runs in a pool process.
+
+    Returns (percentage or None, started_at, finished_at, peak RSS of the
+    pool process in KiB).
+    """
+    # Imported here so OpenCV, numpy and pytesseract load only in the pool
+    # processes, never in the web workers that submit the jobs.
+    from ocr import extract_attendance_percentage
+
+    started_at = time.time()
+    try:
+        percentage = float(extract_attendance_percentage(image_bytes))
+    except ValueError:
+        percentage = None
+    return percentage, started_at, time.time(), process_peak_rss_kb()
+
+
+class OCRJobQueue:
+    """Attendance OCR on a process pool, with job state in the `ocr_jobs` table.
+
+    submit() refuses new work once `max_pending` jobs from this process are
+    queued or running, so a burst of uploads cannot pile up behind Tesseract.
+    Job rows live in SQLite so whichever worker serves the status poll can
+    answer it; finished rows are dropped after `job_ttl` seconds.  Results
+    are stored in `cache` (an OCRResultCache) under the keys given to submit().
+    Time spent in the pool process is reported to `metrics` as a span.
+    """
+
+    def __init__(self, pool, max_workers=2, max_pending=16, job_ttl=3600, cache=None, metrics=None):
+        self.pool = pool
+        self.cache = cache
+        self.metrics = metrics
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self.stats = {
+            'submitted': 0,
+            'rejected': 0,
+            'completed': 0,
+            'failed': 0,
+            'wait_seconds': 0.0,   # submit -> start in a pool process
+            'run_seconds': 0.0,    # time spent in extract_attendance_percentage()
+            'worker_peak_rss_kb': 0,
+        }
+
+    def _get_executor(self):
+        # Pool processes do not survive a fork, so each worker builds its own;
+        # a pool broken by a crashed child is replaced as well.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._executor = None
+            self._inflight = 0
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return self._executor
+
+    def submit(self, image_bytes, cache_keys=(), on_done=None):
+        """Queue an image and return its job id, or None when the queue is full.
+        `on_done()` is called once the job's result has been recorded."""
+        with self._lock:
+            executor = self._get_executor()
+            if self._inflight >= self.max_pending:
+                self.stats['rejected'] += 1
+                return None
+            self._inflight += 1
+            self.stats['submitted'] += 1
+
+        job_id = uuid.uuid4().hex
+        submitted_at = time.time()
+        try:
+            with self.pool.connection() as conn:
+                conn.execute('DELETE FROM ocr_jobs WHERE submitted_at < ?', (submitted_at - self.job_ttl,))
+                conn.execute(
+                    "INSERT INTO ocr_jobs (id, status, submitted_at, upload_bytes) VALUES (?, 'queued', ?, ?)",
+                    (job_id, submitted_at, len(image_bytes))
+                )
+                conn.commit()
+
+            try:
+                future = executor.submit(run_ocr_job, image_bytes)
+            except BrokenProcessPool:
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+                    executor = self._get_executor()
+                future = executor.submit(run_ocr_job, image_bytes)
+        except BaseException:
+            # No job will finish to give the slot back
+            with self._lock:
+                self._inflight -= 1
+            raise
+        future.add_done_callback(lambda f: self._finish(job_id, submitted_at, f, cache_keys, on_done))
+        return job_id
+
+    def _finish(self, job_id, submitted_at, future, cache_keys=(), on_done=None):
+        with self._lock:
+            self._inflight -= 1
+        try:
+            self._record(job_id, submitted_at, future, cache_keys)
+        finally:
+            # The caller's cleanup (e.g. an admission lease) must run however
+            # recording the result went
+            if on_done is not None:
+                on_done()
+
+    def _record(self, job_id, submitted_at, future, cache_keys):
+        try:
+            percentage, started_at, finished_at, rss_kb = future.result()
+            status = 'done'
+        except Exception as e:
+            print(f"OCR job {job_id} failed: {e}")
+            if isinstance(e, BrokenProcessPool):
+                with self._lock:
+                    self._executor = None
+            percentage, started_at, finished_at, rss_kb = None, None, time.time(), None
+            status = 'failed'
+
+        with self._lock:
+            self.stats['completed' if status == 'done' else 'failed'] += 1
+            if started_at is not None:
+                self.stats['wait_seconds'] += started_at - submitted_at
+                self.stats['run_seconds'] += finished_at - started_at
+            if rss_kb is not None:
+                self.stats['worker_peak_rss_kb'] = max(self.stats['worker_peak_rss_kb'], rss_kb)
+
+        if self.metrics is not None and started_at is not None:
+            self.metrics.observe_span('extract_attendance_percentage', finished_at - started_at)
+            self.metrics.observe_span('ocr_queue_wait', started_at - submitted_at)
+
+        if status == 'done' and self.cache is not None:
+            self.cache.put(cache_keys, percentage, finished_at - started_at)
+
+        with self.pool.connection() as conn:
+            conn.execute(
+                'UPDATE ocr_jobs SET status = ?, percentage = ?, started_at = ?, finished_at = ?, worker_peak_rss_kb = ? '
+                'WHERE id = ?',
+                (status, percentage, started_at, finished_at, rss_kb, job_id)
+            )
+            conn.commit()
+
+    def shutdown(self, wait=True):
+        """Stop taking jobs; with `wait`, let queued ones finish and record
+        their results first."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._pid = None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def status(self, job_id):
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT * FROM ocr_jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['inflight'] = self._inflight
+        return stats
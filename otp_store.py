@@ -0,0 +1,151 @@
+import abc
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class OTPStore(abc.ABC):
+    """Pending registrations keyed by email, each expiring after `ttl` seconds.
+
+    Records are plain dicts ({'otp': ..., 'data': {...}}).  Expired entries
+    are never returned; sweep() deletes them and trims the store to
+    `max_entries`, and start_sweeper() runs it periodically in the background.
+    """
+
+    def __init__(self, ttl=600, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._sweeper_pid = None
+
+    @abc.abstractmethod
+    def put(self, email, record):
+        ...
+
+    @abc.abstractmethod
+    def get(self, email):
+        ...
+
+    @abc.abstractmethod
+    def pop(self, email):
+        ...
+
+    @abc.abstractmethod
+    def sweep(self):
+        ...
+
+    def start_sweeper(self, interval=60):
+        if self._sweeper_pid == os.getpid():
+            return
+        self._sweeper_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"OTP sweep failed: {e}")
+
+        threading.Thread(target=run, name='otp-sweeper', daemon=True).start()
+
+
+class MemoryOTPStore(OTPStore):
+    """Per-process LRU; only correct when a single worker serves the app."""
+
+    def __init__(self, ttl=600, max_entries=10000):
+        super().__init__(ttl, max_entries)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # email -> (expires_at, record)
+
+    def put(self, email, record):
+        with self._lock:
+            self._entries[email] = (time.time() + self.ttl, record)
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, email):
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[email]
+                return None
+            return entry[1]
+
+    def pop(self, email):
+        with self._lock:
+            entry = self._entries.pop(email, None)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry[1]
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            expired = [email for email, (expires_at, _) in self._entries.items() if expires_at <= now]
+            for email in expired:
+                del self._entries[email]
+        return len(expired)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteOTPStore(OTPStore):
+    """Stores pending registrations in the `pending_registrations` table so
+    every worker process sees the same OTPs."""
+
+    def __init__(self, pool, ttl=600, max_entries=10000):
+        super().__init__(ttl, max_entries)
+        self.pool = pool
+
+    def put(self, email, record):
+        with self.pool.connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO pending_registrations (email, otp, data, expires_at) VALUES (?, ?, ?, ?)',
+                (email, record['otp'], json.dumps(record['data']), time.time() + self.ttl)
+            )
+            conn.commit()
+
+    def get(self, email):
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                'SELECT otp, data FROM pending_registrations WHERE email = ? AND expires_at > ?',
+                (email, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        return {'otp': row['otp'], 'data': json.loads(row['data'])}
+
+    def pop(self, email):
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT otp, data, expires_at FROM pending_registrations WHERE email = ?', (email,)
+            ).fetchone()
+            conn.execute('DELETE FROM pending_registrations WHERE email = ?', (email,))
+            conn.commit()
+        if row is None or row['expires_at'] <= time.time():
+            return None
+        return {'otp': row['otp'], 'data': json.loads(row['data'])}
+
+    def sweep(self):
+        with self.pool.connection() as conn:
+            removed = conn.execute('DELETE FROM pending_registrations WHERE expires_at <= ?', (time.time(),)).rowcount
+            # Over the cap: drop the registrations closest to expiring.
+            removed += conn.execute('''
+                DELETE FROM pending_registrations WHERE email IN (
+                    SELECT email FROM pending_registrations ORDER BY expires_at
+                    LIMIT max(0, (SELECT COUNT(*) FROM pending_registrations) - ?)
+                )
+            ''', (self.max_entries,)).rowcount
+            conn.commit()
+        return removed
+
+    def __len__(self):
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM pending_registrations').fetchone()[0]
@@ -0,0 +1,27 @@
+import base64
+
+
+def encode_cursor(timestamp, row_id):
+    raw = f'{timestamp}|{row_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) from encode_cursor(), or None if it is malformed."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.rsplit('|', 1)
+        return timestamp, int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def canonical_cursor(cursor):
+    """The one spelling of `cursor` that encode_cursor() produces, or None
+    if it is malformed (the views then render the first page)."""
+    decoded = decode_cursor(cursor)
+    if decoded is None:
+        return None
+    return encode_cursor(*decoded)
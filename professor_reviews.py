@@ -0,0 +1,40 @@
+from pagination import encode_cursor
+
+
+REVIEWS_PER_PAGE = 20
+
+# Only what the professor page shows; never the reviewer's email.
+REVIEW_COLUMNS = 'id, review_text, timestamp'
+
+FIRST_PAGE = (f'SELECT {REVIEW_COLUMNS} FROM reviews WHERE professor_id = ? '
+              'ORDER BY timestamp DESC, id DESC LIMIT ?')
+PAGE_BEFORE = (f'SELECT {REVIEW_COLUMNS} FROM reviews WHERE professor_id = ? AND (timestamp, id) < (?, ?) '
+               'ORDER BY timestamp DESC, id DESC LIMIT ?')
+
+
+def fetch_reviews(conn, professor_id, before=None, limit=REVIEWS_PER_PAGE):
+    """One page of a professor's reviews, newest first, and the next cursor.
+
+    Keyset pagination on (timestamp, id) over idx_reviews_professor.
+    """
+    if before is None:
+        rows = conn.execute(FIRST_PAGE, (professor_id, limit + 1)).fetchall()
+    else:
+        rows = conn.execute(PAGE_BEFORE, (professor_id, before[0], before[1], limit + 1)).fetchall()
+
+    reviews = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = reviews[-1]
+        next_cursor = encode_cursor(last['timestamp'], last['id'])
+    return reviews, next_cursor
+
+
+def reviews_etag(professor, cursor, limit=REVIEWS_PER_PAGE):
+    """Validator for one page of a professor's reviews.
+
+    Built from the counters the reviews triggers keep on the professor row,
+    so a conditional GET is answered without touching the reviews table.
+    The count is included because a deletion leaves the latest id unchanged.
+    """
+    return f"{professor['id']}-{professor['last_review_id']}-{professor['review_count']}-{cursor or ''}-{limit}"
@@ -0,0 +1,41 @@
+"""Statements the routes in main.py run on every hit.
+
+They live here rather than inline so tests/test_query_plans.py checks the
+SQL the routes actually run; the other modules' hot statements are
+module constants for the same reason.
+"""
+
+USER_BY_EMAIL = 'SELECT * FROM users WHERE email = ?'
+
+PROFESSOR_ID_BY_NAME = 'SELECT id FROM professors WHERE Name = ?'
+PROFESSOR_BY_ID = 'SELECT * FROM professors WHERE id = ?'
+PROFESSOR_EXISTS = 'SELECT id FROM professors WHERE id = ?'
+PROFESSOR_NAME = 'SELECT Name FROM professors WHERE id = ?'
+PROFESSOR_REVIEW_COUNTERS = 'SELECT id, review_count, last_review_id FROM professors WHERE id = ?'
+
+USER_RATINGS = '''
+    SELECT
+        r.teaching_rating,
+        r.content_rating,
+        r.overall_rating,
+        r.rating,
+        r.comment,
+        r.timestamp,
+        p.Name AS professor_name,
+        p.id AS professor_id
+    FROM ratings r
+    JOIN professors p ON r.professor_id = p.id
+    WHERE r.user_email = ?
+    ORDER BY r.timestamp DESC
+'''
+USER_REVIEWS = '''
+    SELECT rv.review_text, rv.timestamp, p.Name AS professor_name, p.id AS professor_id
+    FROM reviews rv
+    JOIN professors p ON rv.professor_id = p.id
+    WHERE rv.user_email = ?
+    ORDER BY rv.timestamp DESC
+'''
+
+COMMUNITY_USER_BY_EMAIL = 'SELECT * FROM community_users WHERE email = ?'
+COMMUNITY_USERNAME = 'SELECT username FROM community_users WHERE email = ?'
+COMMUNITY_USER_BY_USERNAME = 'SELECT * FROM community_users WHERE username = ?'
@@ -0,0 +1,262 @@
+import functools
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request, session
+
+
+def client_key():
+    # Signed-in users are limited per account, everyone else per address
+    email = session.get('email')
+    return f'user:{email}' if email else f'ip:{request.remote_addr}'
+
+
+def parse_costs(text):
+    """{'search': 1.0, ...} from 'search=1,register=10'."""
+    costs = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        name, _, cost = item.partition('=')
+        costs[name.strip()] = float(cost)
+    return costs
+
+
+class MemoryBucketBackend:
+    """Buckets in this process only; with several workers each one allows a
+    client the full rate, so use SQLiteBucketBackend there."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()   # key -> (tokens, updated_at)
+
+    def take(self, key, cost, capacity, rate):
+        """Take `cost` tokens from `key`'s bucket.  Returns 0.0 if they were
+        there, else the seconds until they will be."""
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+            wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+            self._buckets[key] = (tokens - cost if not wait else tokens, now)
+            # A bucket left out is full, so dropping the oldest is harmless
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBucketBackend:
+    """Buckets in the `rate_limit_buckets` table, so a client's limit holds
+    across every worker.  A take is a single UPSERT that refills and spends
+    in one statement and writes nothing when the tokens are not there."""
+
+    TAKE = '''
+        INSERT INTO rate_limit_buckets (key, tokens, updated_at) VALUES (:key, :capacity - :cost, :now)
+        ON CONFLICT (key) DO UPDATE
+            SET tokens = min(:capacity, tokens + max(0, :now - updated_at) * :rate) - :cost, updated_at = :now
+            WHERE min(:capacity, tokens + max(0, :now - updated_at) * :rate) >= :cost
+        RETURNING tokens
+    '''
+    BUCKET = 'SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?'
+
+    def __init__(self, pool, sweep_interval=60):
+        self.pool = pool
+        self.sweep_interval = sweep_interval
+        self._swept = 0.0
+
+    def take(self, key, cost, capacity, rate):
+        now = time.time()
+        params = {'key': key, 'cost': cost, 'capacity': capacity, 'rate': rate, 'now': now}
+        with self.pool.connection() as conn:
+            if now - self._swept > self.sweep_interval:
+                # Buckets idle long enough to have refilled are the same as none
+                self._swept = now
+                conn.execute('DELETE FROM rate_limit_buckets WHERE updated_at < ?', (now - capacity / rate,))
+            taken = conn.execute(self.TAKE, params).fetchone()
+            if taken is None:
+                row = conn.execute(self.BUCKET, (key,)).fetchone()
+            conn.commit()
+        if taken is not None:
+            return 0.0
+        tokens = min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+        return (cost - tokens) / rate
+
+    def __len__(self):
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM rate_limit_buckets').fetchone()[0]
+
+
+class RateLimiter:
+    """A token bucket per client (client_key()), shared by every limited view.
+
+    A bucket holds up to `capacity` tokens and refills at
+    `refill_per_second`.  Each limited view has a name and takes its cost
+    from `costs` (1 if not listed) per request, so one client can search
+    often but only register or upload now and then, and the views together
+    cannot take more than the refill rate.  A request whose tokens are not
+    there gets `on_limited(retry_after)`, which should be a 429 response.
+
+    If the backend cannot be reached (e.g. SQLite stays locked) the request
+    goes through and `errors` is counted: the limiter protects the site from
+    one client, it should not take the site down with it.
+    """
+
+    def __init__(self, backend, capacity=30, refill_per_second=0.5, costs=None, on_limited=None,
+                 key=client_key, enabled=True):
+        self.backend = backend
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.costs = dict(costs or {})
+        self.on_limited = on_limited
+        self.key = key
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.stats = {}   # name -> counters
+
+    def _count(self, name, outcome, cost=0.0):
+        with self._lock:
+            counters = self.stats.setdefault(name, {'allowed': 0, 'limited': 0, 'errors': 0, 'tokens': 0.0})
+            counters[outcome] += 1
+            counters['tokens'] += cost
+
+    def check(self, name):
+        """Seconds the current client must wait before `name`; 0.0 lets it through
+        (and spends its cost)."""
+        cost = min(self.costs.get(name, 1.0), self.capacity)
+        try:
+            wait = self.backend.take(self.key(), cost, self.capacity, self.refill_per_second)
+        except sqlite3.OperationalError as e:
+            self._count(name, 'errors')
+            print(f"Rate limit check for {name} failed: {e}")
+            return 0.0
+        self._count(name, 'limited' if wait else 'allowed', 0.0 if wait else cost)
+        return wait
+
+    def limit(self, name, methods=('POST',), when=None):
+        """Decorator for a view.  Only requests with one of `methods` are
+        limited, and with `when` given only those for which it returns True
+        (e.g. a search, not the plain page)."""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(**kwargs):
+                if (not self.enabled or request.method not in methods
+                        or (when is not None and not when())):
+                    return view(**kwargs)
+                wait = self.check(name)
+                if wait:
+                    return self.on_limited(max(1, math.ceil(wait)))
+                return view(**kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self._lock:
+            views = {name: dict(counters) for name, counters in self.stats.items()}
+        return {'backend': type(self.backend).__name__, 'capacity': self.capacity,
+                'refill_per_second': self.refill_per_second, 'views': views}
+
+
+class AdmissionGate:
+    """At most `limit` holders of one expensive resource at a time, across
+    every worker.
+
+    acquire() takes a lease in the `admission_leases` table, or returns None
+    at once when all `limit` are out: callers answer 429 rather than queue.
+    The lease is given back with release() when the work is finished; one
+    never released (its worker was killed) lapses after `lease_seconds`.
+    Lease ids are never reused, so releasing a lease that has already
+    lapsed cannot give back someone else's.
+    retry_after() suggests how long to wait, from how long leases in this
+    process have been held.
+
+    Like RateLimiter, the gate fails open: if the leases table cannot be
+    reached, acquire() counts `errors` and returns UNTRACKED, a lease that
+    lets the caller through and that release() ignores.
+    """
+
+    UNTRACKED = 0
+
+    ACQUIRE = '''
+        INSERT INTO admission_leases (gate, expires_at)
+        SELECT :gate, :now + :lease_seconds
+        WHERE (SELECT COUNT(*) FROM admission_leases WHERE gate = :gate AND expires_at > :now) < :limit
+    '''
+
+    def __init__(self, pool, name, limit, lease_seconds=300, default_retry_after=5):
+        self.pool = pool
+        self.name = name
+        self.limit = limit
+        self.lease_seconds = lease_seconds
+        self.default_retry_after = default_retry_after
+        self._lock = threading.Lock()
+        self._held = {}   # lease -> monotonic time acquired, for leases from this process
+        self.stats = {
+            'admitted': 0,
+            'rejected': 0,
+            'released': 0,
+            'errors': 0,
+            'held_seconds': 0.0,
+        }
+
+    def _error(self, action, e):
+        with self._lock:
+            self.stats['errors'] += 1
+        print(f"Admission gate {self.name}: {action} failed: {e}")
+
+    def acquire(self):
+        """A lease id, UNTRACKED if the gate could not be checked, or None if
+        the gate is full."""
+        now = time.time()
+        params = {'gate': self.name, 'now': now, 'lease_seconds': self.lease_seconds, 'limit': self.limit}
+        try:
+            with self.pool.connection() as conn:
+                conn.execute('DELETE FROM admission_leases WHERE gate = ? AND expires_at <= ?', (self.name, now))
+                cursor = conn.execute(self.ACQUIRE, params)
+                lease = cursor.lastrowid if cursor.rowcount == 1 else None
+                conn.commit()
+        except sqlite3.OperationalError as e:
+            self._error('acquire', e)
+            return self.UNTRACKED
+        with self._lock:
+            if lease is None:
+                self.stats['rejected'] += 1
+            else:
+                self.stats['admitted'] += 1
+                self._held[lease] = time.monotonic()
+        return lease
+
+    def release(self, lease):
+        if not lease:   # None or UNTRACKED
+            return
+        try:
+            with self.pool.connection() as conn:
+                conn.execute('DELETE FROM admission_leases WHERE id = ?', (lease,))
+                conn.commit()
+        except sqlite3.OperationalError as e:
+            # It lapses after lease_seconds instead
+            self._error('release', e)
+        with self._lock:
+            started = self._held.pop(lease, None)
+            if started is not None:
+                self.stats['released'] += 1
+                self.stats['held_seconds'] += time.monotonic() - started
+
+    def retry_after(self):
+        with self._lock:
+            released = self.stats['released']
+            held = self.stats['held_seconds']
+        if not released:
+            return self.default_retry_after
+        return min(60, max(1, math.ceil(held / released)))
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['held'] = len(self._held)
+        stats['limit'] = self.limit
+        return stats
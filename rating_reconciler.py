@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from collections import deque
+
+import rating_stats
+
+
+class RatingReconciler:
+    """Keeps professors' rating aggregates in line with `ratings` in the background.
+
+    Professors are marked in `dirty_professors` by the ratings triggers when
+    a rating is deleted or changed outside submit_rating().  A thread
+    recomputes the marked professors every `interval` seconds, or as soon as
+    wake() is called after such a write, in batches of about `batch_ratings`
+    ratings with one short BEGIN IMMEDIATE transaction each, so it never
+    holds the write lock for long.  The marks live in the database, so whichever worker gets
+    there first does the work.
+
+    Every professor whose numbers changed is handed to `on_change`, which
+    refreshes whatever the process caches.  Most only followed the deleted
+    or edited ratings and are just counted; those whose stored numbers were
+    wrong are printed and kept in `recent`.  The thread is started on first use in each process,
+    so the reconciler is safe to create before gunicorn forks.
+    """
+
+    def __init__(self, pool, interval=300.0, batch_ratings=rating_stats.BATCH_RATINGS, on_change=None,
+                 metrics=None, keep=50):
+        self.pool = pool
+        self.interval = interval
+        self.batch_ratings = batch_ratings
+        self.on_change = on_change
+        self.metrics = metrics
+        self.recent = deque(maxlen=keep)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.stats = {
+            'runs': 0,
+            'batches': 0,
+            'professors': 0,
+            'discrepancies': 0,        # stored numbers that were wrong
+            'updates': 0,              # numbers that only followed deleted or edited ratings
+            'failures': 0,
+            'busy_seconds': 0.0,       # in reconcile transactions, waits for the lock included
+            'max_batch_seconds': 0.0,  # longest single batch
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def start(self):
+        if self._pid == os.getpid() or not self.interval:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='rating-reconciler', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Reconcile now rather than at the next interval."""
+        self.start()
+        self._wake.set()
+
+    def stop(self, timeout=10.0):
+        self._stopping.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.run_once()
+            except Exception as e:
+                self._count('failures')
+                print(f"Rating reconcile failed: {e}")
+
+    def run_once(self):
+        """Work through every marked professor.  Returns the professors whose
+        numbers changed (see rating_stats.recompute)."""
+        self._count('runs')
+        discrepancies = []
+        with self.pool.connection() as conn:
+            while True:
+                start = time.perf_counter()
+                count, found = self.pool.run_immediate(
+                    conn, lambda conn: rating_stats.reconcile_batch(conn, self.batch_ratings))
+                elapsed = time.perf_counter() - start
+                if not count:
+                    break
+                corrected = sum(1 for discrepancy in found if discrepancy['corrected'])
+                with self._lock:
+                    self.stats['batches'] += 1
+                    self.stats['professors'] += count
+                    self.stats['discrepancies'] += corrected
+                    self.stats['updates'] += len(found) - corrected
+                    self.stats['busy_seconds'] += elapsed
+                    self.stats['max_batch_seconds'] = max(self.stats['max_batch_seconds'], elapsed)
+                if self.metrics is not None:
+                    self.metrics.observe_span('reconcile_ratings_batch', elapsed)
+                discrepancies += found
+
+        updated = 0
+        for discrepancy in discrepancies:
+            if discrepancy['corrected']:
+                print('Rating aggregates corrected: ' + rating_stats.describe(discrepancy))
+                self.recent.append(discrepancy)
+            else:
+                updated += 1
+        if updated:
+            print(f'Rating aggregates updated for deleted or edited ratings: {updated} professors')
+        if discrepancies and self.on_change is not None:
+            self.on_change(discrepancies)
+        return discrepancies
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
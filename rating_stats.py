@@ -0,0 +1,379 @@
+"""Per-professor rating aggregates kept in `professor_rating_stats`.
+
+One row per (professor, questionnaire item) with the exact count, sum, sum
+of squares and 1-5 histogram, updated in the same transaction as the
+rating insert, so the professor page reads nine rows instead of scanning
+`ratings`.  The `weighted` item is the final score each rating stores; it
+is what Avg_rating is derived from, together with the ratings that came in
+through the CSV import without rows of their own (professors.imported_*).
+
+Deleting or changing a rating outside submit_rating() (account deletion,
+hand edits) marks its professor in `dirty_professors` and logs the
+rating in `rating_changes`; reconcile() recomputes just those professors
+from `ratings` and reports the ones it updated, telling numbers that were
+only behind the logged changes from numbers that were wrong.  The app runs it in the background (see
+rating_reconciler.py); from the command line:
+
+    python rating_stats.py --reconcile     # the marked professors
+    python rating_stats.py --audit         # every professor, as a consistency check
+    python rating_stats.py --rebuild       # recompute everything from `ratings`
+"""
+import argparse
+import json
+import math
+import sqlite3
+
+import migrations
+
+
+TEACHING_ITEMS = ('explain_concepts', 'clear_lectures', 'encourages_participation', 'responsiveness')
+CONTENT_ITEMS = ('helpful_materials', 'manageable_workload', 'fair_grading')
+OVERALL_ITEM = 'overall_rating'
+ITEMS = TEACHING_ITEMS + CONTENT_ITEMS + (OVERALL_ITEM,)
+WEIGHTED = 'weighted'
+
+UPSERT = '''
+    INSERT INTO professor_rating_stats (professor_id, item, n, total, total_sq, h1, h2, h3, h4, h5)
+    VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (professor_id, item) DO UPDATE SET
+        n = n + 1,
+        total = total + excluded.total,
+        total_sq = total_sq + excluded.total_sq,
+        h1 = h1 + excluded.h1, h2 = h2 + excluded.h2, h3 = h3 + excluded.h3,
+        h4 = h4 + excluded.h4, h5 = h5 + excluded.h5
+'''
+
+
+def bucket(value):
+    """Histogram bucket (1-5) for a score; weighted scores round half up."""
+    return min(5, max(1, int(value + 0.5)))
+
+
+def weighted_rating(scores):
+    """40% teaching, 30% content, 30% overall, from the raw item scores.
+
+    Written as (teaching sum + content sum + 3 * overall) / 10, which is
+    what 0.4 * mean(teaching) + 0.3 * mean(content) + 0.3 * overall reduces
+    to for four teaching and three content items.
+    """
+    teaching = sum(scores[item] for item in TEACHING_ITEMS)
+    content = sum(scores[item] for item in CONTENT_ITEMS)
+    return (teaching + content + 3 * scores[OVERALL_ITEM]) / 10
+
+
+def record(conn, prof_id, scores, weighted):
+    """Add one rating to the aggregates and refresh the professor's Avg_rating.
+
+    Runs inside the caller's transaction.  Returns (Avg_rating, no_ratings).
+    """
+    rows = []
+    for item, value in list(scores.items()) + [(WEIGHTED, weighted)]:
+        histogram = [0] * 5
+        histogram[bucket(value) - 1] = 1
+        rows.append((prof_id, item, value, value * value, *histogram))
+    conn.executemany(UPSERT, rows)
+    return refresh_professor(conn, prof_id)
+
+
+# Avg_rating and no_ratings straight from the aggregates, in one statement,
+# so the value written is always consistent with the sums it came from.
+REFRESH_PROFESSOR = f'''
+    UPDATE professors SET
+        no_ratings = imported_ratings + COALESCE(
+            (SELECT n FROM professor_rating_stats WHERE professor_id = professors.id AND item = '{WEIGHTED}'), 0),
+        Avg_rating = COALESCE(ROUND(
+            (imported_rating_total + COALESCE(
+                (SELECT total FROM professor_rating_stats WHERE professor_id = professors.id AND item = '{WEIGHTED}'), 0))
+            / NULLIF(imported_ratings + COALESCE(
+                (SELECT n FROM professor_rating_stats WHERE professor_id = professors.id AND item = '{WEIGHTED}'), 0), 0),
+            2), 0.0)
+    WHERE id = ?
+'''
+
+
+def refresh_professor(conn, prof_id):
+    conn.execute(REFRESH_PROFESSOR, (prof_id,))
+    row = conn.execute('SELECT Avg_rating, no_ratings FROM professors WHERE id = ?', (prof_id,)).fetchone()
+    return row[0], row[1]
+
+
+def summarize(n, total, total_sq, histogram):
+    mean = total / n if n else None
+    variance = max(0.0, total_sq / n - mean * mean) if n else None
+    return {
+        'n': n,
+        'mean': round(mean, 2) if mean is not None else None,
+        'stddev': round(math.sqrt(variance), 2) if variance is not None else None,
+        'histogram': histogram,
+    }
+
+
+def load(conn, prof_id):
+    """{item: summary} for one professor, plus pooled 'teaching' and 'content'."""
+    rows = conn.execute(
+        'SELECT item, n, total, total_sq, h1, h2, h3, h4, h5 FROM professor_rating_stats WHERE professor_id = ?',
+        (prof_id,)
+    ).fetchall()
+    raw = {row['item']: (row['n'], row['total'], row['total_sq'], [row[f'h{i}'] for i in range(1, 6)])
+           for row in rows}
+
+    stats = {item: summarize(*values) for item, values in raw.items()}
+    for dimension, items in (('teaching', TEACHING_ITEMS), ('content', CONTENT_ITEMS)):
+        parts = [raw[item] for item in items if item in raw]
+        if parts:
+            stats[dimension] = summarize(
+                sum(part[0] for part in parts),
+                sum(part[1] for part in parts),
+                sum(part[2] for part in parts),
+                [sum(part[3][i] for part in parts) for i in range(5)],
+            )
+    return stats
+
+
+def rebuild(conn):
+    """Recompute every aggregate from `ratings` in one pass, then every
+    professor's Avg_rating and no_ratings.  Returns the number of stats rows."""
+    import pandas as pd
+
+    ratings = pd.read_sql_query(
+        f'SELECT professor_id, {", ".join(ITEMS)}, rating AS {WEIGHTED} FROM ratings', conn
+    )
+    scores = ratings.melt(id_vars='professor_id', var_name='item', value_name='value').dropna()
+    scores['sq'] = scores['value'] ** 2
+    scores['bucket'] = (scores['value'] + 0.5).astype(int).clip(1, 5)
+
+    sums = scores.groupby(['professor_id', 'item']).agg(n=('value', 'size'), total=('value', 'sum'),
+                                                          total_sq=('sq', 'sum'))
+    histograms = (scores.groupby(['professor_id', 'item', 'bucket']).size()
+                  .unstack('bucket').reindex(columns=range(1, 6), fill_value=0).fillna(0).astype(int))
+    table = sums.join(histograms).reset_index()
+
+    rows = [
+        (int(row['professor_id']), row['item'], int(row['n']), float(row['total']), float(row['total_sq']),
+         *(int(row[i]) for i in range(1, 6)))
+        for row in table.to_dict('records')
+    ]
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM professor_rating_stats')
+        conn.executemany('INSERT INTO professor_rating_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        # The rebuilt numbers already reflect every logged change
+        conn.execute('DELETE FROM rating_changes')
+        conn.executemany(REFRESH_PROFESSOR, conn.execute('SELECT id FROM professors').fetchall())
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return len(rows)
+
+
+def _item_aggregates(column):
+    # count, sum, sum of squares and the 1-5 histogram; the bucket bounds are
+    # bucket()'s rounding (half up) written as ranges
+    return (f'COUNT({column}), TOTAL({column}), TOTAL({column} * {column}), TOTAL({column} < 1.5), '
+            + ', '.join(f'TOTAL({column} >= {b - 0.5} AND {column} < {b + 0.5})' for b in range(2, 5))
+            + f', TOTAL({column} >= 4.5)')
+
+
+# Every item of a batch of professors in one grouped pass over their
+# `ratings` rows: one result row per professor, eight columns per item.
+ITEM_COLUMNS = {**{item: item for item in ITEMS}, WEIGHTED: 'rating'}
+RECOMPUTE = f'''
+    SELECT r.professor_id, {", ".join(_item_aggregates(f"r.{column}") for column in ITEM_COLUMNS.values())}
+    FROM ratings r
+    WHERE r.professor_id IN (SELECT value FROM json_each(?))
+    GROUP BY r.professor_id
+'''
+
+# What the logged rating changes add to (sign 1) or take from (sign -1) each
+# item's count and sum: one result row per professor, two columns per item.
+CHANGES = f'''
+    SELECT c.professor_id, {", ".join(f"TOTAL(c.sign * (c.{column} IS NOT NULL)), TOTAL(c.sign * c.{column})"
+                                      for column in ITEM_COLUMNS.values())}
+    FROM rating_changes c
+    WHERE c.professor_id IN (SELECT value FROM json_each(?))
+    GROUP BY c.professor_id
+'''
+
+
+def recompute(conn, professor_ids):
+    """Rewrite the aggregates, Avg_rating and no_ratings of `professor_ids`
+    from `ratings`.  Runs inside the caller's transaction.
+
+    Returns the professors whose stored values changed, as
+    {'professor_id', 'avg_rating': [old, new], 'no_ratings': [old, new],
+    'items': [items whose count or sum was off], 'corrected'}.  `corrected`
+    is False when the stored values plus the changes in `rating_changes`
+    matched `ratings`, i.e. they were only behind deleted or edited ratings.
+    """
+    batch = json.dumps(list(professor_ids))
+
+    def professors():
+        # (Avg_rating, no_ratings, the unrounded mean of the stored sums)
+        return {row[0]: row[1:] for row in conn.execute(f'''
+            SELECT p.id, p.Avg_rating, p.no_ratings,
+                   (p.imported_rating_total + COALESCE(s.total, 0)) / NULLIF(p.no_ratings, 0)
+            FROM professors p
+            LEFT JOIN professor_rating_stats s ON s.professor_id = p.id AND s.item = '{WEIGHTED}'
+            WHERE p.id IN (SELECT value FROM json_each(?))
+        ''', (batch,))}
+
+    before = professors()
+    stored = {(row[0], row[1]): (row[2], row[3]) for row in conn.execute(
+        'SELECT professor_id, item, n, total FROM professor_rating_stats '
+        'WHERE professor_id IN (SELECT value FROM json_each(?))', (batch,))}
+    pending = {}
+    for result in conn.execute(CHANGES, (batch,)):
+        for i, item in enumerate(ITEM_COLUMNS):
+            pending[(result[0], item)] = (int(result[1 + 2 * i]), result[2 + 2 * i])
+    rows = []
+    for result in conn.execute(RECOMPUTE, (batch,)):
+        for i, item in enumerate(ITEM_COLUMNS):
+            n, total, total_sq, *histogram = result[1 + 8 * i:9 + 8 * i]
+            if n:
+                rows.append((result[0], item, n, total, total_sq, *(int(count) for count in histogram)))
+
+    conn.execute('DELETE FROM professor_rating_stats WHERE professor_id IN (SELECT value FROM json_each(?))',
+                 (batch,))
+    conn.executemany('INSERT INTO professor_rating_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    conn.executemany(REFRESH_PROFESSOR, ((prof_id,) for prof_id in before))
+    after = professors()
+
+    fresh = {(row[0], row[1]): (row[2], row[3]) for row in rows}
+    wrong_items = {}
+    changed = set()
+    for key in stored.keys() | fresh.keys():
+        old, new = stored.get(key, (0, 0.0)), fresh.get(key, (0, 0.0))
+        delta = pending.get(key, (0, 0.0))
+        # Sums built up one rating at a time may differ in the last bits
+        if old[0] + delta[0] != new[0] or abs(old[1] + delta[1] - new[1]) > 1e-6:
+            wrong_items.setdefault(key[0], []).append(key[1])
+        elif delta[0] or abs(delta[1]) > 1e-6:
+            changed.add(key[0])
+
+    discrepancies = []
+    for prof_id, (old_avg, old_n, old_mean) in before.items():
+        new_avg, new_n, _ = after[prof_id]
+        # Off by more than the rounding to two places; sums added up in another
+        # order can round a mean of x.xx5 either way.
+        corrected = (prof_id in wrong_items
+                     or old_n + pending.get((prof_id, WEIGHTED), (0, 0.0))[0] != new_n
+                     or abs((old_avg or 0) - (old_mean or 0)) > 0.005 + 1e-9)
+        if corrected or prof_id in changed:
+            discrepancies.append({
+                'professor_id': prof_id,
+                'avg_rating': [old_avg, new_avg],
+                'no_ratings': [old_n, new_n],
+                'items': sorted(wrong_items.get(prof_id, [])),
+                'corrected': corrected,
+            })
+    return discrepancies
+
+
+# A batch covers about this many ratings (by the professors' stored counts),
+# so one professor with thousands of ratings does not stretch a batch, and
+# with it how long the write lock is held.
+BATCH_RATINGS = 20000
+BATCH_PROFESSORS = 1000
+
+
+def reconcile_batch(conn, batch_ratings=BATCH_RATINGS):
+    """Recompute the next marked professors, about `batch_ratings` ratings'
+    worth (at least one professor), and clear their marks.  Runs inside the
+    caller's transaction, which should be BEGIN IMMEDIATE so no rating lands
+    between the read and the write.
+
+    Returns (number of professors recomputed, discrepancies).
+    """
+    ids = []
+    covered = 0
+    for prof_id, no_ratings in conn.execute(
+            'SELECT d.professor_id, COALESCE(p.no_ratings, 0) FROM dirty_professors d '
+            'LEFT JOIN professors p ON p.id = d.professor_id ORDER BY d.professor_id LIMIT ?',
+            (BATCH_PROFESSORS,)).fetchall():
+        if ids and covered + no_ratings > batch_ratings:
+            break
+        ids.append(prof_id)
+        covered += no_ratings
+    if not ids:
+        return 0, []
+    discrepancies = recompute(conn, ids)
+    conn.execute('DELETE FROM dirty_professors WHERE professor_id IN (SELECT value FROM json_each(?))',
+                 (json.dumps(ids),))
+    conn.execute('DELETE FROM rating_changes WHERE professor_id IN (SELECT value FROM json_each(?))',
+                 (json.dumps(ids),))
+    return len(ids), discrepancies
+
+
+def mark_all(conn):
+    """Mark every professor, so the next reconcile checks them all."""
+    conn.execute("INSERT OR IGNORE INTO dirty_professors "
+                 "SELECT id, (julianday('now') - 2440587.5) * 86400.0 FROM professors")
+    conn.commit()
+
+
+def reconcile(conn, batch_ratings=BATCH_RATINGS):
+    """Work through every marked professor, one short transaction per batch.
+    `conn` must be in autocommit mode (isolation_level=None).
+
+    Returns (number of professors recomputed, discrepancies).
+    """
+    total = 0
+    discrepancies = []
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            count, found = reconcile_batch(conn, batch_ratings)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if not count:
+            return total, discrepancies
+        total += count
+        discrepancies += found
+
+
+def describe(discrepancy):
+    (old_avg, new_avg), (old_n, new_n) = discrepancy['avg_rating'], discrepancy['no_ratings']
+    items = f", items {', '.join(discrepancy['items'])}" if discrepancy['items'] else ''
+    return (f"professor {discrepancy['professor_id']}: Avg_rating {old_avg} -> {new_avg}, "
+            f"no_ratings {old_n} -> {new_n}{items}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='database.db')
+    parser.add_argument('--rebuild', action='store_true', help='recompute every aggregate from ratings')
+    parser.add_argument('--reconcile', action='store_true', help='recompute the professors marked dirty')
+    parser.add_argument('--audit', action='store_true', help='mark every professor, then reconcile')
+    parser.add_argument('--batch-ratings', type=int, default=BATCH_RATINGS, help='ratings per transaction')
+    args = parser.parse_args()
+
+    migrations.migrate(args.db)
+    if args.rebuild:
+        conn = sqlite3.connect(args.db, isolation_level=None)
+        try:
+            print(f'Rebuilt {rebuild(conn)} rating stats rows')
+        finally:
+            conn.close()
+    elif args.reconcile or args.audit:
+        conn = sqlite3.connect(args.db, isolation_level=None)
+        try:
+            if args.audit:
+                mark_all(conn)
+            count, discrepancies = reconcile(conn, args.batch_ratings)
+            corrected = [discrepancy for discrepancy in discrepancies if discrepancy['corrected']]
+            for discrepancy in corrected:
+                print(describe(discrepancy))
+            print(f'Recomputed {count} professors, {len(corrected)} were out of step, '
+                  f'{len(discrepancies) - len(corrected)} updated for deleted or edited ratings')
+        finally:
+            conn.close()
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
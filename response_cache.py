@@ -0,0 +1,209 @@
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from flask import make_response, request, session
+
+
+class MemoryCacheBackend:
+    """In-process LRU.  Each worker has its own copy and only sees its own
+    invalidations, so use SQLiteCacheBackend when running several workers."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, entry, tags)
+        self._tagged = {}               # tag -> set of keys
+
+    def _drop(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.time():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def set(self, key, entry, tags, ttl):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.time() + ttl, entry, tuple(tags))
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tagged.get(tag, ())):
+                    self._drop(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """Entries in the `response_cache` table, so every worker shares them and
+    an invalidation in one worker is seen by all of them."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def get(self, key):
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                'SELECT body, mimetype, etag, created_at FROM response_cache WHERE key = ? AND expires_at > ?',
+                (key, time.time())
+            ).fetchone()
+        return dict(row) if row else None
+
+    def set(self, key, entry, tags, ttl):
+        now = time.time()
+        with self.pool.connection() as conn:
+            conn.execute(
+                'DELETE FROM response_cache_tags WHERE key IN (SELECT key FROM response_cache WHERE expires_at <= ?)',
+                (now,)
+            )
+            conn.execute('DELETE FROM response_cache WHERE expires_at <= ?', (now,))
+            conn.execute('DELETE FROM response_cache_tags WHERE key = ?', (key,))
+            conn.execute(
+                'INSERT OR REPLACE INTO response_cache (key, body, mimetype, etag, created_at, expires_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, entry['body'], entry['mimetype'], entry['etag'], entry['created_at'], now + ttl)
+            )
+            conn.executemany('INSERT OR IGNORE INTO response_cache_tags (tag, key) VALUES (?, ?)',
+                             [(tag, key) for tag in tags])
+            conn.commit()
+
+    def invalidate(self, tags):
+        tags = list(tags)
+        placeholders = ', '.join('?' * len(tags))
+        with self.pool.connection() as conn:
+            conn.execute(
+                f'DELETE FROM response_cache WHERE key IN '
+                f'(SELECT key FROM response_cache_tags WHERE tag IN ({placeholders}))',
+                tags
+            )
+            conn.execute(f'DELETE FROM response_cache_tags WHERE tag IN ({placeholders})', tags)
+            conn.commit()
+
+    def __len__(self):
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+
+def logged_in_variant():
+    # Pages render a different header for signed-in users.
+    return 'user' if 'email' in session else 'anon'
+
+
+class ResponseCache:
+    """Caches whole rendered GET responses by path, query string and variant.
+
+    Each cached view declares tags; the write routes call invalidate() with
+    the tags they affect after committing.  Every cached response carries an
+    ETag and Last-Modified, and conditional requests get a 304.
+    """
+
+    def __init__(self, backend, default_ttl=300, enabled=True):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.stats = {}   # endpoint -> counters
+
+    def _count(self, endpoint, outcome):
+        with self._lock:
+            counters = self.stats.setdefault(endpoint, {'hits': 0, 'misses': 0, 'bypassed': 0, 'not_modified': 0})
+            counters[outcome] += 1
+
+    def cached(self, tags=(), ttl=None, vary=logged_in_variant, unless=None, shows_flashes=False, params=None):
+        """Decorator for a view.  `tags` is a sequence, or a callable taking
+        the view's keyword arguments; `unless` is a callable that, when it
+        returns True, skips the cache (e.g. for a login check in the view).
+        Pages that display flash messages set `shows_flashes`, so a request
+        with messages pending is rendered fresh and consumes them.
+
+        `params` maps the query arguments the view reads to a function
+        returning their canonical form, or None for a value the view ignores.
+        Only those canonical values are part of the key; anything else in the
+        query string is ignored, so junk arguments cannot fill the cache with
+        copies of one page."""
+        ttl = ttl or self.default_ttl
+        params = params or {}
+
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(**kwargs):
+                endpoint = request.endpoint
+                if (not self.enabled or request.method != 'GET'
+                        or (shows_flashes and '_flashes' in session)
+                        or (unless is not None and unless())):
+                    self._count(endpoint, 'bypassed')
+                    return view(**kwargs)
+
+                key = f'{vary()}:{request.path}'
+                args = []
+                for name, canonical in params.items():
+                    value = canonical(request.args[name]) if name in request.args else None
+                    if value is not None:
+                        args.append((name, value))
+                if args:
+                    key += '?' + urlencode(args)
+                entry = self.backend.get(key)
+                if entry is not None:
+                    self._count(endpoint, 'hits')
+                    response = make_response(entry['body'])
+                    response.mimetype = entry['mimetype']
+                else:
+                    self._count(endpoint, 'misses')
+                    response = make_response(view(**kwargs))
+                    if response.status_code != 200 or response.direct_passthrough:
+                        return response
+                    body = response.get_data()
+                    entry = {
+                        'body': body,
+                        'mimetype': response.mimetype,
+                        'etag': hashlib.sha1(body).hexdigest(),
+                        'created_at': time.time(),
+                    }
+                    view_tags = tags(**kwargs) if callable(tags) else tags
+                    self.backend.set(key, entry, view_tags, ttl)
+
+                response.set_etag(entry['etag'])
+                response.last_modified = entry['created_at']
+                response.headers['Cache-Control'] = 'no-cache'
+                response.make_conditional(request)
+                if response.status_code == 304:
+                    self._count(endpoint, 'not_modified')
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        if tags:
+            self.backend.invalidate(tags)
+
+    def snapshot(self):
+        with self._lock:
+            routes = {endpoint: dict(counters) for endpoint, counters in self.stats.items()}
+        for counters in routes.values():
+            lookups = counters['hits'] + counters['misses']
+            counters['hit_ratio'] = counters['hits'] / lookups if lookups else 0.0
+        return {'backend': type(self.backend).__name__, 'entries': len(self.backend), 'routes': routes}
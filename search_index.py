@@ -0,0 +1,233 @@
+import heapq
+import threading
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+
+from db import data_versions
+
+
+# Columns the listing pages need from `professors`
+PROFESSOR_FIELDS = ('id', 'Name', 'Designation', 'Photo', 'Avg_rating')
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ProfessorSearchIndex:
+    """In-memory name index for the search box on index().
+
+    Mirrors the old behaviour of index(): substring matches first (in table
+    order) and, when there are fewer than `limit` of those, the fuzz.partial_ratio
+    top-`limit` names appended after them.  Exact matches come from trigram
+    postings and SQLite is never touched on the request path.
+
+    Up to `exhaustive_limit` professors every name is rescored with
+    partial_ratio, which gives exactly the old ranking.  Past that, only the
+    `candidate_pool` names sharing the most trigrams with the query (or a
+    token prefix, for queries too short or too misspelt to share any) are
+    scored, so ties at the cut-off may resolve to different names.  Results
+    are memoised per query until the next build().
+
+    ensure_loaded() compares the index with the `data_versions` counters on
+    every search, so professors added, renamed or re-rated by another worker
+    or by import_professors.py show up on the next search: a changed name
+    rebuilds the index, a changed rating only re-reads Avg_rating.
+    """
+
+    def __init__(self, candidate_pool=100, exhaustive_limit=5000, cache_size=512):
+        self.candidate_pool = candidate_pool
+        self.exhaustive_limit = exhaustive_limit
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._state = None
+
+    @property
+    def loaded(self):
+        return self._state is not None
+
+    def build(self, rows, versions=None):
+        # fuzzywuzzy (and python-Levenshtein) load with the first index build
+        from fuzzywuzzy import utils
+
+        rows = [{field: row[field] for field in PROFESSOR_FIELDS} for row in rows]
+        lower_names = [(row['Name'] or '').lower() for row in rows]
+        fuzzy_names = [utils.full_process(row['Name'] or '') for row in rows]
+
+        postings = {}
+        prefixes = []
+        name_positions = {}
+        for pos, name in enumerate(lower_names):
+            for gram in trigrams(name):
+                postings.setdefault(gram, []).append(pos)
+            for token in fuzzy_names[pos].split():
+                prefixes.append((token, pos))
+            name_positions.setdefault(rows[pos]['Name'], []).append(pos)
+        prefixes.sort()
+
+        # Swap the whole state in one assignment so searches running in other
+        # threads always see a consistent snapshot.
+        self._state = _IndexState(
+            rows=rows,
+            lower_names=lower_names,
+            fuzzy_names=fuzzy_names,
+            positions={row['id']: pos for pos, row in enumerate(rows)},
+            name_positions=name_positions,
+            postings=postings,
+            prefixes=prefixes,
+            results=OrderedDict(),
+            versions=versions or {},
+        )
+
+    def refresh(self, conn, versions=None):
+        # Counters are read before the rows: a change in between only makes
+        # the next check reload again, never hides the change.
+        versions = data_versions(conn) if versions is None else versions
+        rows = conn.execute(
+            'SELECT id, Name, Designation, Photo, Avg_rating FROM professors ORDER BY id'
+        ).fetchall()
+        self.build(rows, versions)
+
+    def refresh_ratings(self, conn, versions):
+        state = self._state
+        for prof_id, avg_rating in conn.execute('SELECT id, Avg_rating FROM professors'):
+            pos = state.positions.get(prof_id)
+            if pos is not None and state.rows[pos]['Avg_rating'] != avg_rating:
+                state.rows[pos] = {**state.rows[pos], 'Avg_rating': avg_rating}
+        state.versions = versions
+
+    def ensure_loaded(self, connect):
+        conn = connect()
+        versions = data_versions(conn)
+        state = self._state
+        if state is not None and state.versions == versions:
+            return
+        with self._lock:
+            state = self._state
+            if state is None or state.versions.get('professors') != versions.get('professors'):
+                self.refresh(conn, versions)
+            elif state.versions != versions:
+                self.refresh_ratings(conn, versions)
+
+    def update_rating(self, prof_id, avg_rating, version=None):
+        """Apply a rating this process just wrote.  `version` is the
+        professor_ratings counter read in the same transaction; when it is
+        the next one after the index's, the index stays current without a
+        re-read."""
+        # Only Avg_rating changes from the request path; names stay put.
+        state = self._state
+        if state is None:
+            return
+        pos = state.positions.get(prof_id)
+        if pos is not None:
+            state.rows[pos] = {**state.rows[pos], 'Avg_rating': avg_rating}
+        if version is not None:
+            with self._lock:
+                if state.versions.get('professor_ratings') == version - 1:
+                    state.versions = {**state.versions, 'professor_ratings': version}
+
+    # ---- queries ----
+
+    def _substring_matches(self, state, query):
+        if len(query) < 3:
+            return [pos for pos, name in enumerate(state.lower_names) if query in name]
+
+        lists = []
+        for gram in trigrams(query):
+            posting = state.postings.get(gram)
+            if not posting:
+                return []
+            lists.append(posting)
+        lists.sort(key=len)
+        candidates = set(lists[0])
+        for posting in lists[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return []
+        return sorted(pos for pos in candidates if query in state.lower_names[pos])
+
+    def _prefix_candidates(self, state, token):
+        found = []
+        for i in range(bisect_left(state.prefixes, (token,)), len(state.prefixes)):
+            entry_token, pos = state.prefixes[i]
+            if not entry_token.startswith(token) or len(found) >= self.candidate_pool:
+                break
+            found.append(pos)
+        return found
+
+    def _fuzzy_candidates(self, state, processed_query, limit):
+        if len(state.fuzzy_names) <= self.exhaustive_limit:
+            return range(len(state.fuzzy_names))
+
+        overlap = Counter()
+        for gram in trigrams(processed_query):
+            overlap.update(state.postings.get(gram, ()))
+        best = heapq.nlargest(self.candidate_pool, overlap.items(), key=lambda item: (item[1], -item[0]))
+        candidates = [pos for pos, _ in best]
+
+        if len(candidates) < limit:
+            # Nothing shares enough trigrams; fall back to names with a token
+            # starting like one of the query's tokens.
+            seen = set(candidates)
+            for token in processed_query.split():
+                for pos in self._prefix_candidates(state, token[:2]):
+                    if pos not in seen:
+                        seen.add(pos)
+                        candidates.append(pos)
+        return candidates
+
+    def _fuzzy_names(self, state, query, limit):
+        from fuzzywuzzy import fuzz, utils
+
+        processed = utils.full_process(query)
+        if not processed:
+            # process.extract scores every name 0 then, which keeps the first
+            # `limit` in table order
+            return [row['Name'] for row in state.rows[:limit]]
+
+        candidates = self._fuzzy_candidates(state, processed, limit)
+
+        scored = [(fuzz.partial_ratio(processed, state.fuzzy_names[pos]), pos) for pos in candidates]
+        # Ties keep table order, like heapq.nlargest inside process.extract.
+        top = heapq.nlargest(limit, scored, key=lambda item: (item[0], -item[1]))
+        return [state.rows[pos]['Name'] for _, pos in top]
+
+    def search(self, query, limit=15):
+        state = self._state
+        if state is None:
+            return []
+
+        query = query.lower()
+        key = (query, limit)
+        positions = state.results.get(key)
+        if positions is None:
+            positions = self._match(state, query, limit)
+            with self._lock:
+                state.results[key] = positions
+                if len(state.results) > self.cache_size:
+                    state.results.popitem(last=False)
+        else:
+            with self._lock:
+                if key in state.results:
+                    state.results.move_to_end(key)
+        return [state.rows[pos] for pos in positions]
+
+    def _match(self, state, query, limit):
+        exact = self._substring_matches(state, query)
+        if len(exact) >= limit:
+            return exact
+
+        seen = set(exact)
+        extra = set()
+        for name in self._fuzzy_names(state, query, limit):
+            extra.update(pos for pos in state.name_positions.get(name, ()) if pos not in seen)
+        return exact + sorted(extra)
+
+
+class _IndexState:
+    __slots__ = ('rows', 'lower_names', 'fuzzy_names', 'positions',
+                 'name_positions', 'postings', 'prefixes', 'results', 'versions')
+
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def main_module(tmp_path_factory):
+    """main, imported against a fresh, migrated database instead of
+    database.db.  main builds its services on import, so the tests that use
+    it share one instance."""
+    import config
+    config.Config.DATABASE = str(tmp_path_factory.mktemp('app') / 'database.db')
+    import main
+    yield main
+    main.shutdown()
@@ -0,0 +1,145 @@
+"""Two deleters sharing one database, as two gunicorn workers do."""
+import time
+
+import pytest
+
+import db
+import migrations
+from account_deletion import AccountDeleter
+
+
+EMAIL = 'leaving@example.edu'
+RATED = [1, 2, 3, 4, 5]
+REVIEWED = [4, 5, 6]
+
+
+class AfterChunks:
+    """A metrics stand-in that calls `action` once `count` chunks are done."""
+
+    def __init__(self, count, action):
+        self.count = count
+        self.action = action
+
+    def observe_span(self, name, seconds):
+        self.count -= 1
+        if self.count == 0:
+            self.action()
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'database.db')
+    migrations.migrate(path)
+    pool = db.ConnectionPool(path, size=1)
+    with pool.connection() as conn:
+        conn.executemany('INSERT INTO professors (id, Name, Avg_rating, no_ratings) VALUES (?, ?, 0, 0)',
+                         [(i, f'Dr. {i}') for i in range(1, 7)])
+        conn.execute('INSERT INTO community_users (email, username) VALUES (?, ?)', (EMAIL, 'leaver'))
+        conn.executemany('INSERT INTO ratings (professor_id, user_email, rating) VALUES (?, ?, 4.0)',
+                         [(prof_id, EMAIL) for prof_id in RATED])
+        conn.executemany('INSERT INTO reviews (professor_id, user_email, review_text) VALUES (?, ?, ?)',
+                         [(prof_id, EMAIL, 'fine') for prof_id in REVIEWED])
+        conn.execute('INSERT INTO community_posts (username, message) VALUES (?, ?)', ('leaver', 'bye'))
+        # A job whose deleter has not picked it up yet, as submit() leaves it
+        conn.execute("INSERT INTO account_deletions (id, email, username, status, requested_at) "
+                     "VALUES (1, ?, 'leaver', 'running', ?)", (EMAIL, time.time()))
+        conn.commit()
+    pool.close()
+    return path
+
+
+@pytest.fixture
+def deleters(path):
+    pools = [db.ConnectionPool(path, size=1) for _ in range(2)]
+    done = []
+    made = []
+
+    def make(metrics=None):
+        deleter = AccountDeleter(pools[len(made)], chunk_rows=2, stale_after=60, metrics=metrics,
+                                 on_done=lambda email, professors: done.append((email, set(professors))))
+        made.append(deleter)
+        return deleter
+
+    yield make, done, pools[0]
+    for pool in pools:
+        pool.close()
+
+
+def job(pool):
+    with pool.connection() as conn:
+        return conn.execute('SELECT status, owner, deleted_rows FROM account_deletions WHERE id = 1').fetchone()
+
+
+def remaining(pool):
+    with pool.connection() as conn:
+        return (conn.execute('SELECT COUNT(*) FROM ratings').fetchone()[0]
+                + conn.execute('SELECT COUNT(*) FROM reviews').fetchone()[0]
+                + conn.execute('SELECT COUNT(*) FROM account_deletion_professors').fetchone()[0])
+
+
+def test_live_claim_is_respected(deleters):
+    make, done, pool = deleters
+    first, second = make(), make()
+    with pool.connection() as conn:
+        assert first._claim(conn, 1)
+    assert not second.run(1)
+    assert job(pool)[1] == first._owner
+    assert first.run(1)
+    assert done == [(EMAIL, set(RATED + REVIEWED))]
+    assert job(pool)[0] == 'done'
+    assert remaining(pool) == 0
+
+
+def test_released_job_resumes_with_every_professor(deleters):
+    make, done, pool = deleters
+    first = make(AfterChunks(1, lambda: first._stopping.set()))
+    second = make()
+
+    # Stops after its first chunk, which removed the ratings of professors 1 and 2
+    assert not first.run(1)
+    assert job(pool)[1:] == (None, 2)
+    assert second.run(1)
+
+    assert done == [(EMAIL, set(RATED + REVIEWED))]
+    assert second.snapshot()['taken_over'] == 0
+    assert remaining(pool) == 0
+
+
+def test_stale_job_taken_over(deleters):
+    make, done, pool = deleters
+
+    def crash():
+        raise Crash()
+
+    first = make(AfterChunks(2, crash))
+    second = make()
+
+    # Dies after two chunks, still owning the job
+    with pytest.raises(Crash):
+        first.run(1)
+    assert job(pool)[1:] == (first._owner, 4)
+    # Fresh heartbeat: not taken over yet
+    assert not second.run(1)
+
+    with pool.connection() as conn:
+        conn.execute('UPDATE account_deletions SET heartbeat = heartbeat - 120 WHERE id = 1')
+        conn.commit()
+    with pool.connection() as conn:
+        assert second._claim(conn, 1)
+    assert second.snapshot()['taken_over'] == 1
+
+    # The old owner comes back and finds the job gone
+    first.metrics = None
+    assert not first.run(1)
+    with pool.connection() as conn:
+        assert first._chunk(conn, 1, 'SELECT 1', {}) is None
+    assert first.snapshot()['lost'] == 1
+
+    assert second.run(1)
+    assert done == [(EMAIL, set(RATED + REVIEWED))]
+    assert job(pool)[0] == 'done'
+    assert remaining(pool) == 0
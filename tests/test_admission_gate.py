@@ -0,0 +1,85 @@
+import sqlite3
+import time
+
+import pytest
+
+import db
+import migrations
+from rate_limit import AdmissionGate
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'database.db')
+    migrations.migrate(path)
+    return path
+
+
+@pytest.fixture
+def pools(path):
+    # One per worker process
+    pools = [db.ConnectionPool(path, size=2, timeout=0.2) for _ in range(2)]
+    yield pools
+    for pool in pools:
+        pool.close()
+
+
+def test_limit_shared_across_pools(pools):
+    first, second = (AdmissionGate(pool, 'ocr', limit=2) for pool in pools)
+    other = AdmissionGate(pools[1], 'smtp', limit=1)
+
+    leases = [first.acquire(), second.acquire()]
+    assert all(leases)
+    assert first.acquire() is None
+    assert second.acquire() is None
+    # Gates are counted separately
+    assert other.acquire()
+
+    first.release(leases[0])
+    assert second.acquire()
+    assert first.acquire() is None
+    assert (first.snapshot()['rejected'], second.snapshot()['rejected']) == (2, 1)
+
+
+def test_unreleased_lease_lapses(pools):
+    gate = AdmissionGate(pools[0], 'ocr', limit=1, lease_seconds=0.1)
+    assert gate.acquire()
+    assert gate.acquire() is None
+    time.sleep(0.15)
+    assert gate.acquire()
+
+
+def test_late_release_keeps_the_next_lease(pools):
+    first = AdmissionGate(pools[0], 'ocr', limit=1, lease_seconds=0.1)
+    second = AdmissionGate(pools[1], 'ocr', limit=1, lease_seconds=60)
+
+    lapsed = first.acquire()
+    time.sleep(0.15)
+    # Sweeps the lapsed lease; its id must not come back
+    current = second.acquire()
+    assert current and current != lapsed
+
+    first.release(lapsed)
+    assert first.acquire() is None
+    second.release(current)
+    assert first.acquire()
+
+
+def test_fails_open_when_locked(path, pools):
+    gate = AdmissionGate(pools[0], 'ocr', limit=1)
+    held = gate.acquire()
+
+    locker = sqlite3.connect(path, isolation_level=None)
+    locker.execute('BEGIN EXCLUSIVE')
+    try:
+        lease = gate.acquire()
+        assert lease == AdmissionGate.UNTRACKED
+        gate.release(lease)
+        # Lapses instead
+        gate.release(held)
+    finally:
+        locker.execute('ROLLBACK')
+        locker.close()
+
+    assert gate.snapshot()['errors'] == 2
+    assert gate.acquire() is None
@@ -0,0 +1,37 @@
+import migrations
+
+
+def test_healthz(main_module):
+    response = main_module.app.test_client().get('/healthz')
+    assert response.status_code == 200
+    assert response.get_json() == {'status': 'ok'}
+
+
+def test_readyz(main_module):
+    response = main_module.app.test_client().get('/readyz')
+    assert response.status_code == 200
+    assert response.get_json() == {'status': 'ready'}
+
+
+def test_readyz_unmigrated(main_module):
+    latest = migrations.MIGRATIONS[-1][0]
+    with main_module.db.get_pool(main_module.app).connection() as conn:
+        conn.execute(f'PRAGMA user_version = {latest - 1}')
+        try:
+            response = main_module.app.test_client().get('/readyz')
+        finally:
+            conn.execute(f'PRAGMA user_version = {latest}')
+    assert response.status_code == 503
+    body = response.get_json()
+    assert body['status'] == 'unavailable'
+    assert body['problems'] == [f'schema version {latest - 1}, expected {latest}']
+
+
+def test_healthz_while_unready(main_module, monkeypatch):
+    # Liveness does not touch the database, so a locked or missing one
+    # does not get the worker restarted
+    def broken(*args, **kwargs):
+        raise AssertionError('database used')
+
+    monkeypatch.setattr(main_module.db, 'get_pool', broken)
+    assert main_module.app.test_client().get('/healthz').status_code == 200
@@ -0,0 +1,58 @@
+import pytest
+
+from credentials import HasherBusy
+
+
+EMAIL = 'student@example.edu'
+
+
+@pytest.fixture
+def user(main_module):
+    # A row from before password hashing, as many in database.db still are
+    with main_module.db.get_pool(main_module.app).connection() as conn:
+        conn.execute('DELETE FROM users WHERE email = ?', (EMAIL,))
+        conn.execute('INSERT INTO users (email, password, year, semester, academic_year, school, branch) '
+                     "VALUES (?, 'hunter22', '2', '1', '2024-25', 'SoE', 'CSE')", (EMAIL,))
+        conn.commit()
+    return EMAIL
+
+
+def stored_password(main_module):
+    with main_module.db.get_pool(main_module.app).connection() as conn:
+        return conn.execute('SELECT password FROM users WHERE email = ?', (EMAIL,)).fetchone()[0]
+
+
+def log_in(main_module, password):
+    client = main_module.app.test_client()
+    response = client.post('/login', data={'username': EMAIL, 'password': password})
+    with client.session_transaction() as session:
+        return response, session.get('email')
+
+
+def test_plaintext_password_is_upgraded(main_module, user):
+    response, email = log_in(main_module, 'hunter22')
+    assert response.status_code == 302 and response.location.endswith('/index')
+    assert email == EMAIL
+    stored = stored_password(main_module)
+    assert stored != 'hunter22'
+    assert main_module.passwords.verify(stored, 'hunter22')
+
+
+def test_wrong_password(main_module, user):
+    response, email = log_in(main_module, 'hunter23')
+    assert response.location.endswith('/login')
+    assert email is None
+    assert stored_password(main_module) == 'hunter22'
+
+
+@pytest.mark.parametrize('error', [HasherBusy(), RuntimeError('disk I/O error')])
+def test_failed_upgrade_still_logs_in(main_module, user, monkeypatch, error):
+    def broken_hash(password):
+        raise error
+
+    monkeypatch.setattr(main_module.passwords, 'hash', broken_hash)
+    response, email = log_in(main_module, 'hunter22')
+    assert response.location.endswith('/index')
+    assert email == EMAIL
+    # Upgraded at a later login instead
+    assert stored_password(main_module) == 'hunter22'
@@ -0,0 +1,178 @@
+"""MailDispatcher against a local aiosmtpd server."""
+import socket
+import threading
+from email.mime.text import MIMEText
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from mailer import MailDispatcher
+
+
+class Handler:
+    """Accepts mail, rejecting the first `reject` messages (all, if None)
+    and dropping the session after each delivery if `drop` is set."""
+
+    def __init__(self, reject=0, drop=False):
+        self.reject = reject
+        self.drop = drop
+        self.received = []
+        self.attempts = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.attempts += 1
+        if self.reject is None or self.attempts <= self.reject:
+            return '554 Rejected'
+        self.received.append(envelope.rcpt_tos[0])
+        if self.drop:
+            # After the reply has gone out, like a server-side idle timeout
+            server.loop.call_later(0.05, server.transport.close)
+        return '250 OK'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp():
+    servers = []
+
+    def start(handler):
+        controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+        controller.start()
+        servers.append(controller)
+        return controller.port
+
+    yield start
+    for controller in servers:
+        controller.stop()
+
+
+def message(i):
+    msg = MIMEText(f'Your OTP is: {100000 + i}.')
+    msg['From'] = 'noreply@example.edu'
+    msg['To'] = f'student{i}@example.edu'
+    msg['Subject'] = 'Your OTP for Registration'
+    return msg
+
+
+class Done:
+    """on_done callbacks that record which messages finished."""
+
+    def __init__(self):
+        self.calls = []
+        self._event = threading.Event()
+        self._expected = 0
+
+    def callback(self, i):
+        def on_done():
+            self.calls.append(i)
+            if len(self.calls) >= self._expected:
+                self._event.set()
+        return on_done
+
+    def wait(self, count, timeout=10):
+        self._expected = count
+        if len(self.calls) >= count:
+            return True
+        return self._event.wait(timeout)
+
+
+def dispatcher(port, **kwargs):
+    kwargs.setdefault('workers', 1)
+    return MailDispatcher('127.0.0.1', port, use_tls=False, backoff=0.0, **kwargs)
+
+
+def test_batched_delivery(smtp):
+    handler = Handler()
+    mailer = dispatcher(smtp(handler), batch_size=5)
+    done = Done()
+    for i in range(12):
+        assert mailer.submit(message(i), on_done=done.callback(i))
+    mailer.stop()
+
+    assert sorted(done.calls) == list(range(12))
+    assert len(handler.received) == 12
+    stats = mailer.snapshot()
+    assert stats['sent'] == 12
+    assert stats['connects'] == 1
+    assert 3 <= stats['batches'] < 12
+    assert stats['pending'] == 0
+
+
+def test_reconnects_after_server_drops_session(smtp):
+    handler = Handler(drop=True)
+    mailer = dispatcher(smtp(handler))
+    done = Done()
+    mailer.submit(message(0), on_done=done.callback(0))
+    assert done.wait(1)
+    # Let the server close the session the worker is holding
+    threading.Event().wait(0.3)
+    mailer.submit(message(1), on_done=done.callback(1))
+    assert done.wait(2)
+    mailer.stop()
+
+    assert handler.received == ['student0@example.edu', 'student1@example.edu']
+    stats = mailer.snapshot()
+    assert stats['sent'] == 2
+    assert stats['failed'] == 0
+    assert stats['connects'] == 2
+
+
+def test_retries_then_delivers(smtp):
+    handler = Handler(reject=2)
+    mailer = dispatcher(smtp(handler), max_retries=3)
+    done = Done()
+    mailer.submit(message(0), on_done=done.callback(0))
+    mailer.stop()
+
+    assert done.calls == [0]
+    assert handler.received == ['student0@example.edu']
+    stats = mailer.snapshot()
+    assert (stats['sent'], stats['retries'], stats['failed']) == (1, 2, 0)
+
+
+def test_gives_up_after_max_retries(smtp):
+    handler = Handler(reject=None)
+    mailer = dispatcher(smtp(handler), max_retries=2)
+    done = Done()
+    mailer.submit(message(0), on_done=done.callback(0))
+    mailer.submit(message(1), on_done=done.callback(1))
+    mailer.stop()
+
+    # on_done still runs, so callers can release what they hold for the mail
+    assert sorted(done.calls) == [0, 1]
+    assert handler.attempts == 6
+    assert handler.received == []
+    stats = mailer.snapshot()
+    assert (stats['sent'], stats['retries'], stats['failed']) == (0, 4, 2)
+
+
+def test_unreachable_server_gives_up():
+    mailer = dispatcher(free_port(), max_retries=1)
+    done = Done()
+    mailer.submit(message(0), on_done=done.callback(0))
+    mailer.stop()
+
+    assert done.calls == [0]
+    stats = mailer.snapshot()
+    assert (stats['connects'], stats['failed']) == (0, 1)
+
+
+def test_failing_callback_does_not_stop_worker(smtp):
+    handler = Handler()
+    mailer = dispatcher(smtp(handler))
+    done = Done()
+
+    def broken():
+        raise RuntimeError('callback bug')
+
+    mailer.submit(message(0), on_done=broken)
+    mailer.submit(message(1), on_done=done.callback(1))
+    mailer.stop()
+
+    assert done.calls == [1]
+    assert len(handler.received) == 2
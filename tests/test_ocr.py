@@ -0,0 +1,47 @@
+"""The staged OCR pipeline against the checked-in screenshot corpus.
+
+tests/fixtures/attendance holds synthetic screenshots with known
+percentages (see benchmarks/attendance_fixtures.py).  The accuracy tests
+need a Tesseract binary (TESSERACT_CMD) and are skipped without one.
+"""
+import os
+
+import pytest
+
+import ocr
+from benchmarks import attendance_fixtures
+from benchmarks.bench_ocr import legacy_extract, tesseract_available
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'attendance')
+CORPUS = list(attendance_fixtures.load(FIXTURES))
+
+
+needs_tesseract = pytest.mark.skipif(not tesseract_available(), reason='Tesseract is not installed')
+
+
+def correct(result, expected):
+    return isinstance(result, float) and abs(result - expected) < 0.01
+
+
+@pytest.mark.parametrize('name, image_bytes, expected', CORPUS, ids=[name for name, _, _ in CORPUS])
+def test_text_regions_found(name, image_bytes, expected):
+    # Otherwise every upload falls through to the full-image OCR
+    thresh = ocr.binarize(ocr.downscale(ocr.decode_grayscale(image_bytes)))
+    assert ocr.text_regions(thresh)
+
+
+@needs_tesseract
+@pytest.mark.parametrize('name, image_bytes, expected', CORPUS, ids=[name for name, _, _ in CORPUS])
+def test_staged_reads_percentage(name, image_bytes, expected):
+    assert ocr.extract_attendance_percentage(image_bytes) == pytest.approx(expected, abs=0.01)
+
+
+@needs_tesseract
+def test_staged_at_least_as_accurate_as_full_image():
+    # Every screenshot the old full-resolution, full-image OCR read
+    # correctly, the staged pipeline must read too.
+    regressions = [name for name, image_bytes, expected in CORPUS
+                   if correct(legacy_extract(image_bytes), expected)
+                   and not correct(ocr.extract_attendance_percentage(image_bytes), expected)]
+    assert regressions == []
@@ -0,0 +1,77 @@
+"""Every statement a hot route runs must find its rows through an index.
+
+The SQL comes from the constants the routes themselves execute, so a change
+to a query is checked as written; the arguments are only samples.
+"""
+import sqlite3
+
+import pytest
+
+import account_deletion
+import community_feed
+import migrations
+import professor_reviews
+import queries
+import rating_stats
+from rate_limit import AdmissionGate, SQLiteBucketBackend
+
+
+CURSOR = ('2025-01-01 00:00:00', 1)
+RATE_LIMIT = {'key': 'ip:x', 'cost': 1, 'capacity': 30, 'rate': 0.5, 'now': 0.0}
+GATE = {'gate': 'ocr', 'now': 0.0, 'lease_seconds': 300, 'limit': 2}
+DELETION = {'email': 'x', 'username': 'x', 'limit': account_deletion.CHUNK_ROWS}
+
+HOT_QUERIES = [
+    ('professor_by_name', queries.PROFESSOR_ID_BY_NAME, ('x',)),
+    ('professor_page', queries.PROFESSOR_BY_ID, (1,)),
+    ('professor_page', professor_reviews.FIRST_PAGE, (1, 21)),
+    ('professor_page', professor_reviews.PAGE_BEFORE, (1, *CURSOR, 21)),
+    ('submit_review', queries.PROFESSOR_NAME, (1,)),
+    ('submit_review', queries.PROFESSOR_REVIEW_COUNTERS, (1,)),
+    ('submit_rating', queries.PROFESSOR_EXISTS, (1,)),
+    ('submit_rating', rating_stats.UPSERT, (1, 'weighted', 4.0, 16.0, 0, 0, 0, 1, 0)),
+    ('submit_rating', rating_stats.REFRESH_PROFESSOR, (1,)),
+    ('login', queries.USER_BY_EMAIL, ('x',)),
+    ('profile', queries.USER_RATINGS, ('x',)),
+    ('profile', queries.USER_REVIEWS, ('x',)),
+    ('community', queries.COMMUNITY_USERNAME, ('x',)),
+    ('community', community_feed.FIRST_PAGE, (21,)),
+    ('community', community_feed.PAGE_BEFORE, (*CURSOR, 21)),
+    ('community', community_feed.REPLY_COUNTS.format(placeholders='?, ?'), (1, 2)),
+    ('community', community_feed.FIRST_REPLIES, (1, community_feed.REPLIES_PER_POST)),
+    ('community', community_feed.THREAD, (1,)),
+    ('join_community', queries.COMMUNITY_USER_BY_EMAIL, ('x',)),
+    ('join_community', queries.COMMUNITY_USER_BY_USERNAME, ('x',)),
+    ('register', account_deletion.IN_PROGRESS, ('x',)),
+    ('rate_limit', SQLiteBucketBackend.TAKE, RATE_LIMIT),
+    ('rate_limit', SQLiteBucketBackend.BUCKET, ('ip:x',)),
+    ('admission_gate', AdmissionGate.ACQUIRE, GATE),
+] + [('delete_account', sql, DELETION) for _, sql in account_deletion.STEPS]
+
+
+def plan_problems(conn, sql, params):
+    """Full table scans and temp-table sorts in the plan for `sql`.  The
+    one-row source of an INSERT ... SELECT without FROM is not a scan."""
+    problems = []
+    for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params):
+        detail = row[3]
+        if detail.startswith('SCAN') and 'USING' not in detail and detail != 'SCAN CONSTANT ROW':
+            problems.append(detail)
+        elif 'USE TEMP B-TREE' in detail:
+            problems.append(detail)
+    return problems
+
+
+@pytest.fixture(scope='module')
+def conn(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('plans') / 'database.db')
+    migrations.migrate(path)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize('route, sql, params', HOT_QUERIES,
+                         ids=[f'{route}-{i}' for i, (route, _, _) in enumerate(HOT_QUERIES)])
+def test_hot_query_uses_index(conn, route, sql, params):
+    assert plan_problems(conn, sql, params) == []
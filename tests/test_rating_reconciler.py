@@ -0,0 +1,116 @@
+import pytest
+
+import db
+import migrations
+import rating_stats
+from rating_reconciler import RatingReconciler
+
+
+SCORES = [
+    {'explain_concepts': 5, 'clear_lectures': 4, 'encourages_participation': 4, 'responsiveness': 5,
+     'helpful_materials': 4, 'manageable_workload': 3, 'fair_grading': 5, 'overall_rating': 5},
+    {'explain_concepts': 2, 'clear_lectures': 3, 'encourages_participation': 1, 'responsiveness': 2,
+     'helpful_materials': 3, 'manageable_workload': 2, 'fair_grading': 2, 'overall_rating': 2},
+    {'explain_concepts': 4, 'clear_lectures': 4, 'encourages_participation': 3, 'responsiveness': 4,
+     'helpful_materials': 4, 'manageable_workload': 4, 'fair_grading': 3, 'overall_rating': 4},
+]
+
+
+@pytest.fixture
+def pool(tmp_path):
+    path = str(tmp_path / 'database.db')
+    migrations.migrate(path)
+    pool = db.ConnectionPool(path, size=2)
+    with pool.connection() as conn:
+        conn.executemany("INSERT INTO professors (id, Name, Avg_rating, no_ratings) VALUES (?, ?, 0, 0)",
+                         [(1, 'Dr. A'), (2, 'Dr. B')])
+        for prof_id in (1, 2):
+            for i, scores in enumerate(SCORES):
+                # As submit_rating() saves them
+                weighted = round(rating_stats.weighted_rating(scores), 2)
+                conn.execute(
+                    f"INSERT INTO ratings (professor_id, user_email, overall_rating, rating, "
+                    f"{', '.join(rating_stats.TEACHING_ITEMS + rating_stats.CONTENT_ITEMS)}) "
+                    f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (prof_id, f'user{i}@example.edu', scores['overall_rating'], weighted,
+                     *(scores[item] for item in rating_stats.TEACHING_ITEMS + rating_stats.CONTENT_ITEMS)))
+                rating_stats.record(conn, prof_id, scores, weighted)
+        conn.commit()
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def reconciler(pool):
+    return RatingReconciler(pool, interval=0)
+
+
+def execute(pool, sql, params=()):
+    with pool.connection() as conn:
+        conn.execute(sql, params)
+        conn.commit()
+
+
+def mark_all(pool):
+    with pool.connection() as conn:
+        rating_stats.mark_all(conn)
+
+
+def test_nothing_marked(reconciler):
+    assert reconciler.run_once() == []
+
+
+def test_deleted_rating_is_an_update(pool, reconciler, capsys):
+    execute(pool, "DELETE FROM ratings WHERE user_email = 'user0@example.edu'")
+    found = reconciler.run_once()
+
+    assert sorted(d['professor_id'] for d in found) == [1, 2]
+    assert not any(d['corrected'] for d in found)
+    assert all(d['no_ratings'] == [3, 2] for d in found)
+    stats = reconciler.snapshot()
+    assert (stats['updates'], stats['discrepancies']) == (2, 0)
+    assert list(reconciler.recent) == []
+    out = capsys.readouterr().out
+    assert 'corrected' not in out
+    assert 'updated for deleted or edited ratings: 2 professors' in out
+
+
+def test_edited_rating_is_an_update(pool, reconciler):
+    execute(pool, "UPDATE ratings SET rating = 1.0, overall_rating = 1 WHERE professor_id = 1 AND user_email = ?",
+            ('user2@example.edu',))
+    execute(pool, "UPDATE ratings SET professor_id = 2 WHERE professor_id = 1 AND user_email = ?",
+            ('user1@example.edu',))
+    found = reconciler.run_once()
+
+    assert {d['professor_id']: d['no_ratings'] for d in found} == {1: [3, 2], 2: [3, 4]}
+    assert not any(d['corrected'] for d in found)
+
+
+def test_wrong_aggregate_is_a_correction(pool, reconciler, capsys):
+    execute(pool, "UPDATE professor_rating_stats SET total = total + 3 WHERE professor_id = 1 AND item = 'fair_grading'")
+    mark_all(pool)
+    found = reconciler.run_once()
+
+    assert [(d['professor_id'], d['corrected'], d['items']) for d in found] == [(1, True, ['fair_grading'])]
+    assert reconciler.snapshot()['discrepancies'] == 1
+    assert [d['professor_id'] for d in reconciler.recent] == [1]
+    assert 'Rating aggregates corrected: professor 1' in capsys.readouterr().out
+
+
+def test_wrong_aggregate_behind_a_deletion_is_a_correction(pool, reconciler):
+    execute(pool, "UPDATE professors SET Avg_rating = 4.9 WHERE id = 2")
+    execute(pool, "DELETE FROM ratings WHERE user_email = 'user1@example.edu'")
+    found = {d['professor_id']: d['corrected'] for d in reconciler.run_once()}
+
+    assert found == {1: False, 2: True}
+    stats = reconciler.snapshot()
+    assert (stats['updates'], stats['discrepancies']) == (1, 1)
+
+
+def test_changes_cleared_with_marks(pool, reconciler):
+    execute(pool, "DELETE FROM ratings WHERE user_email = 'user0@example.edu'")
+    reconciler.run_once()
+    with pool.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM rating_changes').fetchone()[0] == 0
+    mark_all(pool)
+    assert reconciler.run_once() == []
@@ -0,0 +1,53 @@
+import pytest
+from flask import Flask, request
+
+from pagination import canonical_cursor, decode_cursor, encode_cursor
+from response_cache import MemoryCacheBackend, ResponseCache
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.cache = ResponseCache(MemoryCacheBackend())
+    app.renders = 0
+
+    @app.route('/reviews')
+    @app.cache.cached(tags=('reviews',), params={'before': canonical_cursor})
+    def reviews():
+        app.renders += 1
+        return f'page before {decode_cursor(request.args.get("before"))}'
+
+    return app
+
+
+def test_junk_cursors_share_the_first_page(app):
+    client = app.test_client()
+    first = client.get('/reviews').data
+    assert client.get('/reviews?before=not-a-cursor').data == first
+    assert client.get('/reviews?before=%%%%').data == first
+    assert client.get('/reviews?before=').data == first
+    assert len(app.cache.backend) == 1
+    assert app.renders == 1
+
+
+def test_cursor_spellings_share_an_entry(app):
+    client = app.test_client()
+    cursor = encode_cursor('2024-05-01 10:00:00', 42)
+    padded = cursor + '=' * (-len(cursor) % 4)
+    assert padded != cursor
+    page = client.get(f'/reviews?before={cursor}').data
+    assert client.get(f'/reviews?before={padded}').data == page
+    assert client.get(f'/reviews?before={cursor}&utm_source=mail').data == page
+    assert b'42' in page
+    assert len(app.cache.backend) == 1
+    assert app.renders == 1
+
+
+def test_invalidate_drops_every_page(app):
+    client = app.test_client()
+    client.get('/reviews')
+    client.get(f'/reviews?before={encode_cursor("2024-05-01 10:00:00", 42)}')
+    assert len(app.cache.backend) == 2
+    app.cache.invalidate('reviews')
+    assert len(app.cache.backend) == 0
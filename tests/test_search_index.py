@@ -0,0 +1,38 @@
+import pytest
+from fuzzywuzzy import fuzz, process
+
+from search_index import ProfessorSearchIndex
+
+
+NAMES = ['Dr. Swapna Rao', 'Prof. Arjun Mehta', 'Dr. Kavita Iyer', 'Prof. Rahul Verma', 'Dr. Sneha Kulkarni',
+         'Dr. Anil Kumar', 'Prof. Meera Nair', 'Dr. Vikram Singh', 'Prof. Lakshmi Menon', 'Dr. Rohan Das',
+         'Prof. Priya Sharma', 'Dr. Suresh Babu', 'Prof. Anjali Gupta', 'Dr. Kiran Reddy', 'Prof. Neha Joshi',
+         'Dr. Manoj Pillai', 'Prof. Divya Krishnan', 'Dr. Arvind Swamy', 'Prof. Sanjay Patel', 'Dr. Swati Desai']
+ROWS = [{'id': i + 1, 'Name': name, 'Designation': 'Professor', 'Photo': None, 'Avg_rating': 0.0}
+        for i, name in enumerate(NAMES)]
+
+
+def old_search(query, limit=15):
+    # index() before the in-memory index
+    query = query.lower()
+    exact = [row for row in ROWS if query in row['Name'].lower()]
+    if len(exact) >= limit:
+        return exact
+    matched = [name for name, _ in process.extract(query, NAMES, limit=limit, scorer=fuzz.partial_ratio)]
+    return exact + [row for row in ROWS if row['Name'] in matched and row not in exact]
+
+
+@pytest.fixture(scope='module')
+def index():
+    index = ProfessorSearchIndex()
+    index.build(ROWS)
+    return index
+
+
+@pytest.mark.parametrize('query', ['  ', '!', '?!.', 'swapna', 'swpna', 'dr', 'prof. meera', 'zz'])
+def test_matches_old_search(index, query):
+    assert [row['id'] for row in index.search(query)] == [row['id'] for row in old_search(query)]
+
+
+def test_blank_query_lists_professors(index):
+    assert len(index.search('  ')) == 15
@@ -0,0 +1,190 @@
+"""Ranked full-text search over reviews and community posts and replies.
+
+Each searched column has an FTS5 index (migration 11) that the triggers on
+its table keep in step with every insert, update and delete.  Results are
+ordered by BM25 (`rank`), best match first, and come with a snippet of the
+text around the matched terms, highlighted with <mark>.
+
+BM25 has to score every match before the best can be picked, which is
+seconds for a word in most of a million reviews.  So only the newest
+RANK_WINDOW matches are ranked: a query with fewer matches gets the exact
+BM25 order, a very common one the best of its recent matches (see
+benchmarks/bench_fulltext.py).  Pages are numbered within that window
+rather than keyed on a cursor, since a BM25 score moves as documents are
+added.
+
+Rebuild the indexes from their tables, e.g. after rows were written with
+the triggers missing, then merge their segments:
+
+    python text_search.py --rebuild
+    python text_search.py --optimize
+    python text_search.py --check      # FTS5 integrity-check against the tables
+"""
+import argparse
+import re
+import sqlite3
+
+from markupsafe import Markup, escape
+
+import migrations
+
+
+RESULTS_PER_PAGE = 20
+RANK_WINDOW = 1000
+MAX_PAGE = RANK_WINDOW // RESULTS_PER_PAGE
+MAX_TERMS = 8
+SNIPPET_TOKENS = 16
+
+# Highlight markers that cannot occur in stored text, swapped for <mark>
+# after the snippet has been HTML-escaped.
+_OPEN, _CLOSE = '\x02', '\x03'
+
+# What each scope returns besides the snippet; never a reviewer's email.
+SCOPES = {
+    'reviews': ('reviews_fts', '''
+        SELECT r.id, r.professor_id, p.Name AS professor_name, r.timestamp
+        FROM reviews r
+        LEFT JOIN professors p ON p.id = r.professor_id
+        WHERE r.id IN ({ids})
+    '''),
+    'posts': ('community_posts_fts', '''
+        SELECT c.id, c.username, c.timestamp
+        FROM community_posts c
+        WHERE c.id IN ({ids})
+    '''),
+    'replies': ('community_replies_fts', '''
+        SELECT c.id, c.post_id, c.parent_reply_id, c.username, c.timestamp
+        FROM community_replies c
+        WHERE c.id IN ({ids})
+    '''),
+}
+
+_TERMS = re.compile(r'"([^"]*)"|(\w+)')
+
+
+def match_query(text):
+    """An FTS5 MATCH expression for what a user typed, or None if it has no words.
+
+    Words are ANDed; "quoted words" stay a phrase and a trailing * makes the
+    last word a prefix.  Everything else, including FTS5 operators and
+    column filters, is taken as plain text so no input is a syntax error.
+    """
+    terms = []
+    for match in _TERMS.finditer(text or ''):
+        words = re.findall(r'\w+', match.group(1) if match.group(1) is not None else match.group(2))
+        if words:
+            terms.append('"' + ' '.join(words) + '"')
+        if len(terms) == MAX_TERMS:
+            break
+    if not terms:
+        return None
+    if text.rstrip().endswith('*'):
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def highlight(snippet):
+    """The snippet as safe HTML with the matched terms in <mark>."""
+    return Markup(str(escape(snippet or '')).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>'))
+
+
+def search(conn, scope, text, page=1, limit=RESULTS_PER_PAGE):
+    """One page of matches in `scope`, best first, and the next page number.
+
+    Returns ([], None) when `text` has nothing to search for.
+    """
+    query = match_query(text)
+    if query is None:
+        return [], None
+    fts, sql = SCOPES[scope]
+    page = min(max(page, 1), MAX_PAGE)
+    # FTS5 walks the matches newest first and stops after the window, scoring
+    # each; the page is the best of those.
+    window = f'SELECT rowid, bm25({fts}) AS score FROM {fts} WHERE {fts} MATCH ? ORDER BY rowid DESC LIMIT {RANK_WINDOW}'
+    ranked = conn.execute(f'SELECT rowid, score FROM ({window}) ORDER BY score LIMIT ? OFFSET ?',
+                          (query, limit + 1, (page - 1) * limit)).fetchall()
+    next_page = page + 1 if len(ranked) > limit and page < MAX_PAGE else None
+    ranked = ranked[:limit]
+    if not ranked:
+        return [], next_page
+
+    # Snippets only for the page's rows, in one walk over the span of the
+    # window they came from.  The unary + keeps the IN list from FTS5, which
+    # would otherwise look each rowid up afresh: for a prefix that means
+    # merging every matching term's list twenty times.
+    rowids = [rowid for rowid, _ in ranked]
+    placeholders = ', '.join('?' * len(rowids))
+    snippets = dict(conn.execute(
+        f"SELECT rowid, snippet({fts}, 0, '{_OPEN}', '{_CLOSE}', '…', {SNIPPET_TOKENS}) FROM {fts} "
+        f'WHERE {fts} MATCH ? AND rowid BETWEEN ? AND ? AND +rowid IN ({placeholders})',
+        (query, min(rowids), max(rowids), *rowids)).fetchall())
+    rows = {row['id']: row for row in conn.execute(sql.format(ids=placeholders), rowids)}
+    # A row deleted since it was ranked is left out
+    results = [{**dict(rows[rowid]), 'snippet': highlight(snippets.get(rowid)), 'score': score}
+               for rowid, score in ranked if rowid in rows]
+    return results, next_page
+
+
+def rebuild(conn):
+    """Re-read every indexed table into its index.  Returns {index: rows}."""
+    counts = {}
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for fts, table, _ in migrations.FULL_TEXT_INDEXES:
+            conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+            counts[fts] = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return counts
+
+
+def optimize(conn):
+    """Merge each index into a single b-tree, which makes queries cheaper."""
+    for fts, _, _ in migrations.FULL_TEXT_INDEXES:
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('optimize')")
+
+
+def check(conn):
+    """Names of the indexes that do not match their tables."""
+    broken = []
+    for fts, _, _ in migrations.FULL_TEXT_INDEXES:
+        try:
+            conn.execute(f"INSERT INTO {fts} ({fts}, rank) VALUES ('integrity-check', 1)")
+        except sqlite3.DatabaseError:
+            broken.append(fts)
+    return broken
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='database.db')
+    parser.add_argument('--rebuild', action='store_true', help='re-index every review, post and reply')
+    parser.add_argument('--optimize', action='store_true', help='merge index segments')
+    parser.add_argument('--check', action='store_true', help='compare the indexes with their tables')
+    args = parser.parse_args()
+
+    if not (args.rebuild or args.optimize or args.check):
+        parser.print_help()
+        return
+    migrations.migrate(args.db)
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        if args.rebuild:
+            for fts, rows in rebuild(conn).items():
+                print(f'Rebuilt {fts} from {rows} rows')
+        if args.optimize:
+            optimize(conn)
+            print('Optimized')
+        if args.check:
+            broken = check(conn)
+            print('Out of step: ' + ', '.join(broken) if broken else 'All indexes match their tables')
+            if broken:
+                raise SystemExit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
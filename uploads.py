@@ -0,0 +1,111 @@
+import struct
+import threading
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+SNIFF_BYTES = 64 * 1024  # enough to reach a JPEG SOF marker past typical EXIF
+
+
+class UploadRejected(Exception):
+    pass
+
+
+def sniff_image(header):
+    """(format, width, height) from the first bytes of a PNG or JPEG, else None."""
+    if header.startswith(b'\x89PNG\r\n\x1a\n') and len(header) >= 24 and header[12:16] == b'IHDR':
+        width, height = struct.unpack('>II', header[16:24])
+        return 'png', width, height
+
+    if header.startswith(b'\xff\xd8'):
+        i = 2
+        while i + 9 < len(header):
+            if header[i] != 0xFF:
+                i += 1
+                continue
+            marker = header[i + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                i += 2
+                continue
+            length = struct.unpack('>H', header[i + 2:i + 4])[0]
+            # SOF0..SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack('>HH', header[i + 5:i + 9])
+                return 'jpeg', width, height
+            i += 2 + length
+    return None
+
+
+def process_peak_rss_kb():
+    """The most memory this process has ever held (ru_maxrss): a lifetime
+    high-water mark, not what any one upload used.  For that see
+    benchmarks/bench_uploads.py."""
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on Linux, bytes on macOS; Linux is what we deploy on.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class UploadIngestor:
+    """Reads an uploaded screenshot without trusting its size or contents.
+
+    The header is read and sniffed first, so files that are not PNG/JPEG or
+    whose dimensions would decode into a huge bitmap are rejected before the
+    rest of the body is read.  The body itself is capped at `max_bytes`
+    (Flask's MAX_CONTENT_LENGTH already bounds the whole request) and read
+    in chunks into one buffer, so an upload holds about its own size.
+    """
+
+    def __init__(self, max_bytes=5 * 1024 * 1024, max_pixels=40_000_000, max_side=12000):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.max_side = max_side
+        self._lock = threading.Lock()
+        self.stats = {
+            'accepted': 0,
+            'rejected': {},
+            'bytes_total': 0,
+            'bytes_max': 0,
+            'pixels_max': 0,
+        }
+
+    def _reject(self, reason, message):
+        with self._lock:
+            self.stats['rejected'][reason] = self.stats['rejected'].get(reason, 0) + 1
+        raise UploadRejected(message)
+
+    def read(self, file):
+        header = file.stream.read(SNIFF_BYTES)
+        sniffed = sniff_image(header)
+        if sniffed is None and header.startswith(b'\xff\xd8') and len(header) == SNIFF_BYTES:
+            # Large EXIF/ICC blocks can push the JPEG frame header further in.
+            header += file.stream.read(3 * SNIFF_BYTES)
+            sniffed = sniff_image(header)
+        if sniffed is None:
+            self._reject('format', 'Please upload a PNG or JPEG screenshot.')
+        _, width, height = sniffed
+        if width == 0 or height == 0 or max(width, height) > self.max_side or width * height > self.max_pixels:
+            self._reject('dimensions', 'That image is too large. Please upload a normal screenshot.')
+
+        image_bytes = bytearray(header)
+        while chunk := file.stream.read(SNIFF_BYTES):
+            image_bytes += chunk
+            if len(image_bytes) > self.max_bytes:
+                self._reject('size', f'Screenshots must be under {self.max_bytes // (1024 * 1024)}MB.')
+
+        with self._lock:
+            self.stats['accepted'] += 1
+            self.stats['bytes_total'] += len(image_bytes)
+            self.stats['bytes_max'] = max(self.stats['bytes_max'], len(image_bytes))
+            self.stats['pixels_max'] = max(self.stats['pixels_max'], width * height)
+        return image_bytes
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['rejected'] = dict(self.stats['rejected'])
+        stats['process_peak_rss_kb'] = process_peak_rss_kb()
+        return stats
@@ -0,0 +1,43 @@
+"""Production entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app      # Linux, see gunicorn.conf.py
+    python wsgi.py                             # waitress, e.g. on Windows
+
+`python main.py` still runs Flask's development server.
+"""
+import os
+
+from werkzeug.utils import import_string
+
+
+os.environ.setdefault('APP_CONFIG', 'config.ProductionConfig')
+
+
+def load_app():
+    """Check the production settings, then import main and return its app;
+    RuntimeError if the settings are not fit to serve with.
+
+    This is not a factory: main.py builds the app and its services (database
+    pool, mailer, OCR queue) when it is imported, so there is one app per
+    process and this only decides whether to import it.
+    """
+    problems = import_string(os.environ['APP_CONFIG']).check()
+    if problems:
+        raise RuntimeError('Refusing to start: ' + '; '.join(problems))
+    import main
+    return main.app
+
+
+app = load_app()
+
+
+if __name__ == '__main__':
+    from waitress import serve
+
+    import main
+    try:
+        # One process; threads wait on SQLite, so match the connection pool
+        serve(app, listen=os.getenv('BIND', '0.0.0.0:10000'),
+              threads=int(os.getenv('THREADS', app.config['DB_POOL_SIZE'])))
+    finally:
+        main.shutdown()